@@ -1,14 +1,15 @@
 import os
 import json
 import uuid
-import asyncio
 from datetime import datetime
 from flask import Flask, render_template, request, jsonify, session
-from flask_socketio import SocketIO, emit
+from flask_socketio import SocketIO, emit, join_room, leave_room
 from flask_cors import CORS
 from celery import Celery
 import redis
 from dotenv import load_dotenv
+from latency_histogram import LATENCY_REDIS_KEY, LatencyHistogram, histograms_from_redis_hash, latency_report
+from metrics_store import metrics_store
 
 # Load environment variables
 load_dotenv()
@@ -19,7 +20,8 @@ app.config['CELERY_BROKER_URL'] = os.getenv('REDIS_URL', 'redis://localhost:6379
 app.config['CELERY_RESULT_BACKEND'] = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
 
 # Initialize extensions
-socketio = SocketIO(app, cors_allowed_origins="*")
+# Celery workers publish task events through the Redis message queue
+socketio = SocketIO(app, cors_allowed_origins="*", message_queue=os.getenv('REDIS_URL', 'redis://localhost:6379/0'))
 CORS(app)
 
 # Initialize Celery
@@ -29,8 +31,19 @@ celery.conf.update(app.config)
 # Initialize Redis for session storage
 redis_client = redis.from_url(os.getenv('REDIS_URL', 'redis://localhost:6379/0'))
 
+# Seconds a session's configuration is kept after its last use
+SESSION_TTL = 3600
+
+def load_session_config(session_id):
+    """Read a session's configuration and extend its lifetime in one round trip"""
+    pipe = redis_client.pipeline()
+    pipe.get(f"config:{session_id}")
+    pipe.expire(f"config:{session_id}", SESSION_TTL)
+    config_data, _ = pipe.execute()
+    return json.loads(config_data) if config_data else None
+
 # Import tasks after Celery initialization
-from tasks import process_ocr_task, generate_test_files
+from tasks import process_ocr_task, generate_test_files, request_cancel, get_partial_results
 
 @app.route('/')
 def index():
@@ -46,16 +59,16 @@ def config():
         session['session_id'] = session_id
         
         # Store configuration in Redis
-        redis_client.setex(f"config:{session_id}", 3600, json.dumps(config_data))
+        redis_client.setex(f"config:{session_id}", SESSION_TTL, json.dumps(config_data))
         
         return jsonify({"status": "success", "session_id": session_id})
     
     # GET request - return current config
     session_id = session.get('session_id')
     if session_id:
-        config_data = redis_client.get(f"config:{session_id}")
+        config_data = load_session_config(session_id)
         if config_data:
-            return jsonify(json.loads(config_data))
+            return jsonify(config_data)
     
     return jsonify({"azure": {}, "gcp": {}})
 
@@ -93,12 +106,10 @@ def upload_file():
         if not session_id:
             return jsonify({"status": "error", "message": "No configuration found"}), 400
         
-        config_data = redis_client.get(f"config:{session_id}")
-        if not config_data:
+        config = load_session_config(session_id)
+        if not config:
             return jsonify({"status": "error", "message": "Configuration not found"}), 400
         
-        config = json.loads(config_data)
-        
         # Save uploaded file
         filename = f"uploads/{uuid.uuid4()}_{file.filename}"
         os.makedirs('uploads', exist_ok=True)
@@ -128,12 +139,10 @@ def batch_test():
         if not session_id:
             return jsonify({"status": "error", "message": "No configuration found"}), 400
         
-        config_data = redis_client.get(f"config:{session_id}")
-        if not config_data:
+        config = load_session_config(session_id)
+        if not config:
             return jsonify({"status": "error", "message": "Configuration not found"}), 400
         
-        config = json.loads(config_data)
-        
         # Start batch processing
         task = process_ocr_task.delay(None, config, test_config)
         
@@ -155,8 +164,13 @@ def task_status(task_id):
         if task.ready():
             if task.successful():
                 result = task.result
+                if result.get('status') == 'error':
+                    return jsonify({
+                        "status": "failed",
+                        "error": result.get('error', 'Unknown error')
+                    })
                 return jsonify({
-                    "status": "completed",
+                    "status": "cancelled" if result.get('status') == 'cancelled' else "completed",
                     "result": result
                 })
             else:
@@ -165,14 +179,43 @@ def task_status(task_id):
                     "error": str(task.info)
                 })
         else:
+            # Progress reporter payload: pages completed and in flight, throughput, ETA
+            progress = task.info if isinstance(task.info, dict) else {}
             return jsonify({
-                "status": "running",
-                "progress": task.info.get('progress', 0) if task.info else 0
+                "progress": 0,
+                **progress,
+                "status": "running"
             })
             
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
+@app.route('/api/task-results/<task_id>')
+def task_results(task_id):
+    """Get the page results a running task has finished so far, from index 'start' on"""
+    try:
+        start = request.args.get('start', 0, type=int)
+        pages = get_partial_results(task_id, start)
+        
+        return jsonify({
+            "status": "success",
+            "pages": pages,
+            "next_start": start + len(pages)
+        })
+        
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@app.route('/api/task-cancel/<task_id>', methods=['POST'])
+def cancel_task(task_id):
+    """Cancel a running task, pages already processed are kept in its statistics"""
+    try:
+        request_cancel(task_id)
+        return jsonify({"status": "success", "message": "Cancellation requested"})
+        
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
 @app.route('/api/statistics')
 def get_statistics():
     """Get comprehensive statistics from Redis"""
@@ -181,19 +224,88 @@ def get_statistics():
         if not session_id:
             return jsonify({"status": "error", "message": "No session found"}), 400
         
-        # Get all statistics for this session
-        stats_keys = redis_client.keys(f"stats:{session_id}:*")
-        statistics = {}
+        # Session statistics and the shared latency histograms in one round trip
+        pipe = redis_client.pipeline()
+        pipe.hgetall(f"stats:{session_id}")
+        pipe.hgetall(LATENCY_REDIS_KEY)
+        stats_fields, latency_fields = pipe.execute()
+        
+        statistics = {
+            stat_type.decode('utf-8'): json.loads(data)
+            for stat_type, data in stats_fields.items()
+        }
+        
+        # Latency histograms are shared across sessions, kept per provider and deployment
+        latency = {}
+        for name, histogram in histograms_from_redis_hash(latency_fields).items():
+            provider, _, deployment = name.partition(':')
+            provider_latency = latency.setdefault(provider, {'merged': LatencyHistogram(), 'deployments': {}})
+            provider_latency['merged'].merge(histogram)
+            provider_latency['deployments'][deployment] = latency_report(histogram)
+        for provider, provider_latency in latency.items():
+            latency[provider] = {**latency_report(provider_latency.pop('merged')), **provider_latency}
+        
+        return jsonify({
+            "status": "success",
+            "statistics": statistics,
+            "latency": latency
+        })
+        
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+def parse_time_arg(name):
+    """Read a time query parameter given as epoch seconds or ISO 8601"""
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+def metrics_query_args():
+    """Common filters of the /api/metrics endpoints"""
+    return {
+        'provider': request.args.get('provider'),
+        'deployment': request.args.get('deployment'),
+        'start': parse_time_arg('start'),
+        'end': parse_time_arg('end')
+    }
+
+@app.route('/api/metrics/series')
+def metrics_series():
+    """Rolled-up latency, error and token series per provider/deployment over a time window"""
+    try:
+        return jsonify({
+            "status": "success",
+            **metrics_store.query_series(resolution=request.args.get('resolution', type=int), **metrics_query_args())
+        })
         
-        for key in stats_keys:
-            stat_type = key.decode('utf-8').split(':')[-1]
-            data = redis_client.get(key)
-            if data:
-                statistics[stat_type] = json.loads(data)
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@app.route('/api/metrics/runs')
+def metrics_runs():
+    """Per-run metrics over a time window, newest first"""
+    try:
+        limit = min(request.args.get('limit', 100, type=int), 1000)
+        return jsonify({
+            "status": "success",
+            "runs": metrics_store.query_runs(limit=limit, **metrics_query_args())
+        })
         
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@app.route('/api/metrics/pages')
+def metrics_pages():
+    """Raw per-page metrics over a time window, oldest first"""
+    try:
+        limit = min(request.args.get('limit', 1000, type=int), 10000)
         return jsonify({
             "status": "success",
-            "statistics": statistics
+            "pages": metrics_store.query_pages(limit=limit, **metrics_query_args())
         })
         
     except Exception as e:
@@ -204,6 +316,20 @@ def handle_connect():
     """Handle WebSocket connection"""
     emit('status', {'message': 'Connected to Mistral OCR Test Server'})
 
+@socketio.on('subscribe')
+def handle_subscribe(data):
+    """Join a task's room to receive its progress, page and completion events"""
+    task_id = (data or {}).get('task_id')
+    if task_id:
+        join_room(task_id)
+
+@socketio.on('unsubscribe')
+def handle_unsubscribe(data):
+    """Leave a task's room"""
+    task_id = (data or {}).get('task_id')
+    if task_id:
+        leave_room(task_id)
+
 @socketio.on('disconnect')
 def handle_disconnect():
     """Handle WebSocket disconnection"""
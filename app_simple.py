@@ -1,16 +1,29 @@
 import os
 import json
 import uuid
-import base64
+import glob
+import hashlib
+import queue
+import threading
 import requests
-import sqlite3
+import time
+import math
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
 from datetime import datetime
 from flask import Flask, render_template, request, jsonify, session
 from flask_cors import CORS
+from flask_socketio import SocketIO, join_room, leave_room
 from dotenv import load_dotenv
+import google.auth.transport.requests
 from google.cloud import aiplatform
 from google.oauth2 import service_account
 import openai
+from db_pool import SQLitePool
+from image_encoder import encode_image, get_encoding_options
+from latency_histogram import LatencyHistogram, latency_report
+from pdf_renderer import get_page_count, iter_rendered_pages
+from result_cache import cache_enabled, make_cache_key, mark_cached, ocr_cache
+from test_corpus import generate_corpus, scenario_specs
 
 # Load environment variables
 load_dotenv()
@@ -20,110 +33,236 @@ app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'your-secret-key-here')
 
 # Initialize extensions
 CORS(app)
+# Job workers push task events to the browsers subscribed to the task's room
+socketio = SocketIO(app, cors_allowed_origins="*")
 
 # Database file path
 DB_FILE = 'mistral_ocr_test.db'
 
+# Shared WAL-mode connections for request handlers and job workers
+db_pool = SQLitePool(DB_FILE)
+
+# Shared pool for provider calls so Azure and GCP run side by side
+provider_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('PROVIDER_WORKERS', 8)),
+    thread_name_prefix='ocr-provider'
+)
+# Error entries kept in the running statistics row per provider
+ERROR_DETAILS_LIMIT = int(os.getenv('ERROR_DETAILS_LIMIT', 100))
+
+# Provider clients reused across requests, keyed by a hash of the provider config
+client_cache = {}
+client_cache_lock = threading.Lock()
+
+# Test history page sizes
+HISTORY_PAGE_SIZE = int(os.getenv('HISTORY_PAGE_SIZE', 20))
+HISTORY_MAX_PAGE_SIZE = 100
+
+# Progress ticks buffered in memory and written in batches
+pending_progress = {}
+pending_progress_lock = threading.Lock()
+PROGRESS_FLUSH_INTERVAL = float(os.getenv('PROGRESS_FLUSH_INTERVAL', 2))
+
+# In-process job queue drained by background worker threads
+job_queue = queue.Queue()
+job_workers = []
+job_workers_lock = threading.Lock()
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', 2))
+
+# Default per-provider timeout in seconds (override per provider with "timeout")
+PROVIDER_TIMEOUT = float(os.getenv('PROVIDER_TIMEOUT', 120))
+
 # Initialize database
 def init_database():
     """Initialize SQLite database with required tables"""
     try:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            
+            # Create configuration table
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS configurations (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    provider TEXT NOT NULL,
+                    config_data TEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            # Create test history table
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS test_history (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    task_id TEXT UNIQUE NOT NULL,
+                    filename TEXT NOT NULL,
+                    providers TEXT NOT NULL,
+                    results TEXT NOT NULL,
+                    statistics TEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            # Create task store table
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS task_store (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    task_id TEXT UNIQUE NOT NULL,
+                    job_type TEXT DEFAULT 'ocr',
+                    status TEXT NOT NULL,
+                    progress INTEGER DEFAULT 0,
+                    filename TEXT,
+                    test_config TEXT,
+                    providers TEXT,
+                    config_data TEXT,
+                    result_data TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            # Create statistics table
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS statistics (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    provider TEXT NOT NULL,
+                    total_pages INTEGER DEFAULT 0,
+                    successful_pages INTEGER DEFAULT 0,
+                    failed_pages INTEGER DEFAULT 0,
+                    success_rate REAL DEFAULT 0.0,
+                    total_response_time REAL DEFAULT 0.0,
+                    timed_pages INTEGER DEFAULT 0,
+                    average_response_time REAL DEFAULT 0.0,
+                    min_response_time REAL DEFAULT 0.0,
+                    max_response_time REAL DEFAULT 0.0,
+                    total_tokens INTEGER DEFAULT 0,
+                    input_tokens INTEGER DEFAULT 0,
+                    output_tokens INTEGER DEFAULT 0,
+                    average_tokens_per_page REAL DEFAULT 0.0,
+                    total_errors INTEGER DEFAULT 0,
+                    error_details TEXT,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            # Create page results table - one row per provider and page, for SQL analytics
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'page_results'")
+            needs_page_migration = cursor.fetchone() is None
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS page_results (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    task_id TEXT NOT NULL,
+                    provider TEXT NOT NULL,
+                    file TEXT,
+                    page_number INTEGER NOT NULL,
+                    status TEXT NOT NULL,
+                    response_time REAL DEFAULT 0.0,
+                    tokens_used INTEGER DEFAULT 0,
+                    input_tokens INTEGER DEFAULT 0,
+                    output_tokens INTEGER DEFAULT 0,
+                    cached INTEGER DEFAULT 0,
+                    error TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_page_results_task ON page_results(task_id)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_page_results_provider_created ON page_results(provider, created_at)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_page_results_provider_status ON page_results(provider, status)')
+            
+            # Unpack the results blobs of existing history in one statement
+            if needs_page_migration:
+                cursor.execute('''
+                    INSERT INTO page_results (task_id, provider, file, page_number, status, response_time,
+                                              tokens_used, input_tokens, output_tokens, cached, error, created_at)
+                    SELECT h.task_id, p.key,
+                           json_extract(pg.value, '$.file'),
+                           COALESCE(json_extract(pg.value, '$.page_number'), 1),
+                           COALESCE(json_extract(pg.value, '$.status'), 'error'),
+                           COALESCE(json_extract(pg.value, '$.response_time'), 0),
+                           COALESCE(json_extract(pg.value, '$.tokens_used'), 0),
+                           COALESCE(json_extract(pg.value, '$.input_tokens'), 0),
+                           COALESCE(json_extract(pg.value, '$.output_tokens'), 0),
+                           COALESCE(json_extract(pg.value, '$.cached'), 0),
+                           json_extract(pg.value, '$.error'),
+                           h.created_at
+                    FROM test_history h, json_each(h.results) p,
+                         json_each(CASE WHEN p.type = 'array' THEN p.value ELSE json_array(json(p.value)) END) pg
+                    ORDER BY h.created_at, h.id, p.id, pg.key
+                ''')
+                if cursor.rowcount > 0:
+                    print(f"✅ Migrated {cursor.rowcount} page results from test history")
+            
+            # Create latency histogram table - one mergeable histogram per provider and deployment
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'latency_histograms'")
+            needs_latency_seed = cursor.fetchone() is None
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS latency_histograms (
+                    provider TEXT NOT NULL,
+                    deployment TEXT NOT NULL,
+                    histogram TEXT NOT NULL,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (provider, deployment)
+                )
+            ''')
+            
+            # Seed from existing page results, which don't record a deployment
+            if needs_latency_seed:
+                cursor.execute('''
+                    SELECT provider, response_time FROM page_results
+                    WHERE status = 'success' AND NOT cached
+                ''')
+                histograms = {}
+                for row in cursor.fetchall():
+                    histograms.setdefault(row['provider'], LatencyHistogram()).record(row['response_time'])
+                cursor.executemany(
+                    'INSERT INTO latency_histograms (provider, deployment, histogram) VALUES (?, ?, ?)',
+                    [(provider, 'default', json.dumps(histogram.to_dict())) for provider, histogram in histograms.items()]
+                )
+            
+            # History is listed newest first and paged by (created_at, id)
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_test_history_created ON test_history(created_at DESC, id DESC)')
+            
+            # Upserts need one row per provider; drop duplicates older databases may hold
+            for table in ('configurations', 'statistics'):
+                cursor.execute(f'DELETE FROM {table} WHERE id NOT IN (SELECT MAX(id) FROM {table} GROUP BY provider)')
+                cursor.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS idx_{table}_provider ON {table}(provider)')
+            
+            # Running statistics need timed_pages; older databases get it added and rebuilt once
+            cursor.execute('PRAGMA table_info(statistics)')
+            needs_rebuild = 'timed_pages' not in [column['name'] for column in cursor.fetchall()]
+            if needs_rebuild:
+                cursor.execute('ALTER TABLE statistics ADD COLUMN timed_pages INTEGER DEFAULT 0')
+            
+            # Queued jobs are OCR runs or test file generation; older task stores only held OCR runs
+            cursor.execute('PRAGMA table_info(task_store)')
+            if 'job_type' not in [column['name'] for column in cursor.fetchall()]:
+                cursor.execute("ALTER TABLE task_store ADD COLUMN job_type TEXT DEFAULT 'ocr'")
         
-        # Create configuration table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS configurations (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                provider TEXT NOT NULL,
-                config_data TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Create test history table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS test_history (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                task_id TEXT UNIQUE NOT NULL,
-                filename TEXT NOT NULL,
-                providers TEXT NOT NULL,
-                results TEXT NOT NULL,
-                statistics TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Create task store table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS task_store (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                task_id TEXT UNIQUE NOT NULL,
-                status TEXT NOT NULL,
-                progress INTEGER DEFAULT 0,
-                filename TEXT,
-                test_config TEXT,
-                providers TEXT,
-                config_data TEXT,
-                result_data TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Create statistics table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS statistics (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                provider TEXT NOT NULL,
-                total_pages INTEGER DEFAULT 0,
-                successful_pages INTEGER DEFAULT 0,
-                failed_pages INTEGER DEFAULT 0,
-                success_rate REAL DEFAULT 0.0,
-                total_response_time REAL DEFAULT 0.0,
-                average_response_time REAL DEFAULT 0.0,
-                min_response_time REAL DEFAULT 0.0,
-                max_response_time REAL DEFAULT 0.0,
-                total_tokens INTEGER DEFAULT 0,
-                input_tokens INTEGER DEFAULT 0,
-                output_tokens INTEGER DEFAULT 0,
-                average_tokens_per_page REAL DEFAULT 0.0,
-                total_errors INTEGER DEFAULT 0,
-                error_details TEXT,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        conn.commit()
-        conn.close()
+        if needs_rebuild:
+            rebuild_statistics()
         print(f"✅ Database initialized: {DB_FILE}")
         
     except Exception as e:
         print(f"❌ Error initializing database: {e}")
 
-def get_db_connection():
-    """Get database connection"""
-    conn = sqlite3.connect(DB_FILE)
-    conn.row_factory = sqlite3.Row
-    return conn
+def db_connection():
+    """Borrow a pooled database connection - commits when the with-block succeeds, rolls back otherwise"""
+    return db_pool.connection()
 
 def load_config():
     """Load configuration from database"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT provider, config_data FROM configurations ORDER BY updated_at DESC')
-        rows = cursor.fetchall()
-        
-        config = {"azure": {}, "gcp": {}}
-        for row in rows:
-            provider = row['provider']
-            config_data = json.loads(row['config_data'])
-            config[provider] = config_data
-        
-        conn.close()
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('SELECT provider, config_data FROM configurations ORDER BY updated_at DESC')
+            rows = cursor.fetchall()
+            
+            config = {"azure": {}, "gcp": {}}
+            for row in rows:
+                provider = row['provider']
+                config_data = json.loads(row['config_data'])
+                config[provider] = config_data
         return config
         
     except Exception as e:
@@ -133,96 +272,108 @@ def load_config():
 def save_config(config):
     """Save configuration to database"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        for provider, config_data in config.items():
-            if config_data:  # Only save if config has data
-                # Check if config exists
-                cursor.execute('SELECT id FROM configurations WHERE provider = ?', (provider,))
-                existing = cursor.fetchone()
-                
-                if existing:
-                    # Update existing config
-                    cursor.execute('''
-                        UPDATE configurations 
-                        SET config_data = ?, updated_at = CURRENT_TIMESTAMP 
-                        WHERE provider = ?
-                    ''', (json.dumps(config_data), provider))
-                else:
-                    # Insert new config
-                    cursor.execute('''
-                        INSERT INTO configurations (provider, config_data)
-                        VALUES (?, ?)
-                    ''', (provider, json.dumps(config_data)))
-        
-        conn.commit()
-        conn.close()
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            
+            # Only save providers that have data, and only rewrite rows whose config changed
+            cursor.executemany('''
+                INSERT INTO configurations (provider, config_data)
+                VALUES (?, ?)
+                ON CONFLICT(provider) DO UPDATE
+                SET config_data = excluded.config_data, updated_at = CURRENT_TIMESTAMP
+                WHERE config_data != excluded.config_data
+            ''', [(provider, json.dumps(config_data)) for provider, config_data in config.items() if config_data])
         return True
         
     except Exception as e:
         print(f"Error saving config: {e}")
         return False
 
-def save_task(task_id, status, progress=0, filename=None, test_config=None, providers=None, config_data=None, result_data=None):
-    """Save task to database"""
+def save_task(task_id, status, progress=0, filename=None, test_config=None, providers=None, config_data=None, result_data=None,
+              job_type=None):
+    """Save task to database - fields left as None keep their stored value"""
+    # A state change supersedes any buffered progress tick
+    with pending_progress_lock:
+        pending_progress.pop(task_id, None)
+    
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Check if task exists
-        cursor.execute('SELECT id FROM task_store WHERE task_id = ?', (task_id,))
-        existing = cursor.fetchone()
-        
-        if existing:
-            # Update existing task
-            cursor.execute('''
-                UPDATE task_store 
-                SET status = ?, progress = ?, filename = ?, test_config = ?, 
-                    providers = ?, config_data = ?, result_data = ?, updated_at = CURRENT_TIMESTAMP
-                WHERE task_id = ?
-            ''', (status, progress, filename, json.dumps(test_config) if test_config else None,
-                  json.dumps(providers) if providers else None, json.dumps(config_data) if config_data else None,
-                  json.dumps(result_data) if result_data else None, task_id))
-        else:
-            # Insert new task
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            
             cursor.execute('''
-                INSERT INTO task_store (task_id, status, progress, filename, test_config, providers, config_data, result_data)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (task_id, status, progress, filename, json.dumps(test_config) if test_config else None,
+                INSERT INTO task_store (task_id, job_type, status, progress, filename, test_config, providers, config_data, result_data)
+                VALUES (?, COALESCE(?, 'ocr'), ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(task_id) DO UPDATE
+                SET status = excluded.status, progress = excluded.progress,
+                    filename = COALESCE(excluded.filename, filename),
+                    test_config = COALESCE(excluded.test_config, test_config),
+                    providers = COALESCE(excluded.providers, providers),
+                    config_data = COALESCE(excluded.config_data, config_data),
+                    result_data = COALESCE(excluded.result_data, result_data),
+                    updated_at = CURRENT_TIMESTAMP
+            ''', (task_id, job_type, status, progress, filename, json.dumps(test_config) if test_config else None,
                   json.dumps(providers) if providers else None, json.dumps(config_data) if config_data else None,
                   json.dumps(result_data) if result_data else None))
-        
-        conn.commit()
-        conn.close()
         return True
         
     except Exception as e:
         print(f"Error saving task: {e}")
         return False
 
+def update_task_progress(task_id, progress):
+    """Record a progress tick in memory - written to the database in batches by the progress flusher"""
+    with pending_progress_lock:
+        pending_progress[task_id] = progress
+
+def get_task_progress(task_id, stored_progress):
+    """Get the freshest known progress for a task"""
+    with pending_progress_lock:
+        return pending_progress.get(task_id, stored_progress)
+
+def flush_task_progress():
+    """Write all buffered progress ticks in one transaction"""
+    with pending_progress_lock:
+        batch = [(progress, task_id) for task_id, progress in pending_progress.items()]
+        pending_progress.clear()
+    
+    if not batch:
+        return
+    
+    try:
+        with db_connection() as conn:
+            conn.executemany('''
+                UPDATE task_store SET progress = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE task_id = ? AND status = 'running'
+            ''', batch)
+    except Exception as e:
+        print(f"Error flushing task progress: {e}")
+
+def progress_flusher():
+    """Flush buffered progress ticks every PROGRESS_FLUSH_INTERVAL seconds"""
+    while True:
+        time.sleep(PROGRESS_FLUSH_INTERVAL)
+        flush_task_progress()
+
 def get_task(task_id):
     """Get task from database"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT * FROM task_store WHERE task_id = ?', (task_id,))
-        row = cursor.fetchone()
-        
-        if row:
-            task = dict(row)
-            # Parse JSON fields
-            if task['test_config']:
-                task['test_config'] = json.loads(task['test_config'])
-            if task['providers']:
-                task['providers'] = json.loads(task['providers'])
-            if task['config_data']:
-                task['config_data'] = json.loads(task['config_data'])
-            if task['result_data']:
-                task['result_data'] = json.loads(task['result_data'])
-        
-        conn.close()
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('SELECT * FROM task_store WHERE task_id = ?', (task_id,))
+            row = cursor.fetchone()
+            
+            if row:
+                task = dict(row)
+                # Parse JSON fields
+                if task['test_config']:
+                    task['test_config'] = json.loads(task['test_config'])
+                if task['providers']:
+                    task['providers'] = json.loads(task['providers'])
+                if task['config_data']:
+                    task['config_data'] = json.loads(task['config_data'])
+                if task['result_data']:
+                    task['result_data'] = json.loads(task['result_data'])
         return task
         
     except Exception as e:
@@ -230,166 +381,375 @@ def get_task(task_id):
         return None
 
 def save_test_history(task_id, filename, providers, results, statistics):
-    """Save test to history"""
+    """Save test to history and fold its results into the running statistics"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO test_history (task_id, filename, providers, results, statistics)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (task_id, filename, json.dumps(providers), json.dumps(results), json.dumps(statistics)))
-        
-        conn.commit()
-        conn.close()
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                INSERT INTO test_history (task_id, filename, providers, results, statistics)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (task_id, filename, json.dumps(providers), json.dumps(results), json.dumps(statistics)))
+            
+            # Same transaction, so history, page results and statistics never disagree
+            save_page_results(cursor, task_id, results)
+            for provider, result in results.items():
+                update_statistics(cursor, provider, provider_pages(result))
+                update_latency_histograms(cursor, provider, provider_pages(result))
         return True
         
     except Exception as e:
         print(f"Error saving test history: {e}")
         return False
 
-def get_test_history():
-    """Get all test history"""
+def save_page_results(cursor, task_id, results):
+    """Write one page_results row per provider and page"""
+    cursor.executemany('''
+        INSERT INTO page_results (task_id, provider, file, page_number, status, response_time,
+                                  tokens_used, input_tokens, output_tokens, cached, error)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', [
+        (task_id, provider, page.get('file'), page.get('page_number', 1), page['status'],
+         page.get('response_time', 0), page.get('tokens_used', 0), page.get('input_tokens', 0),
+         page.get('output_tokens', 0), int(bool(page.get('cached'))), page.get('error'))
+        for provider, result in results.items()
+        for page in provider_pages(result)
+    ])
+
+def get_test_history(limit=HISTORY_PAGE_SIZE, cursor_value=None):
+    """Get one page of test history, newest first, without the results and statistics blobs.
+    Returns (tests, next_cursor); pass next_cursor back in to get the following page."""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT * FROM test_history ORDER BY created_at DESC')
-        rows = cursor.fetchall()
-        
-        tests = []
-        for row in rows:
-            test = dict(row)
-            # Parse JSON fields
-            test['providers'] = json.loads(test['providers'])
-            test['results'] = json.loads(test['results'])
-            test['statistics'] = json.loads(test['statistics'])
-            tests.append(test)
-        
-        conn.close()
-        return tests
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            
+            if cursor_value:
+                created_at, last_id = cursor_value.rsplit('|', 1)
+                cursor.execute('''
+                    SELECT id, task_id, filename, providers, created_at FROM test_history
+                    WHERE (created_at, id) < (?, ?)
+                    ORDER BY created_at DESC, id DESC LIMIT ?
+                ''', (created_at, int(last_id), limit + 1))
+            else:
+                cursor.execute('''
+                    SELECT id, task_id, filename, providers, created_at FROM test_history
+                    ORDER BY created_at DESC, id DESC LIMIT ?
+                ''', (limit + 1,))
+            rows = cursor.fetchall()
+            
+            # One extra row tells us whether there is another page
+            next_cursor = None
+            if len(rows) > limit:
+                rows = rows[:limit]
+                next_cursor = f"{rows[-1]['created_at']}|{rows[-1]['id']}"
+            
+            tests = []
+            for row in rows:
+                test = dict(row)
+                del test['id']
+                test['providers'] = json.loads(test['providers'])
+                tests.append(test)
+        return tests, next_cursor
         
     except Exception as e:
         print(f"Error getting test history: {e}")
-        return []
+        return [], None
 
 def get_test_by_id(task_id):
     """Get specific test by task_id"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT * FROM test_history WHERE task_id = ?', (task_id,))
-        row = cursor.fetchone()
-        
-        if row:
-            test = dict(row)
-            # Parse JSON fields
-            test['providers'] = json.loads(test['providers'])
-            test['results'] = json.loads(test['results'])
-            test['statistics'] = json.loads(test['statistics'])
-        
-        conn.close()
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('SELECT * FROM test_history WHERE task_id = ?', (task_id,))
+            row = cursor.fetchone()
+            
+            if row:
+                test = dict(row)
+                # Parse JSON fields
+                test['providers'] = json.loads(test['providers'])
+                test['results'] = json.loads(test['results'])
+                test['statistics'] = json.loads(test['statistics'])
         return test
         
     except Exception as e:
         print(f"Error getting test by id: {e}")
         return None
 
-def update_statistics(provider, stats):
-    """Update statistics for a provider"""
+def update_statistics(cursor, provider, pages):
+    """Add one test's page results to the provider's running statistics in a single upsert.
+    Runs on the caller's cursor so it commits together with the history row."""
+    successful_pages = [page for page in pages if page['status'] == 'success']
+    response_times = [page['response_time'] for page in successful_pages if not page.get('cached')]
+    total_tokens = sum(page['tokens_used'] for page in successful_pages)
+    
+    # Keep only the most recent errors, the full list lives in test_history
+    error_details = [
+        {
+            'file': page.get('file'),
+            'page_number': page.get('page_number', 1),
+            'error': page.get('error', 'Unknown error'),
+            'status': 'error'
+        }
+        for page in pages if page['status'] != 'success'
+    ][-ERROR_DETAILS_LIMIT:]
+    
+    cursor.execute('''
+        INSERT INTO statistics (provider, total_pages, successful_pages, failed_pages, success_rate,
+                              total_response_time, timed_pages, average_response_time, min_response_time, max_response_time,
+                              total_tokens, input_tokens, output_tokens, average_tokens_per_page,
+                              total_errors, error_details)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(provider) DO UPDATE SET
+            total_pages = total_pages + excluded.total_pages,
+            successful_pages = successful_pages + excluded.successful_pages,
+            failed_pages = failed_pages + excluded.failed_pages,
+            success_rate = CASE WHEN total_pages + excluded.total_pages > 0
+                THEN (successful_pages + excluded.successful_pages) * 100.0 / (total_pages + excluded.total_pages)
+                ELSE 0 END,
+            total_response_time = total_response_time + excluded.total_response_time,
+            timed_pages = timed_pages + excluded.timed_pages,
+            average_response_time = CASE WHEN timed_pages + excluded.timed_pages > 0
+                THEN (total_response_time + excluded.total_response_time) / (timed_pages + excluded.timed_pages)
+                ELSE 0 END,
+            min_response_time = CASE WHEN excluded.timed_pages = 0 THEN min_response_time
+                WHEN timed_pages = 0 THEN excluded.min_response_time
+                ELSE MIN(min_response_time, excluded.min_response_time) END,
+            max_response_time = MAX(max_response_time, excluded.max_response_time),
+            total_tokens = total_tokens + excluded.total_tokens,
+            input_tokens = input_tokens + excluded.input_tokens,
+            output_tokens = output_tokens + excluded.output_tokens,
+            average_tokens_per_page = CASE WHEN successful_pages + excluded.successful_pages > 0
+                THEN (total_tokens + excluded.total_tokens) * 1.0 / (successful_pages + excluded.successful_pages)
+                ELSE 0 END,
+            total_errors = total_errors + excluded.total_errors,
+            error_details = CASE WHEN excluded.total_errors = 0 THEN error_details ELSE (
+                SELECT json_group_array(json(value)) FROM (
+                    SELECT * FROM (
+                        SELECT 0 AS batch, key, value FROM json_each(COALESCE(statistics.error_details, '[]'))
+                        UNION ALL
+                        SELECT 1 AS batch, key, value FROM json_each(excluded.error_details)
+                        ORDER BY batch DESC, key DESC LIMIT ?
+                    ) ORDER BY batch, key
+                )
+            ) END,
+            updated_at = CURRENT_TIMESTAMP
+    ''', (provider, len(pages), len(successful_pages), len(pages) - len(successful_pages),
+          len(successful_pages) / len(pages) * 100 if pages else 0.0,
+          sum(response_times), len(response_times), sum(response_times) / len(response_times) if response_times else 0.0,
+          min(response_times) if response_times else 0.0, max(response_times) if response_times else 0.0,
+          total_tokens, sum(page['input_tokens'] for page in successful_pages),
+          sum(page['output_tokens'] for page in successful_pages),
+          total_tokens / len(successful_pages) if successful_pages else 0.0,
+          len(pages) - len(successful_pages), json.dumps(error_details), ERROR_DETAILS_LIMIT))
+
+def rebuild_statistics():
+    """Recompute the running statistics from page_results - only needed after schema changes"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Check if stats exist for provider
-        cursor.execute('SELECT id FROM statistics WHERE provider = ?', (provider,))
-        existing = cursor.fetchone()
-        
-        if existing:
-            # Update existing stats
-            cursor.execute('''
-                UPDATE statistics 
-                SET total_pages = ?, successful_pages = ?, failed_pages = ?, success_rate = ?,
-                    total_response_time = ?, average_response_time = ?, min_response_time = ?, max_response_time = ?,
-                    total_tokens = ?, input_tokens = ?, output_tokens = ?, average_tokens_per_page = ?,
-                    total_errors = ?, error_details = ?, updated_at = CURRENT_TIMESTAMP
-                WHERE provider = ?
-            ''', (stats['summary']['total_pages'], stats['summary']['successful_pages'], 
-                  stats['summary']['failed_pages'], stats['summary']['success_rate'],
-                  stats['performance']['total_time'], stats['performance'].get('average_response_time', 0),
-                  stats['performance']['min_time'], stats['performance']['max_time'],
-                  stats['token_usage']['total_tokens'], stats['token_usage']['input_tokens'],
-                  stats['token_usage']['output_tokens'], stats['token_usage'].get('average_tokens_per_page', 0),
-                  stats['errors']['total_errors'], json.dumps(stats['errors']['error_details']), provider))
-        else:
-            # Insert new stats
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('DELETE FROM statistics')
             cursor.execute('''
                 INSERT INTO statistics (provider, total_pages, successful_pages, failed_pages, success_rate,
-                                      total_response_time, average_response_time, min_response_time, max_response_time,
+                                      total_response_time, timed_pages, average_response_time, min_response_time, max_response_time,
                                       total_tokens, input_tokens, output_tokens, average_tokens_per_page,
                                       total_errors, error_details)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (provider, stats['summary']['total_pages'], stats['summary']['successful_pages'], 
-                  stats['summary']['failed_pages'], stats['summary']['success_rate'],
-                  stats['performance']['total_time'], stats['performance'].get('average_response_time', 0),
-                  stats['performance']['min_time'], stats['performance']['max_time'],
-                  stats['token_usage']['total_tokens'], stats['token_usage']['input_tokens'],
-                  stats['token_usage']['output_tokens'], stats['token_usage'].get('average_tokens_per_page', 0),
-                  stats['errors']['total_errors'], json.dumps(stats['errors']['error_details'])))
-        
-        conn.commit()
-        conn.close()
+                SELECT provider, COUNT(*), SUM(status = 'success'), SUM(status != 'success'),
+                       SUM(status = 'success') * 100.0 / COUNT(*),
+                       COALESCE(SUM(CASE WHEN status = 'success' AND NOT cached THEN response_time END), 0),
+                       SUM(status = 'success' AND NOT cached),
+                       COALESCE(AVG(CASE WHEN status = 'success' AND NOT cached THEN response_time END), 0),
+                       COALESCE(MIN(CASE WHEN status = 'success' AND NOT cached THEN response_time END), 0),
+                       COALESCE(MAX(CASE WHEN status = 'success' AND NOT cached THEN response_time END), 0),
+                       SUM(CASE WHEN status = 'success' THEN tokens_used ELSE 0 END),
+                       SUM(CASE WHEN status = 'success' THEN input_tokens ELSE 0 END),
+                       SUM(CASE WHEN status = 'success' THEN output_tokens ELSE 0 END),
+                       COALESCE(SUM(CASE WHEN status = 'success' THEN tokens_used END) * 1.0 / NULLIF(SUM(status = 'success'), 0), 0),
+                       SUM(status != 'success'),
+                       (SELECT json_group_array(json_object('file', file, 'page_number', page_number,
+                                                            'error', COALESCE(error, 'Unknown error'), 'status', 'error'))
+                        FROM (SELECT * FROM (SELECT * FROM page_results e
+                                             WHERE e.provider = r.provider AND e.status != 'success'
+                                             ORDER BY e.id DESC LIMIT ?)
+                              ORDER BY id))
+                FROM page_results r
+                GROUP BY provider
+            ''', (ERROR_DETAILS_LIMIT,))
         return True
         
     except Exception as e:
-        print(f"Error updating statistics: {e}")
+        print(f"Error rebuilding statistics: {e}")
         return False
 
-def get_statistics():
-    """Get all statistics"""
+def update_latency_histograms(cursor, provider, pages):
+    """Merge one test's response times into the provider's per-deployment histograms"""
+    histograms = {}
+    for page in pages:
+        if page['status'] == 'success' and not page.get('cached'):
+            deployment = page.get('deployment') or 'default'
+            histograms.setdefault(deployment, LatencyHistogram()).record(page['response_time'])
+    
+    for deployment, histogram in histograms.items():
+        cursor.execute('SELECT histogram FROM latency_histograms WHERE provider = ? AND deployment = ?', (provider, deployment))
+        row = cursor.fetchone()
+        if row:
+            histogram.merge(LatencyHistogram.from_dict(json.loads(row['histogram'])))
+        cursor.execute('''
+            INSERT INTO latency_histograms (provider, deployment, histogram)
+            VALUES (?, ?, ?)
+            ON CONFLICT(provider, deployment) DO UPDATE
+            SET histogram = excluded.histogram, updated_at = CURRENT_TIMESTAMP
+        ''', (provider, deployment, json.dumps(histogram.to_dict())))
+
+def get_latency_statistics():
+    """Get latency percentiles and chart buckets per provider, overall and per deployment"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT * FROM statistics')
-        rows = cursor.fetchall()
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('SELECT provider, deployment, histogram FROM latency_histograms ORDER BY provider, deployment')
+            rows = cursor.fetchall()
         
-        statistics = {}
+        merged = {}
+        latency = {}
         for row in rows:
-            provider = row['provider']
-            statistics[provider] = {
-                'summary': {
-                    'total_pages': row['total_pages'],
-                    'successful_pages': row['successful_pages'],
-                    'failed_pages': row['failed_pages'],
-                    'success_rate': row['success_rate']
-                },
-                'performance': {
-                    'total_time': row['total_response_time'],
-                    'average_response_time': row['average_response_time'],
-                    'min_response_time': row['min_response_time'],
-                    'max_response_time': row['max_response_time']
-                },
-                'token_usage': {
-                    'total_tokens': row['total_tokens'],
-                    'input_tokens': row['input_tokens'],
-                    'output_tokens': row['output_tokens'],
-                    'average_tokens_per_page': row['average_tokens_per_page']
-                },
-                'errors': {
-                    'total_errors': row['total_errors'],
-                    'error_details': json.loads(row['error_details']) if row['error_details'] else []
-                }
-            }
+            histogram = LatencyHistogram.from_dict(json.loads(row['histogram']))
+            merged.setdefault(row['provider'], LatencyHistogram()).merge(histogram)
+            latency.setdefault(row['provider'], {'deployments': {}})['deployments'][row['deployment']] = latency_report(histogram)
+        for provider, histogram in merged.items():
+            latency[provider].update(latency_report(histogram))
+        return latency
+        
+    except Exception as e:
+        print(f"Error getting latency statistics: {e}")
+        return {}
+
+def get_latency_percentiles(provider, percentiles=(50, 90, 95, 99)):
+    """Get response time percentiles of a provider's live (uncached) successful pages"""
+    try:
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                SELECT COUNT(*) FROM page_results
+                WHERE provider = ? AND status = 'success' AND NOT cached
+            ''', (provider,))
+            count = cursor.fetchone()[0]
+            
+            values = {}
+            for percentile in percentiles:
+                if not count:
+                    values[f'p{percentile}'] = 0.0
+                    continue
+                # Nearest-rank percentile
+                cursor.execute('''
+                    SELECT response_time FROM page_results
+                    WHERE provider = ? AND status = 'success' AND NOT cached
+                    ORDER BY response_time LIMIT 1 OFFSET ?
+                ''', (provider, max(math.ceil(count * percentile / 100) - 1, 0)))
+                values[f'p{percentile}'] = cursor.fetchone()[0]
+        return values
+        
+    except Exception as e:
+        print(f"Error getting latency percentiles: {e}")
+        return {}
+
+def get_error_rate_over_time(provider, bucket='day'):
+    """Get page counts and error rate per day or hour for a provider"""
+    bucket_format = '%Y-%m-%d %H:00' if bucket == 'hour' else '%Y-%m-%d'
+    try:
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                SELECT strftime(?, created_at) AS period, COUNT(*) AS total_pages,
+                       SUM(status != 'success') AS failed_pages,
+                       SUM(status != 'success') * 100.0 / COUNT(*) AS error_rate
+                FROM page_results
+                WHERE provider = ?
+                GROUP BY period
+                ORDER BY period
+            ''', (bucket_format, provider))
+            return [dict(row) for row in cursor.fetchall()]
         
-        conn.close()
+    except Exception as e:
+        print(f"Error getting error rate over time: {e}")
+        return []
+
+def get_statistics():
+    """Get all statistics"""
+    try:
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('SELECT * FROM statistics')
+            rows = cursor.fetchall()
+            
+            statistics = {}
+            for row in rows:
+                provider = row['provider']
+                statistics[provider] = {
+                    'summary': {
+                        'total_pages': row['total_pages'],
+                        'successful_pages': row['successful_pages'],
+                        'failed_pages': row['failed_pages'],
+                        'success_rate': row['success_rate']
+                    },
+                    'performance': {
+                        'total_time': row['total_response_time'],
+                        'average_response_time': row['average_response_time'],
+                        'min_response_time': row['min_response_time'],
+                        'max_response_time': row['max_response_time']
+                    },
+                    'token_usage': {
+                        'total_tokens': row['total_tokens'],
+                        'input_tokens': row['input_tokens'],
+                        'output_tokens': row['output_tokens'],
+                        'average_tokens_per_page': row['average_tokens_per_page']
+                    },
+                    'errors': {
+                        'total_errors': row['total_errors'],
+                        'error_details': json.loads(row['error_details']) if row['error_details'] else []
+                    }
+                }
         return statistics
         
     except Exception as e:
         print(f"Error getting statistics: {e}")
         return {}
 
+def client_cache_key(provider, config):
+    """Build the client cache key from a hash of the provider config"""
+    config_json = json.dumps(config, sort_keys=True, default=str)
+    return f"{provider}:{hashlib.sha256(config_json.encode()).hexdigest()}"
+
+def get_cached_client(provider, config, factory):
+    """Return the cached client for this provider config, creating it on first use"""
+    key = client_cache_key(provider, config)
+    with client_cache_lock:
+        client = client_cache.get(key)
+        if client is None:
+            client = factory(config)
+            # Failed creations are not cached so a fixed config is retried
+            if client is not None:
+                client_cache[key] = client
+    return client
+
+def clear_client_cache():
+    """Drop all cached provider clients and close their connection pools"""
+    with client_cache_lock:
+        clients = list(client_cache.values())
+        client_cache.clear()
+    
+    for client in clients:
+        close = getattr(client, 'close', None)
+        if callable(close):
+            try:
+                close()
+            except Exception as e:
+                print(f"Error closing provider client: {e}")
+
 def create_azure_client(config):
     """Create Azure OpenAI client"""
     try:
@@ -406,32 +766,80 @@ def create_azure_client(config):
         print(f"Error creating Azure client: {e}")
         return None
 
+class VertexRESTEndpoint:
+    """Minimal predict client for an "api_endpoint" override such as mock_provider_server.py"""
+    
+    def __init__(self, config, credentials=None):
+        self.predict_url = (
+            f"{config['api_endpoint'].rstrip('/')}/v1/projects/{config.get('project_id')}"
+            f"/locations/{config.get('location', 'us-central1')}/endpoints/{config.get('endpoint_id')}:predict"
+        )
+        self.credentials = credentials
+        self.session = requests.Session()
+    
+    def predict(self, instances, timeout=None):
+        headers = {}
+        if self.credentials is not None:
+            if not self.credentials.valid:
+                self.credentials.refresh(google.auth.transport.requests.Request())
+            headers['Authorization'] = f"Bearer {self.credentials.token}"
+        
+        response = self.session.post(self.predict_url, json={'instances': instances}, headers=headers,
+                                     timeout=timeout or PROVIDER_TIMEOUT)
+        response.raise_for_status()
+        return type('Prediction', (), {'predictions': response.json().get('predictions', [])})()
+    
+    def close(self):
+        self.session.close()
+
 def create_gcp_client(config):
-    """Create GCP client"""
+    """Create GCP Vertex AI endpoint client"""
     try:
+        if config.get('api_endpoint') and config.get('anonymous_credentials'):
+            return VertexRESTEndpoint(config)
+        
         if not config.get('service_account_json'):
             return None
         
         # Parse service account JSON
         service_account_info = json.loads(config['service_account_json'])
         
-        # Initialize GCP client
+        # Credentials are passed to the endpoint directly so that
+        # differently configured clients don't fight over aiplatform.init()
         credentials = service_account.Credentials.from_service_account_info(
             service_account_info
         )
         
-        aiplatform.init(
-            credentials=credentials,
+        if config.get('api_endpoint'):
+            credentials = credentials.with_scopes(['https://www.googleapis.com/auth/cloud-platform'])
+            return VertexRESTEndpoint(config, credentials)
+        
+        return aiplatform.Endpoint(
+            config.get('endpoint_id'),
             project=config.get('project_id'),
-            location=config.get('location', 'us-central1')
+            location=config.get('location', 'us-central1'),
+            credentials=credentials
         )
-        
-        return aiplatform
     except Exception as e:
         print(f"Error creating GCP client: {e}")
         return None
 
-def call_azure_ocr(client, image_base64, deployment_name):
+def get_azure_client(config):
+    """Get the cached Azure OpenAI client for this config"""
+    return get_cached_client('azure', config, create_azure_client)
+
+def get_gcp_client(config):
+    """Get the cached GCP endpoint client for this config"""
+    return get_cached_client('gcp', config, create_gcp_client)
+
+OCR_PROMPT = "Extract all text from this image. Return only the extracted text without any additional formatting or explanations."
+AZURE_TEMPERATURE = 0
+
+def get_provider_timeout(config):
+    """Seconds a provider call may take, from the provider's "timeout" or PROVIDER_TIMEOUT"""
+    return float(config.get('timeout', PROVIDER_TIMEOUT))
+
+def call_azure_ocr(client, image_base64, deployment_name, mime_type='image/png', timeout=None):
     """Call Azure OpenAI Vision API for OCR"""
     try:
         response = client.chat.completions.create(
@@ -442,19 +850,20 @@ def call_azure_ocr(client, image_base64, deployment_name):
                     "content": [
                         {
                             "type": "text",
-                            "text": "Extract all text from this image. Return only the extracted text without any additional formatting or explanations."
+                            "text": OCR_PROMPT
                         },
                         {
                             "type": "image_url",
                             "image_url": {
-                                "url": f"data:image/jpeg;base64,{image_base64}"
+                                "url": f"data:{mime_type};base64,{image_base64}"
                             }
                         }
                     ]
                 }
             ],
             max_tokens=4096,
-            temperature=0
+            temperature=AZURE_TEMPERATURE,
+            timeout=timeout
         )
         
         return {
@@ -468,12 +877,9 @@ def call_azure_ocr(client, image_base64, deployment_name):
     except Exception as e:
         raise Exception(f"Azure OCR error: {str(e)}")
 
-def call_gcp_ocr(client, image_base64, endpoint_id):
+def call_gcp_ocr(endpoint, image_base64, timeout=None):
     """Call GCP Vertex AI for OCR"""
     try:
-        # Create prediction client
-        endpoint = client.Endpoint(endpoint_id)
-        
         # Prepare the request
         instance = {
             "instances": [
@@ -486,118 +892,328 @@ def call_gcp_ocr(client, image_base64, endpoint_id):
         }
         
         # Make prediction
-        response = endpoint.predict(instances=instance["instances"])
+        response = endpoint.predict(instances=instance["instances"], timeout=timeout)
         
         # Extract text from response (adjust based on actual GCP response format)
         predictions = response.predictions
+        usage = {}
         if predictions and len(predictions) > 0:
             # Assuming the response contains text in a specific field
             # You may need to adjust this based on the actual GCP OCR response format
             text = predictions[0].get('text', '') if hasattr(predictions[0], 'get') else str(predictions[0])
+            usage = predictions[0].get('usage') or {} if hasattr(predictions[0], 'get') else {}
         else:
             text = ""
         
         return {
             'text': text,
             'usage': {
-                'prompt_tokens': 0,  # GCP doesn't provide token usage in the same way
-                'completion_tokens': 0,
-                'total_tokens': 0
+                'prompt_tokens': usage.get('prompt_tokens', 0),  # GCP doesn't provide token usage in the same way
+                'completion_tokens': usage.get('completion_tokens', 0),
+                'total_tokens': usage.get('total_tokens', 0)
             }
         }
     except Exception as e:
         raise Exception(f"GCP OCR error: {str(e)}")
 
-def process_image_with_providers(image_base64, providers_config):
-    """Process image with selected providers"""
+def provider_error_result(error):
+    """Build the result entry for a provider that did not return text"""
+    return {
+        'status': 'error',
+        'error': error,
+        'response_time': 0,
+        'tokens_used': 0,
+        'input_tokens': 0,
+        'output_tokens': 0,
+        'bytes_sent': 0
+    }
+
+def get_cached_result(cache_key):
+    """Return a cached provider result flagged as such, or None"""
+    if not cache_key:
+        return None
+    cached = ocr_cache.get(cache_key)
+    if not cached:
+        return None
+    return mark_cached(cached)
+
+def run_azure_ocr(azure_config, page_image):
+    """Run OCR with Azure and time the call"""
+    encoded = encode_image(page_image, get_encoding_options(azure_config))
+    deployment_name = azure_config.get('deployment_name', 'gpt-4-vision')
+    
+    cache_key = None
+    if cache_enabled(azure_config):
+        model = f"{azure_config.get('endpoint', '').rstrip('/')}/{deployment_name}"
+        cache_key = make_cache_key(encoded['data'], 'azure', model, OCR_PROMPT, AZURE_TEMPERATURE)
+        cached = get_cached_result(cache_key)
+        if cached:
+            return cached
+    
+    azure_client = get_azure_client(azure_config)
+    if not azure_client:
+        return provider_error_result('Azure client not configured properly')
+    
+    start_time = datetime.now()
+    azure_result = call_azure_ocr(
+        azure_client, 
+        encoded['data'], 
+        deployment_name,
+        encoded['mime_type'],
+        get_provider_timeout(azure_config)
+    )
+    end_time = datetime.now()
+    
+    result = {
+        'status': 'success',
+        'text': azure_result['text'],
+        'response_time': (end_time - start_time).total_seconds(),
+        'tokens_used': azure_result['usage']['total_tokens'],
+        'input_tokens': azure_result['usage']['prompt_tokens'],
+        'output_tokens': azure_result['usage']['completion_tokens'],
+        'bytes_sent': encoded['bytes_sent'],
+        'image_format': encoded['format'],
+        'deployment': deployment_name
+    }
+    if cache_key:
+        ocr_cache.put(cache_key, result)
+    return result
+
+def run_gcp_ocr(gcp_config, page_image):
+    """Run OCR with GCP and time the call"""
+    encoded = encode_image(page_image, get_encoding_options(gcp_config))
+    
+    cache_key = None
+    if cache_enabled(gcp_config):
+        endpoint = (f"{gcp_config.get('api_endpoint') or 'aiplatform'}/{gcp_config.get('project_id')}"
+                    f"/{gcp_config.get('location', 'us-central1')}/{gcp_config.get('endpoint_id')}")
+        cache_key = make_cache_key(encoded['data'], 'gcp', endpoint, None, None)
+        cached = get_cached_result(cache_key)
+        if cached:
+            return cached
+    
+    gcp_client = get_gcp_client(gcp_config)
+    if not gcp_client:
+        return provider_error_result('GCP client not configured properly')
+    
+    start_time = datetime.now()
+    gcp_result = call_gcp_ocr(gcp_client, encoded['data'], get_provider_timeout(gcp_config))
+    end_time = datetime.now()
+    
+    result = {
+        'status': 'success',
+        'text': gcp_result['text'],
+        'response_time': (end_time - start_time).total_seconds(),
+        'tokens_used': gcp_result['usage']['total_tokens'],
+        'input_tokens': gcp_result['usage']['prompt_tokens'],
+        'output_tokens': gcp_result['usage']['completion_tokens'],
+        'bytes_sent': encoded['bytes_sent'],
+        'image_format': encoded['format'],
+        'deployment': gcp_config.get('endpoint_id')
+    }
+    if cache_key:
+        ocr_cache.put(cache_key, result)
+    return result
+
+PROVIDER_RUNNERS = {
+    'azure': run_azure_ocr,
+    'gcp': run_gcp_ocr
+}
+
+def process_image_with_providers(page_image, providers_config):
+    """Process image with selected providers, calling them concurrently"""
     results = {}
+    futures = {}
     
-    # Process with Azure if configured
-    if providers_config.get('azure', {}).get('enabled'):
-        azure_config = providers_config['azure']
-        azure_client = create_azure_client(azure_config)
-        
-        if azure_client:
-            try:
-                start_time = datetime.now()
-                azure_result = call_azure_ocr(
-                    azure_client, 
-                    image_base64, 
-                    azure_config.get('deployment_name', 'gpt-4-vision')
-                )
-                end_time = datetime.now()
-                
-                results['azure'] = {
-                    'status': 'success',
-                    'text': azure_result['text'],
-                    'response_time': (end_time - start_time).total_seconds(),
-                    'tokens_used': azure_result['usage']['total_tokens'],
-                    'input_tokens': azure_result['usage']['prompt_tokens'],
-                    'output_tokens': azure_result['usage']['completion_tokens']
-                }
-            except Exception as e:
-                results['azure'] = {
-                    'status': 'error',
-                    'error': str(e),
-                    'response_time': 0,
-                    'tokens_used': 0,
-                    'input_tokens': 0,
-                    'output_tokens': 0
-                }
-        else:
-            results['azure'] = {
-                'status': 'error',
-                'error': 'Azure client not configured properly',
-                'response_time': 0,
-                'tokens_used': 0,
-                'input_tokens': 0,
-                'output_tokens': 0
-            }
+    # Dispatch every enabled provider at once so the comparison costs max(latency), not the sum
+    for provider, runner in PROVIDER_RUNNERS.items():
+        provider_config = providers_config.get(provider, {})
+        if provider_config.get('enabled'):
+            futures[provider] = provider_executor.submit(runner, provider_config, page_image)
     
-    # Process with GCP if configured
-    if providers_config.get('gcp', {}).get('enabled'):
-        gcp_config = providers_config['gcp']
-        gcp_client = create_gcp_client(gcp_config)
-        
-        if gcp_client:
-            try:
-                start_time = datetime.now()
-                gcp_result = call_gcp_ocr(
-                    gcp_client, 
-                    image_base64, 
-                    gcp_config.get('endpoint_id')
-                )
-                end_time = datetime.now()
-                
-                results['gcp'] = {
-                    'status': 'success',
-                    'text': gcp_result['text'],
-                    'response_time': (end_time - start_time).total_seconds(),
-                    'tokens_used': gcp_result['usage']['total_tokens'],
-                    'input_tokens': gcp_result['usage']['prompt_tokens'],
-                    'output_tokens': gcp_result['usage']['completion_tokens']
-                }
-            except Exception as e:
-                results['gcp'] = {
-                    'status': 'error',
-                    'error': str(e),
-                    'response_time': 0,
-                    'tokens_used': 0,
-                    'input_tokens': 0,
-                    'output_tokens': 0
-                }
-        else:
-            results['gcp'] = {
-                'status': 'error',
-                'error': 'GCP client not configured properly',
-                'response_time': 0,
-                'tokens_used': 0,
-                'input_tokens': 0,
-                'output_tokens': 0
-            }
+    # Each provider has its own deadline, measured from dispatch; the clients enforce
+    # the same timeout so a call that is given up on doesn't keep its worker thread
+    dispatched_at = time.monotonic()
+    for provider, future in futures.items():
+        timeout = get_provider_timeout(providers_config[provider])
+        remaining = max(0, timeout - (time.monotonic() - dispatched_at))
+        try:
+            results[provider] = future.result(timeout=remaining)
+        except FuturesTimeoutError:
+            results[provider] = provider_error_result(f"{provider.upper()} OCR error: timed out after {timeout:g}s")
+        except Exception as e:
+            results[provider] = provider_error_result(str(e))
     
     return results
 
+def emit_task_event(event, task_id, payload):
+    """Push an event to the clients subscribed to a task"""
+    try:
+        socketio.emit(event, {'task_id': task_id, **payload}, to=task_id)
+    except Exception as e:
+        print(f"Error emitting {event} for task {task_id}: {e}")
+
+def resolve_job_files(task):
+    """Expand the task's file list (paths or glob patterns) to existing PDF files"""
+    files = []
+    for pattern in (task.get('test_config') or {}).get('files', []):
+        files.extend(sorted(glob.glob(pattern)))
+    return files
+
+def run_ocr_job(task):
+    """Run a queued OCR job and store its results"""
+    task_id = task['task_id']
+    try:
+        files = resolve_job_files(task)
+        if not files:
+            raise ValueError("No PDF files found for this task")
+        
+        test_config = task.get('test_config') or {}
+        providers_config = task.get('config_data', {})
+        total_pages = sum(get_page_count(file_path) for file_path in files)
+        pages_done = 0
+        results = {}
+        
+        save_task(task_id, 'running', 0)
+        
+        for file_path in files:
+            # Pages arrive as soon as the render pool finishes them, not in page order
+            for page_number, page_image in iter_rendered_pages(file_path, test_config.get('render_dpi')):
+                page_results = process_image_with_providers(page_image, providers_config)
+                
+                for provider, result in page_results.items():
+                    result['file'] = os.path.basename(file_path)
+                    result['page_number'] = page_number
+                    results.setdefault(provider, []).append(result)
+                    emit_task_event('page_completed', task_id, {
+                        'provider': provider,
+                        **{key: result.get(key) for key in ('file', 'page_number', 'status', 'response_time', 'tokens_used', 'error')}
+                    })
+                
+                pages_done += 1
+                progress = int(pages_done / total_pages * 100)
+                update_task_progress(task_id, progress)
+                emit_task_event('task_progress', task_id, {
+                    'status': 'running',
+                    'progress': progress,
+                    'pages_completed': pages_done,
+                    'total_pages': total_pages
+                })
+        
+        for pages in results.values():
+            pages.sort(key=lambda page: (page['file'], page['page_number']))
+        
+        # Calculate statistics
+        statistics = calculate_statistics(results)
+        
+        result_data = {
+            'status': 'completed',
+            'providers': task.get('providers', []),
+            'results': results,
+            'statistics': statistics,
+            'timestamp': datetime.now().isoformat()
+        }
+        
+        # Save completed task
+        save_task(task_id, 'completed', 100, result_data=result_data)
+        emit_task_event('task_completed', task_id, {'status': 'completed', 'result': result_data})
+        
+        # Save to test history, this also updates the running statistics
+        filename = task.get('filename')
+        if not filename:
+            filename = f"Batch Test - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+        save_test_history(task_id, filename, 
+                        task.get('providers', []), results, statistics)
+        
+    except Exception as e:
+        print(f"Error running job {task_id}: {e}")
+        save_task(task_id, 'failed', 0, result_data={'status': 'error', 'error': str(e)})
+        emit_task_event('task_failed', task_id, {'status': 'failed', 'error': str(e)})
+
+def run_generation_job(task):
+    """Build the test files of a queued generation job in the corpus process pool"""
+    task_id = task['task_id']
+    try:
+        save_task(task_id, 'running', 0)
+        
+        def report(files_done, total_files):
+            progress = int(files_done / total_files * 100) if total_files else 100
+            update_task_progress(task_id, progress)
+            emit_task_event('task_progress', task_id, {'status': 'running', 'progress': progress})
+        
+        files_created = generate_corpus((task.get('test_config') or {}).get('scenarios', []), progress=report)
+        result_data = {
+            'status': 'completed',
+            'files_created': files_created,
+            'total_files': len(files_created),
+            'reused_files': sum(file['reused'] for file in files_created),
+            'providers': task.get('providers', [])
+        }
+        save_task(task_id, 'completed', 100, result_data=result_data)
+        emit_task_event('task_completed', task_id, {'status': 'completed', 'result': result_data})
+        
+    except Exception as e:
+        print(f"Error generating test files for {task_id}: {e}")
+        save_task(task_id, 'failed', 0, result_data={'status': 'error', 'error': str(e)})
+        emit_task_event('task_failed', task_id, {'status': 'failed', 'error': str(e)})
+
+JOB_RUNNERS = {
+    'ocr': run_ocr_job,
+    'generate': run_generation_job
+}
+
+def run_job(task_id):
+    """Run a queued job with the runner for its job type"""
+    task = get_task(task_id)
+    if not task:
+        print(f"Job {task_id} not found")
+        return
+    JOB_RUNNERS[task.get('job_type') or 'ocr'](task)
+
+def job_worker():
+    """Take jobs off the queue until the process exits"""
+    while True:
+        task_id = job_queue.get()
+        try:
+            run_job(task_id)
+        finally:
+            job_queue.task_done()
+
+def start_job_workers():
+    """Start the background worker threads once per process"""
+    with job_workers_lock:
+        if job_workers:
+            return
+        for i in range(JOB_WORKERS):
+            worker = threading.Thread(target=job_worker, name=f'ocr-job-{i}', daemon=True)
+            worker.start()
+            job_workers.append(worker)
+        
+        flusher = threading.Thread(target=progress_flusher, name='progress-flusher', daemon=True)
+        flusher.start()
+        job_workers.append(flusher)
+
+def submit_job(task_id):
+    """Queue a saved task for background processing"""
+    start_job_workers()
+    job_queue.put(task_id)
+
+def requeue_pending_jobs():
+    """Re-submit jobs that were queued or running when the process last stopped"""
+    try:
+        with db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT task_id FROM task_store WHERE status IN ('queued', 'running') ORDER BY created_at")
+            task_ids = [row['task_id'] for row in cursor.fetchall()]
+        
+        for task_id in task_ids:
+            submit_job(task_id)
+        return len(task_ids)
+        
+    except Exception as e:
+        print(f"Error requeueing jobs: {e}")
+        return 0
+
 @app.route('/')
 def index():
     """Main page with configuration and test interface"""
@@ -611,6 +1227,8 @@ def config():
         
         # Save configuration to database
         if save_config(config_data):
+            # Clients built from the old config must not be reused
+            clear_client_cache()
             return jsonify({"status": "success", "message": "Configuration saved to database"})
         else:
             return jsonify({"status": "error", "message": "Failed to save configuration"}), 500
@@ -626,31 +1244,23 @@ def generate_files():
         test_scenarios = data.get('scenarios', [])
         selected_providers = data.get('providers', ['azure', 'gcp'])
         
-        # Simulate file generation
-        files_created = []
-        for i, scenario in enumerate(test_scenarios):
-            files_created.append({
-                'filename': f"test_files/test_{scenario.get('content_type', 'mixed')}_{scenario.get('pages', 1)}pages_{i}.pdf",
-                'pages': scenario.get('pages', 1),
-                'content_type': scenario.get('content_type', 'mixed'),
-                'size_mb': 0.5
-            })
+        # Reject unknown content types before anything is queued
+        for scenario in test_scenarios:
+            scenario_specs(scenario)
         
+        # Queue generation like an OCR job, so it survives restarts
         task_id = str(uuid.uuid4())
-        result_data = {
-            'status': 'completed',
-            'files_created': files_created,
-            'total_files': len(files_created),
-            'providers': selected_providers
-        }
-        
-        save_task(task_id, 'completed', 100, result_data=result_data)
+        save_task(task_id, 'queued', 0, test_config={'scenarios': test_scenarios},
+                  providers=selected_providers, job_type='generate')
+        submit_job(task_id)
         
         return jsonify({
             "status": "success",
             "task_id": task_id,
-            "message": "Test files generation completed"
+            "message": "Test files generation started"
         })
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
@@ -678,9 +1288,11 @@ def upload_file():
         os.makedirs('uploads', exist_ok=True)
         file.save(filename)
         
-        # Start OCR processing
+        # Queue OCR processing
         task_id = str(uuid.uuid4())
-        save_task(task_id, 'running', 0, file.filename, providers=selected_providers, config_data=config)
+        save_task(task_id, 'queued', 0, file.filename, test_config={'files': [filename]},
+                  providers=selected_providers, config_data=config)
+        submit_job(task_id)
         
         return jsonify({
             "status": "success",
@@ -705,9 +1317,10 @@ def batch_test():
         if not config:
             return jsonify({"status": "error", "message": "Configuration not found"}), 400
         
-        # Start batch processing
+        # Queue batch processing
         task_id = str(uuid.uuid4())
-        save_task(task_id, 'running', 0, test_config=test_config, providers=selected_providers, config_data=config)
+        save_task(task_id, 'queued', 0, test_config=test_config, providers=selected_providers, config_data=config)
+        submit_job(task_id)
         
         return jsonify({
             "status": "success",
@@ -721,7 +1334,7 @@ def batch_test():
 
 @app.route('/api/task-status/<task_id>')
 def task_status(task_id):
-    """Get task status and results"""
+    """Get task status and results - read-only, the work happens in the job workers"""
     try:
         task = get_task(task_id)
         
@@ -736,243 +1349,109 @@ def task_status(task_id):
         elif task['status'] == 'failed':
             return jsonify({
                 "status": "failed",
-                "error": task.get('error', 'Unknown error')
+                "error": (task.get('result_data') or {}).get('error', 'Unknown error')
             })
         else:
-            # Simulate progress and real API calls
-            progress = task.get('progress', 0)
-            if progress < 100:
-                progress = min(progress + 10, 100)
-                
-                if progress >= 100:
-                    # Here you would normally process the actual PDF and call real APIs
-                    # For now, we'll simulate with a sample image
-                    sample_image_base64 = "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg=="
-                    
-                    # Process with real APIs
-                    providers_config = task.get('config_data', {})
-                    results = process_image_with_providers(sample_image_base64, providers_config)
-                    
-                    # Calculate statistics
-                    statistics = calculate_statistics(results)
-                    
-                    result_data = {
-                        'status': 'completed',
-                        'providers': task.get('providers', []),
-                        'results': results,
-                        'statistics': statistics,
-                        'timestamp': datetime.now().isoformat()
-                    }
-                    
-                    # Save completed task
-                    save_task(task_id, 'completed', 100, task.get('filename'), 
-                             task.get('test_config'), task.get('providers'), 
-                             task.get('config_data'), result_data)
-                    
-                    # Save to test history
-                    filename = task.get('filename')
-                    if not filename:
-                        filename = f"Batch Test - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-                    save_test_history(task_id, filename, 
-                                    task.get('providers', []), results, statistics)
-                    
-                    # Update statistics
-                    update_aggregate_statistics()
-                
-                else:
-                    # Update progress
-                    save_task(task_id, 'running', progress, task.get('filename'), 
-                             task.get('test_config'), task.get('providers'), 
-                             task.get('config_data'), task.get('result_data'))
-            
             return jsonify({
-                "status": "running",
-                "progress": progress
+                "status": task['status'],
+                "progress": get_task_progress(task_id, task.get('progress', 0))
             })
             
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
+def provider_pages(result):
+    """Get the per-page results of one provider, including single-page history rows"""
+    return result if isinstance(result, list) else [result]
+
 def calculate_statistics(results):
     """Calculate statistics from OCR results"""
     statistics = {}
     
     for provider, result in results.items():
-        if result['status'] == 'success':
-            statistics[provider] = {
-                'summary': {
-                    'total_pages': 1,
-                    'successful_pages': 1,
-                    'failed_pages': 0,
-                    'success_rate': 100.0
-                },
-                'performance': {
-                    'average_response_time': result['response_time'],
-                    'min_response_time': result['response_time'],
-                    'max_response_time': result['response_time'],
-                    'total_processing_time': result['response_time']
-                },
-                'token_usage': {
-                    'total_tokens': result['tokens_used'],
-                    'input_tokens': result['input_tokens'],
-                    'output_tokens': result['output_tokens'],
-                    'average_tokens_per_page': result['tokens_used']
-                },
-                'errors': {
-                    'total_errors': 0,
-                    'error_details': []
-                }
-            }
-        else:
-            statistics[provider] = {
-                'summary': {
-                    'total_pages': 1,
-                    'successful_pages': 0,
-                    'failed_pages': 1,
-                    'success_rate': 0.0
-                },
-                'performance': {
-                    'average_response_time': 0,
-                    'min_response_time': 0,
-                    'max_response_time': 0,
-                    'total_processing_time': 0
-                },
-                'token_usage': {
-                    'total_tokens': 0,
-                    'input_tokens': 0,
-                    'output_tokens': 0,
-                    'average_tokens_per_page': 0
-                },
-                'errors': {
-                    'total_errors': 1,
-                    'error_details': [
-                        {
-                            'page_number': 1,
-                            'error': result.get('error', 'Unknown error'),
-                            'status': 'error'
-                        }
-                    ]
-                }
+        pages = provider_pages(result)
+        successful_pages = [page for page in pages if page['status'] == 'success']
+        failed_pages = [page for page in pages if page['status'] != 'success']
+        cached_pages = [page for page in successful_pages if page.get('cached')]
+        response_times = [page['response_time'] for page in successful_pages if not page.get('cached')]
+        total_tokens = sum(page['tokens_used'] for page in successful_pages)
+        bytes_sent = sum(page.get('bytes_sent', 0) for page in successful_pages)
+        
+        statistics[provider] = {
+            'summary': {
+                'total_pages': len(pages),
+                'successful_pages': len(successful_pages),
+                'failed_pages': len(failed_pages),
+                'success_rate': len(successful_pages) / len(pages) * 100 if pages else 0.0
+            },
+            'performance': {
+                'average_response_time': sum(response_times) / len(response_times) if response_times else 0,
+                'min_response_time': min(response_times) if response_times else 0,
+                'max_response_time': max(response_times) if response_times else 0,
+                'total_processing_time': sum(response_times),
+                'latency': latency_report(LatencyHistogram.from_values(response_times))
+            },
+            'token_usage': {
+                'total_tokens': total_tokens,
+                'input_tokens': sum(page['input_tokens'] for page in successful_pages),
+                'output_tokens': sum(page['output_tokens'] for page in successful_pages),
+                'average_tokens_per_page': total_tokens / len(successful_pages) if successful_pages else 0
+            },
+            'payload': {
+                'total_bytes_sent': bytes_sent,
+                'average_bytes_per_page': bytes_sent / len(successful_pages) if successful_pages else 0
+            },
+            'cache': {
+                'cached_pages': len(cached_pages),
+                'live_pages': len(pages) - len(cached_pages)
+            },
+            'errors': {
+                'total_errors': len(failed_pages),
+                'error_details': [
+                    {
+                        'page_number': page.get('page_number', 1),
+                        'error': page.get('error', 'Unknown error'),
+                        'status': 'error'
+                    }
+                    for page in failed_pages
+                ]
             }
+        }
     
     return statistics
 
-def update_aggregate_statistics():
-    """Update aggregate statistics from test history"""
+@app.route('/api/statistics')
+def get_statistics_api():
+    """Get comprehensive statistics by provider"""
     try:
-        tests = get_test_history()
-        
-        # Initialize stats
-        azure_stats = {
-            'summary': {'total_pages': 0, 'successful_pages': 0, 'failed_pages': 0, 'success_rate': 0.0},
-            'performance': {'total_time': 0, 'count': 0, 'min_time': float('inf'), 'max_time': 0},
-            'token_usage': {'total_tokens': 0, 'input_tokens': 0, 'output_tokens': 0, 'count': 0},
-            'errors': {'total_errors': 0, 'error_details': []}
-        }
-        
-        gcp_stats = {
-            'summary': {'total_pages': 0, 'successful_pages': 0, 'failed_pages': 0, 'success_rate': 0.0},
-            'performance': {'total_time': 0, 'count': 0, 'min_time': float('inf'), 'max_time': 0},
-            'token_usage': {'total_tokens': 0, 'input_tokens': 0, 'output_tokens': 0, 'count': 0},
-            'errors': {'total_errors': 0, 'error_details': []}
-        }
-        
-        for test in tests:
-            if 'azure' in test.get('results', {}):
-                result = test['results']['azure']
-                azure_stats['summary']['total_pages'] += 1
-                if result['status'] == 'success':
-                    azure_stats['summary']['successful_pages'] += 1
-                    azure_stats['performance']['total_time'] += result['response_time']
-                    azure_stats['performance']['count'] += 1
-                    azure_stats['performance']['min_time'] = min(azure_stats['performance']['min_time'], result['response_time'])
-                    azure_stats['performance']['max_time'] = max(azure_stats['performance']['max_time'], result['response_time'])
-                    azure_stats['token_usage']['total_tokens'] += result['tokens_used']
-                    azure_stats['token_usage']['input_tokens'] += result['input_tokens']
-                    azure_stats['token_usage']['output_tokens'] += result['output_tokens']
-                    azure_stats['token_usage']['count'] += 1
-                else:
-                    azure_stats['summary']['failed_pages'] += 1
-                    azure_stats['errors']['total_errors'] += 1
-                    azure_stats['errors']['error_details'].append({
-                        'page_number': azure_stats['summary']['total_pages'],
-                        'error': result.get('error', 'Unknown error'),
-                        'status': 'error'
-                    })
-            
-            if 'gcp' in test.get('results', {}):
-                result = test['results']['gcp']
-                gcp_stats['summary']['total_pages'] += 1
-                if result['status'] == 'success':
-                    gcp_stats['summary']['successful_pages'] += 1
-                    gcp_stats['performance']['total_time'] += result['response_time']
-                    gcp_stats['performance']['count'] += 1
-                    gcp_stats['performance']['min_time'] = min(gcp_stats['performance']['min_time'], result['response_time'])
-                    gcp_stats['performance']['max_time'] = max(gcp_stats['performance']['max_time'], result['response_time'])
-                    gcp_stats['token_usage']['total_tokens'] += result['tokens_used']
-                    gcp_stats['token_usage']['input_tokens'] += result['input_tokens']
-                    gcp_stats['token_usage']['output_tokens'] += result['output_tokens']
-                    gcp_stats['token_usage']['count'] += 1
-                else:
-                    gcp_stats['summary']['failed_pages'] += 1
-                    gcp_stats['errors']['total_errors'] += 1
-                    gcp_stats['errors']['error_details'].append({
-                        'page_number': gcp_stats['summary']['total_pages'],
-                        'error': result.get('error', 'Unknown error'),
-                        'status': 'error'
-                    })
+        # Running totals are maintained by save_test_history
+        statistics = get_statistics()
         
-        # Calculate averages and success rates
-        if azure_stats['summary']['total_pages'] > 0:
-            azure_stats['summary']['success_rate'] = (azure_stats['summary']['successful_pages'] / azure_stats['summary']['total_pages']) * 100
-        if azure_stats['performance']['count'] > 0:
-            azure_stats['performance']['average_response_time'] = azure_stats['performance']['total_time'] / azure_stats['performance']['count']
-        if azure_stats['token_usage']['count'] > 0:
-            azure_stats['token_usage']['average_tokens_per_page'] = azure_stats['token_usage']['total_tokens'] / azure_stats['token_usage']['count']
-        
-        if gcp_stats['summary']['total_pages'] > 0:
-            gcp_stats['summary']['success_rate'] = (gcp_stats['summary']['successful_pages'] / gcp_stats['summary']['total_pages']) * 100
-        if gcp_stats['performance']['count'] > 0:
-            gcp_stats['performance']['average_response_time'] = gcp_stats['performance']['total_time'] / gcp_stats['performance']['count']
-        if gcp_stats['token_usage']['count'] > 0:
-            gcp_stats['token_usage']['average_tokens_per_page'] = gcp_stats['token_usage']['total_tokens'] / gcp_stats['token_usage']['count']
-        
-        # Clean up performance stats
-        if azure_stats['performance']['min_time'] == float('inf'):
-            azure_stats['performance']['min_time'] = 0
-        if gcp_stats['performance']['min_time'] == float('inf'):
-            gcp_stats['performance']['min_time'] = 0
-        
-        # Update database
-        update_statistics('azure', azure_stats)
-        update_statistics('gcp', gcp_stats)
-        
-        # Clean up performance stats
-        if azure_stats['performance']['min_time'] == float('inf'):
-            azure_stats['performance']['min_time'] = 0
-        if gcp_stats['performance']['min_time'] == float('inf'):
-            gcp_stats['performance']['min_time'] = 0
-        
-        # Update database
-        update_statistics('azure', azure_stats)
-        update_statistics('gcp', gcp_stats)
+        return jsonify({
+            "status": "success",
+            "statistics": statistics,
+            "latency": get_latency_statistics(),
+            "cache": ocr_cache.get_stats()
+        })
         
     except Exception as e:
-        print(f"Error updating aggregate statistics: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
 
-@app.route('/api/statistics')
-def get_statistics_api():
-    """Get comprehensive statistics by provider"""
+@app.route('/api/analytics')
+def get_analytics_api():
+    """Get latency percentiles and error rate over time per provider from page_results"""
     try:
-        # Update aggregate statistics first
-        update_aggregate_statistics()
-        
-        # Get from database
-        statistics = get_statistics()
+        bucket = request.args.get('bucket', 'day')
+        analytics = {}
+        for provider in get_statistics().keys():
+            analytics[provider] = {
+                'latency_percentiles': get_latency_percentiles(provider),
+                'error_rate_over_time': get_error_rate_over_time(provider, bucket)
+            }
         
         return jsonify({
             "status": "success",
-            "statistics": statistics
+            "analytics": analytics
         })
         
     except Exception as e:
@@ -980,16 +1459,32 @@ def get_statistics_api():
 
 @app.route('/api/test-history')
 def get_test_history_api():
-    """Get detailed test history"""
+    """Get one page of test history - full results come from /api/test-details"""
     try:
-        tests = get_test_history()
+        limit = min(request.args.get('limit', HISTORY_PAGE_SIZE, type=int), HISTORY_MAX_PAGE_SIZE)
+        tests, next_cursor = get_test_history(max(limit, 1), request.args.get('cursor'))
         return jsonify({
             "status": "success",
-            "tests": tests
+            "tests": tests,
+            "next_cursor": next_cursor
         })
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
+@socketio.on('subscribe')
+def handle_subscribe(data):
+    """Join a task's room to receive its progress, page and completion events"""
+    task_id = (data or {}).get('task_id')
+    if task_id:
+        join_room(task_id)
+
+@socketio.on('unsubscribe')
+def handle_unsubscribe(data):
+    """Leave a task's room"""
+    task_id = (data or {}).get('task_id')
+    if task_id:
+        leave_room(task_id)
+
 @app.route('/api/test-details/<task_id>')
 def get_test_details(task_id):
     """Get detailed information about a specific test"""
@@ -1015,10 +1510,20 @@ if __name__ == '__main__':
     # Initialize database
     init_database()
     
+    debug = True
+    use_reloader = debug and os.getenv('FLASK_USE_RELOADER', 'true').lower() == 'true'
+    
+    # Start background workers and pick up jobs left over from the last run - only in the
+    # process that serves requests: with the reloader that is its child, not the watcher
+    if not use_reloader or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_job_workers()
+        requeue_pending_jobs()
+    
     print("🚀 Starting Mistral OCR Test Suite (Database Mode)...")
     print("🌐 Application will be available at: http://localhost:80")
     print("⚠ Note: This version uses SQLite database for data persistence")
     print("✨ Features: Configuration persistence, test history, and real API integration")
     print(f"📊 Database: {DB_FILE}")
     
-    app.run(debug=True, host='0.0.0.0', port=80)
+    # Werkzeug is what app.run() used before; Flask-SocketIO only allows it without a TTY (Docker) when asked
+    socketio.run(app, debug=debug, use_reloader=use_reloader, host='0.0.0.0', port=80, allow_unsafe_werkzeug=True)
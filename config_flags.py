@@ -0,0 +1,15 @@
+"""
+On/off switches in provider configs.
+Configs arrive as JSON from the web UI or as strings from forms and
+environment files, so "false" and "0" have to mean off, not just False.
+"""
+
+TRUE_VALUES = {'true', '1', 'yes', 'on'}
+
+def parse_flag(value, default=False):
+    """Read a boolean option that may be given as bool, number or string"""
+    if value is None:
+        return default
+    if isinstance(value, str):
+        return value.strip().lower() in TRUE_VALUES
+    return bool(value)
@@ -0,0 +1,66 @@
+"""
+Image encoding for OCR provider payloads.
+Turns rendered pages into base64 payloads with a configurable format, quality,
+size limit and color mode, and reports how many bytes each page costs to send.
+"""
+
+import base64
+import io
+import os
+
+from PIL import Image
+
+MIME_TYPES = {
+    'PNG': 'image/png',
+    'JPEG': 'image/jpeg',
+    'WEBP': 'image/webp'
+}
+
+# Defaults, override per provider with an "encoding" block in its config
+DEFAULT_ENCODING = {
+    'format': os.getenv('IMAGE_FORMAT', 'PNG'),
+    'quality': int(os.getenv('IMAGE_QUALITY', 85)),
+    'max_dimension': int(os.getenv('IMAGE_MAX_DIMENSION', 0)),
+    'grayscale': os.getenv('IMAGE_GRAYSCALE', 'false').lower() == 'true'
+}
+
+def get_encoding_options(config):
+    """Merge a provider's "encoding" config over the defaults"""
+    options = {**DEFAULT_ENCODING, **(config.get('encoding') or {})}
+    options['format'] = options['format'].upper().replace('JPG', 'JPEG')
+    if options['format'] not in MIME_TYPES:
+        raise ValueError(f"Unsupported image format: {options['format']}")
+    options['quality'] = int(options['quality'])
+    options['max_dimension'] = int(options['max_dimension'] or 0)
+    options['grayscale'] = bool(options['grayscale'])
+    return options
+
+def encode_image(image, options=None):
+    """Encode a page image for sending to a provider"""
+    options = options or get_encoding_options({})
+
+    if options['max_dimension'] and max(image.size) > options['max_dimension']:
+        image = image.copy()
+        image.thumbnail((options['max_dimension'], options['max_dimension']), Image.LANCZOS)
+
+    if options['grayscale']:
+        image = image.convert('L')
+    elif image.mode not in ('RGB', 'L'):
+        # JPEG has no alpha channel
+        image = image.convert('RGB')
+
+    buffer = io.BytesIO()
+    if options['format'] == 'PNG':
+        image.save(buffer, format='PNG')
+    else:
+        image.save(buffer, format=options['format'], quality=options['quality'])
+    raw = buffer.getvalue()
+
+    return {
+        'data': base64.b64encode(raw).decode(),
+        'mime_type': MIME_TYPES[options['format']],
+        'format': options['format'],
+        'width': image.size[0],
+        'height': image.size[1],
+        'bytes_sent': len(raw)
+    }
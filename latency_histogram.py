@@ -0,0 +1,181 @@
+"""
+Streaming latency histogram for provider statistics.
+Response times are counted in logarithmic buckets (HDR-histogram style), so
+percentiles are accurate to a fixed relative error while memory stays bounded
+no matter how many requests are recorded. Histograms from different tasks,
+workers or deployments merge by adding bucket counts.
+"""
+
+import math
+import os
+
+# Relative error of reported percentiles, 0.01 = 1%
+LATENCY_PRECISION = float(os.getenv('LATENCY_PRECISION', 0.01))
+# Recorded range in seconds, values outside are clamped
+LATENCY_MIN_VALUE = 0.001
+LATENCY_MAX_VALUE = 3600.0
+
+# Coarse bucket edges in seconds for dashboard charts
+DISPLAY_BUCKETS = [0.25, 0.5, 1, 2, 3, 5, 10, 20, 30, 60, 120]
+
+PERCENTILES = (50, 90, 95, 99, 99.9)
+
+# Redis hash holding every provider/deployment histogram, fields "<provider>:<deployment>|<bucket>"
+LATENCY_REDIS_KEY = os.getenv('LATENCY_REDIS_KEY', 'latency')
+
+class LatencyHistogram:
+    """Log-bucketed histogram of response times in seconds"""
+
+    def __init__(self, precision=LATENCY_PRECISION):
+        self.precision = precision
+        # Each bucket spans [gamma^(i-1), gamma^i] * LATENCY_MIN_VALUE; its midpoint is within precision of any value in it
+        self.gamma = (1 + precision) / (1 - precision)
+        self.log_gamma = math.log(self.gamma)
+        self.counts = {}
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def bucket_index(self, value):
+        value = min(max(value, LATENCY_MIN_VALUE), LATENCY_MAX_VALUE)
+        return max(math.ceil(math.log(value / LATENCY_MIN_VALUE) / self.log_gamma), 0)
+
+    def bucket_value(self, index):
+        """Representative value of a bucket"""
+        if index == 0:
+            return LATENCY_MIN_VALUE
+        return LATENCY_MIN_VALUE * 2 * self.gamma ** index / (self.gamma + 1)
+
+    def record(self, value, count=1):
+        """Add a response time"""
+        index = self.bucket_index(value)
+        self.counts[index] = self.counts.get(index, 0) + count
+        self.count += count
+        self.total += value * count
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other):
+        """Add another histogram's counts to this one"""
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge histograms with different precision")
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        if other.count:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+        return self
+
+    def percentile(self, percentile):
+        """Get the value at a percentile (0-100)"""
+        if not self.count:
+            return 0.0
+        rank = max(math.ceil(self.count * percentile / 100), 1)
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                # Never report outside what was actually recorded
+                return min(max(self.bucket_value(index), self.min), self.max)
+        return self.max
+
+    def summary(self):
+        """Get count, mean, min, max and the standard percentiles"""
+        summary = {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else 0.0,
+            'min': self.min or 0.0,
+            'max': self.max or 0.0
+        }
+        for percentile in PERCENTILES:
+            summary[f'p{percentile:g}'.replace('.', '_')] = self.percentile(percentile)
+        return summary
+
+    def display_buckets(self, edges=DISPLAY_BUCKETS):
+        """Fold the fine buckets into coarse ranges for charts"""
+        buckets = [{'label': f'≤ {edge}s', 'upper': edge, 'count': 0} for edge in edges]
+        buckets.append({'label': f'> {edges[-1]}s', 'upper': None, 'count': 0})
+        for index, count in self.counts.items():
+            value = self.bucket_value(index)
+            position = next((i for i, edge in enumerate(edges) if value <= edge), len(edges))
+            buckets[position]['count'] += count
+        return buckets
+
+    def to_dict(self):
+        """Serialize for JSON storage"""
+        return {
+            'precision': self.precision,
+            'count': self.count,
+            'sum': self.total,
+            'min': self.min,
+            'max': self.max,
+            'buckets': {str(index): count for index, count in self.counts.items()}
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Load a histogram serialized with to_dict"""
+        histogram = cls(data.get('precision', LATENCY_PRECISION))
+        histogram.counts = {int(index): count for index, count in (data.get('buckets') or {}).items()}
+        histogram.count = data.get('count', 0)
+        histogram.total = data.get('sum', 0.0)
+        histogram.min = data.get('min')
+        histogram.max = data.get('max')
+        return histogram
+
+    @classmethod
+    def from_values(cls, values):
+        histogram = cls()
+        for value in values:
+            histogram.record(value)
+        return histogram
+
+def latency_report(histogram):
+    """Percentiles plus chart buckets for the statistics API"""
+    return {
+        'percentiles': histogram.summary(),
+        'histogram': histogram.display_buckets()
+    }
+
+def queue_add_to_redis(pipe, name, histogram, key=LATENCY_REDIS_KEY):
+    """Queue merging a histogram into the shared Redis hash on a pipeline.
+    HINCRBY keeps concurrent workers from losing counts."""
+    if not histogram.count:
+        return
+    for index, count in histogram.counts.items():
+        pipe.hincrby(key, f'{name}|b:{index}', count)
+    pipe.hincrby(key, f'{name}|count', histogram.count)
+    pipe.hincrbyfloat(key, f'{name}|sum', histogram.total)
+
+def add_to_redis(client, name, histogram, key=LATENCY_REDIS_KEY):
+    """Merge a histogram into the shared Redis hash under name ("provider:deployment")"""
+    pipe = client.pipeline()
+    queue_add_to_redis(pipe, name, histogram, key)
+    pipe.execute()
+
+def histograms_from_redis_hash(fields):
+    """Split the HGETALL result of the shared hash into {name: histogram}"""
+    histograms = {}
+    for field, value in fields.items():
+        field = field.decode() if isinstance(field, bytes) else field
+        name, _, kind = field.rpartition('|')
+        histogram = histograms.setdefault(name, LatencyHistogram())
+        if kind.startswith('b:'):
+            histogram.counts[int(kind[2:])] = int(value)
+        elif kind == 'count':
+            histogram.count = int(value)
+        elif kind == 'sum':
+            histogram.total = float(value)
+    # Min and max aren't stored, the outermost buckets bound them within the precision
+    for histogram in histograms.values():
+        if histogram.counts:
+            histogram.min = histogram.bucket_value(min(histogram.counts))
+            histogram.max = histogram.bucket_value(max(histogram.counts))
+    return histograms
+
+def load_from_redis(client, key=LATENCY_REDIS_KEY):
+    """Load every histogram stored in the shared hash with one HGETALL"""
+    return histograms_from_redis_hash(client.hgetall(key))
@@ -0,0 +1,315 @@
+"""
+Durable time series of OCR run and page metrics.
+Every finished run appends one row per run and one compact row per page to
+SQLite, and folds its pages into rollups at 1 minute, 1 hour and 1 day
+resolution (counts plus a mergeable latency histogram per bucket). Raw pages
+and fine rollups are pruned after their retention, coarse rollups are kept,
+so provider latency can be trended over months at constant query cost.
+"""
+
+import json
+import os
+import threading
+import time
+
+from db_pool import SQLitePool
+from latency_histogram import LatencyHistogram
+
+METRICS_DB = os.getenv('METRICS_DB', 'metrics.db')
+# Days each level is kept, 0 keeps it forever
+METRICS_RAW_RETENTION_DAYS = float(os.getenv('METRICS_RAW_RETENTION_DAYS', 7))
+METRICS_RUN_RETENTION_DAYS = float(os.getenv('METRICS_RUN_RETENTION_DAYS', 365))
+ROLLUP_RETENTION_DAYS = {
+    60: float(os.getenv('METRICS_MINUTE_RETENTION_DAYS', 14)),
+    3600: float(os.getenv('METRICS_HOUR_RETENTION_DAYS', 180)),
+    86400: float(os.getenv('METRICS_DAY_RETENTION_DAYS', 0))
+}
+# Upper bound on points per series when the resolution is picked automatically
+METRICS_MAX_POINTS = int(os.getenv('METRICS_MAX_POINTS', 500))
+
+class MetricsStore:
+    """Append-only SQLite store for per-run and per-page metrics with rollups and retention"""
+
+    def __init__(self, db_path=METRICS_DB):
+        self.db_path = db_path
+        self.pool = SQLitePool(db_path)
+        self.lock = threading.Lock()
+        self.tables_ready = False
+
+    def connection(self):
+        """Borrow a pooled connection to the metrics database, creating the tables on first use"""
+        if not self.tables_ready:
+            with self.lock, self.pool.connection() as conn:
+                conn.executescript('''
+                    CREATE TABLE IF NOT EXISTS metric_series (
+                        id INTEGER PRIMARY KEY,
+                        provider TEXT NOT NULL,
+                        deployment TEXT NOT NULL,
+                        UNIQUE (provider, deployment)
+                    );
+                    CREATE TABLE IF NOT EXISTS run_metrics (
+                        id INTEGER PRIMARY KEY,
+                        task_id TEXT NOT NULL UNIQUE,
+                        series_id INTEGER NOT NULL,
+                        session_id TEXT,
+                        status TEXT NOT NULL,
+                        started_at REAL NOT NULL,
+                        finished_at REAL NOT NULL,
+                        total_pages INTEGER NOT NULL,
+                        successful_pages INTEGER NOT NULL,
+                        cached_pages INTEGER NOT NULL,
+                        total_tokens INTEGER NOT NULL,
+                        bytes_sent INTEGER NOT NULL,
+                        requests_made INTEGER NOT NULL,
+                        retries INTEGER NOT NULL,
+                        mean_latency REAL,
+                        p50_latency REAL,
+                        p95_latency REAL,
+                        p99_latency REAL
+                    );
+                    CREATE INDEX IF NOT EXISTS idx_run_metrics_series ON run_metrics(series_id, finished_at);
+                    CREATE INDEX IF NOT EXISTS idx_run_metrics_finished ON run_metrics(finished_at);
+                    CREATE TABLE IF NOT EXISTS page_metrics (
+                        series_id INTEGER NOT NULL,
+                        run_id INTEGER NOT NULL,
+                        ts REAL NOT NULL,
+                        page_number INTEGER NOT NULL,
+                        success INTEGER NOT NULL,
+                        cached INTEGER NOT NULL,
+                        attempts INTEGER NOT NULL,
+                        response_time REAL,
+                        tokens_used INTEGER NOT NULL,
+                        bytes_sent INTEGER NOT NULL
+                    );
+                    CREATE INDEX IF NOT EXISTS idx_page_metrics_series ON page_metrics(series_id, ts);
+                    CREATE INDEX IF NOT EXISTS idx_page_metrics_ts ON page_metrics(ts);
+                    CREATE TABLE IF NOT EXISTS metric_rollups (
+                        resolution INTEGER NOT NULL,
+                        series_id INTEGER NOT NULL,
+                        bucket_start INTEGER NOT NULL,
+                        pages INTEGER NOT NULL,
+                        errors INTEGER NOT NULL,
+                        cached INTEGER NOT NULL,
+                        tokens INTEGER NOT NULL,
+                        bytes_sent INTEGER NOT NULL,
+                        histogram TEXT NOT NULL,
+                        PRIMARY KEY (resolution, series_id, bucket_start)
+                    ) WITHOUT ROWID;
+                ''')
+            self.tables_ready = True
+        return self.pool.connection()
+
+    def series_id(self, conn, provider, deployment):
+        conn.execute(
+            'INSERT OR IGNORE INTO metric_series (provider, deployment) VALUES (?, ?)',
+            (provider, deployment)
+        )
+        return conn.execute(
+            'SELECT id FROM metric_series WHERE provider = ? AND deployment = ?', (provider, deployment)
+        ).fetchone()[0]
+
+    def record_run(self, task_id, provider, deployment, results, stats, status='completed', session_id=None):
+        """Append a finished run, its pages and their rollups; re-recording a task_id is ignored"""
+        now = time.time()
+        started_at = (stats.get('provider_metrics') or {}).get('start_time') or now
+        summary = stats.get('summary', {})
+        cache = stats.get('cache', {})
+        requests = stats.get('requests', {})
+        percentiles = (stats.get('performance', {}).get('latency') or {}).get('percentiles') or {}
+
+        try:
+            with self.connection() as conn:
+                # Take the write lock up front, rollup histograms are read-merge-write
+                conn.execute('BEGIN IMMEDIATE')
+                series_id = self.series_id(conn, provider, deployment or 'default')
+                cursor = conn.execute('''
+                    INSERT OR IGNORE INTO run_metrics (
+                        task_id, series_id, session_id, status, started_at, finished_at,
+                        total_pages, successful_pages, cached_pages, total_tokens, bytes_sent,
+                        requests_made, retries, mean_latency, p50_latency, p95_latency, p99_latency
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (
+                    task_id, series_id, session_id, status, started_at, now,
+                    summary.get('total_pages', 0), summary.get('successful_pages', 0), cache.get('cached_pages', 0),
+                    stats.get('token_usage', {}).get('total_tokens', 0), stats.get('payload', {}).get('total_bytes_sent', 0),
+                    requests.get('requests_made', 0), requests.get('retries', 0),
+                    percentiles.get('mean'), percentiles.get('p50'), percentiles.get('p95'), percentiles.get('p99')
+                ))
+                if not cursor.rowcount:
+                    return
+
+                run_id = cursor.lastrowid
+                page_rows = [(
+                    series_id,
+                    run_id,
+                    page.get('completed_at') or now,
+                    page.get('page_number', 0),
+                    int(page.get('status') == 'success'),
+                    int(bool(page.get('cached'))),
+                    page.get('attempts', 1),
+                    page.get('response_time'),
+                    page.get('tokens_used') or 0,
+                    page.get('bytes_sent') or 0
+                ) for page in results]
+                conn.executemany('INSERT INTO page_metrics VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', page_rows)
+
+                self.update_rollups(conn, series_id, page_rows)
+                self.prune(conn, now)
+        except Exception as e:
+            print(f"Error recording run metrics: {e}")
+
+    def update_rollups(self, conn, series_id, page_rows):
+        """Fold page rows into every rollup resolution"""
+        for resolution in ROLLUP_RETENTION_DAYS:
+            buckets = {}
+            for _, _, ts, _, success, cached, _, response_time, tokens_used, bytes_sent in page_rows:
+                bucket = buckets.setdefault(int(ts // resolution * resolution), {
+                    'pages': 0, 'errors': 0, 'cached': 0, 'tokens': 0, 'bytes_sent': 0, 'histogram': LatencyHistogram()
+                })
+                bucket['pages'] += 1
+                bucket['errors'] += 1 - success
+                bucket['cached'] += cached
+                bucket['tokens'] += tokens_used
+                bucket['bytes_sent'] += bytes_sent
+                # Only live successful requests count towards latency
+                if success and not cached and response_time is not None:
+                    bucket['histogram'].record(response_time)
+
+            for bucket_start, bucket in buckets.items():
+                row = conn.execute(
+                    'SELECT histogram FROM metric_rollups WHERE resolution = ? AND series_id = ? AND bucket_start = ?',
+                    (resolution, series_id, bucket_start)
+                ).fetchone()
+                histogram = bucket['histogram']
+                if row:
+                    histogram.merge(LatencyHistogram.from_dict(json.loads(row['histogram'])))
+                conn.execute('''
+                    INSERT INTO metric_rollups (resolution, series_id, bucket_start, pages, errors, cached, tokens, bytes_sent, histogram)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(resolution, series_id, bucket_start) DO UPDATE SET
+                        pages = pages + excluded.pages,
+                        errors = errors + excluded.errors,
+                        cached = cached + excluded.cached,
+                        tokens = tokens + excluded.tokens,
+                        bytes_sent = bytes_sent + excluded.bytes_sent,
+                        histogram = excluded.histogram
+                ''', (resolution, series_id, bucket_start, bucket['pages'], bucket['errors'], bucket['cached'],
+                      bucket['tokens'], bucket['bytes_sent'], json.dumps(histogram.to_dict())))
+
+    def prune(self, conn, now):
+        """Drop raw pages, runs and rollups past their retention"""
+        if METRICS_RAW_RETENTION_DAYS > 0:
+            conn.execute('DELETE FROM page_metrics WHERE ts < ?', (now - METRICS_RAW_RETENTION_DAYS * 86400,))
+        if METRICS_RUN_RETENTION_DAYS > 0:
+            conn.execute('DELETE FROM run_metrics WHERE finished_at < ?', (now - METRICS_RUN_RETENTION_DAYS * 86400,))
+        for resolution, retention_days in ROLLUP_RETENTION_DAYS.items():
+            if retention_days > 0:
+                conn.execute(
+                    'DELETE FROM metric_rollups WHERE resolution = ? AND bucket_start < ?',
+                    (resolution, now - retention_days * 86400)
+                )
+
+    def pick_resolution(self, start, end):
+        """Finest rollup still retained at start that keeps a series under METRICS_MAX_POINTS"""
+        now = time.time()
+        for resolution, retention_days in sorted(ROLLUP_RETENTION_DAYS.items()):
+            retained = retention_days <= 0 or start >= now - retention_days * 86400
+            if retained and (end - start) / resolution <= METRICS_MAX_POINTS:
+                return resolution
+        return max(ROLLUP_RETENTION_DAYS)
+
+    def series_filter(self, provider, deployment):
+        """WHERE clause and parameters selecting series by provider and deployment"""
+        clauses = []
+        params = []
+        if provider:
+            clauses.append('s.provider = ?')
+            params.append(provider)
+        if deployment:
+            clauses.append('s.deployment = ?')
+            params.append(deployment)
+        return ''.join(f' AND {clause}' for clause in clauses), params
+
+    def query_series(self, provider=None, deployment=None, start=None, end=None, resolution=None):
+        """Rolled-up points per provider/deployment in [start, end), epoch seconds"""
+        end = end or time.time()
+        start = start or end - 86400
+        if resolution not in ROLLUP_RETENTION_DAYS:
+            resolution = self.pick_resolution(start, end)
+        where, params = self.series_filter(provider, deployment)
+
+        with self.connection() as conn:
+            rows = conn.execute(f'''
+                SELECT s.provider, s.deployment, r.bucket_start, r.pages, r.errors, r.cached, r.tokens, r.bytes_sent, r.histogram
+                FROM metric_rollups r JOIN metric_series s ON s.id = r.series_id
+                WHERE r.resolution = ? AND r.bucket_start >= ? AND r.bucket_start < ?{where}
+                ORDER BY s.provider, s.deployment, r.bucket_start
+            ''', [resolution, int(start // resolution * resolution), end, *params]).fetchall()
+
+        series = {}
+        for row in rows:
+            summary = LatencyHistogram.from_dict(json.loads(row['histogram'])).summary()
+            points = series.setdefault((row['provider'], row['deployment']), [])
+            points.append({
+                'time': row['bucket_start'],
+                'pages': row['pages'],
+                'errors': row['errors'],
+                'error_rate': row['errors'] / row['pages'] * 100 if row['pages'] else 0,
+                'cached': row['cached'],
+                'tokens': row['tokens'],
+                'bytes_sent': row['bytes_sent'],
+                'mean': summary['mean'],
+                'p50': summary['p50'],
+                'p95': summary['p95'],
+                'p99': summary['p99']
+            })
+
+        return {
+            'resolution': resolution,
+            'start': start,
+            'end': end,
+            'series': [
+                {'provider': provider, 'deployment': deployment, 'points': points}
+                for (provider, deployment), points in series.items()
+            ]
+        }
+
+    def query_runs(self, provider=None, deployment=None, start=None, end=None, limit=100):
+        """Runs finished in [start, end), newest first"""
+        end = end or time.time()
+        start = start or 0
+        where, params = self.series_filter(provider, deployment)
+
+        with self.connection() as conn:
+            rows = conn.execute(f'''
+                SELECT s.provider, s.deployment, r.task_id, r.session_id, r.status, r.started_at, r.finished_at,
+                       r.total_pages, r.successful_pages, r.cached_pages, r.total_tokens, r.bytes_sent,
+                       r.requests_made, r.retries, r.mean_latency, r.p50_latency, r.p95_latency, r.p99_latency
+                FROM run_metrics r JOIN metric_series s ON s.id = r.series_id
+                WHERE r.finished_at >= ? AND r.finished_at < ?{where}
+                ORDER BY r.finished_at DESC
+                LIMIT ?
+            ''', [start, end, *params, limit]).fetchall()
+        return [dict(row) for row in rows]
+
+    def query_pages(self, provider=None, deployment=None, start=None, end=None, limit=1000):
+        """Raw page metrics in [start, end) within METRICS_RAW_RETENTION_DAYS, oldest first"""
+        end = end or time.time()
+        start = start or end - 3600
+        where, params = self.series_filter(provider, deployment)
+
+        with self.connection() as conn:
+            rows = conn.execute(f'''
+                SELECT s.provider, s.deployment, r.task_id, p.ts, p.page_number, p.success, p.cached,
+                       p.attempts, p.response_time, p.tokens_used, p.bytes_sent
+                FROM page_metrics p
+                JOIN metric_series s ON s.id = p.series_id
+                JOIN run_metrics r ON r.id = p.run_id
+                WHERE p.ts >= ? AND p.ts < ?{where}
+                ORDER BY p.ts
+                LIMIT ?
+            ''', [start, end, *params, limit]).fetchall()
+        return [dict(row) for row in rows]
+
+# Process-wide store instance
+metrics_store = MetricsStore()
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Offline stand-in for the Azure OpenAI chat-completions and Vertex AI predict APIs.
+Point a provider config at it to benchmark the OCR pipeline without cloud access:
+
+    azure: "endpoint": "http://localhost:8089"
+    gcp:   "api_endpoint": "http://localhost:8089", "anonymous_credentials": true
+
+Latency, error and 429 rates and token usage are configurable, and a fixed seed
+makes every run draw the same sequence of outcomes.
+"""
+
+import argparse
+import asyncio
+import math
+import os
+import random
+import time
+import uuid
+from collections import deque
+
+from aiohttp import web
+
+MOCK_TEXT = "Dies ist ein simulierter OCR-Text der Mock-Provider-Seite."
+
+class MockBehaviour:
+    """Draws latency, failures and token usage for each simulated request"""
+
+    def __init__(self, args):
+        self.args = args
+        self.random = random.Random(args.seed)
+        self.requests = deque()
+        self.stats = {'requests': 0, 'success': 0, 'errors': 0, 'rate_limited': 0}
+
+    def latency(self):
+        """Seconds to wait before answering"""
+        args = self.args
+        if args.latency_distribution == 'fixed':
+            value = args.latency_median
+        elif args.latency_distribution == 'uniform':
+            value = self.random.uniform(args.latency_min, args.latency_max)
+        elif args.latency_distribution == 'normal':
+            value = self.random.gauss(args.latency_median, args.latency_sigma)
+        else:
+            # Log-normal: median latency_median, heavy right tail controlled by latency_sigma
+            value = self.random.lognormvariate(math.log(args.latency_median), args.latency_sigma)
+        return min(max(value, args.latency_min), args.latency_max)
+
+    def over_quota(self):
+        """Enforce --rpm like a real quota, on top of the random 429 rate"""
+        if not self.args.rpm:
+            return False
+        now = time.monotonic()
+        while self.requests and now - self.requests[0] >= 60:
+            self.requests.popleft()
+        if len(self.requests) >= self.args.rpm:
+            return True
+        self.requests.append(now)
+        return False
+
+    def outcome(self):
+        """'rate_limited', 'error' or 'success' for the next request"""
+        self.stats['requests'] += 1
+        draw = self.random.random()
+        if self.over_quota() or draw < self.args.rate_limit_rate:
+            self.stats['rate_limited'] += 1
+            return 'rate_limited'
+        if draw < self.args.rate_limit_rate + self.args.error_rate:
+            self.stats['errors'] += 1
+            return 'error'
+        self.stats['success'] += 1
+        return 'success'
+
+    def usage(self):
+        prompt_tokens = max(int(self.random.gauss(self.args.prompt_tokens, self.args.prompt_tokens * 0.1)), 1)
+        completion_tokens = max(int(self.random.gauss(self.args.completion_tokens, self.args.completion_tokens * 0.2)), 1)
+        return {
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'total_tokens': prompt_tokens + completion_tokens
+        }
+
+    def rate_limit_headers(self):
+        retry_after = self.args.retry_after
+        return {
+            'retry-after': str(max(math.ceil(retry_after), 1)),
+            'retry-after-ms': str(int(retry_after * 1000)),
+            'x-ratelimit-remaining-requests': '0',
+            'x-ratelimit-reset-requests': f'{retry_after}s'
+        }
+
+async def azure_chat_completions(request):
+    """POST /openai/deployments/{deployment}/chat/completions"""
+    behaviour = request.app['behaviour']
+    await request.read()
+    outcome = behaviour.outcome()
+    await asyncio.sleep(behaviour.latency())
+
+    if outcome == 'rate_limited':
+        return web.json_response({
+            'error': {'code': '429', 'message': 'Requests to the ChatCompletions_Create Operation have exceeded the rate limit.'}
+        }, status=429, headers=behaviour.rate_limit_headers())
+    if outcome == 'error':
+        return web.json_response({
+            'error': {'code': 'InternalServerError', 'message': 'Simulated server error'}
+        }, status=500)
+
+    return web.json_response({
+        'id': f'chatcmpl-{uuid.uuid4().hex}',
+        'object': 'chat.completion',
+        'created': int(time.time()),
+        'model': request.match_info['deployment'],
+        'choices': [{
+            'index': 0,
+            'message': {'role': 'assistant', 'content': MOCK_TEXT},
+            'finish_reason': 'stop'
+        }],
+        'usage': behaviour.usage()
+    }, headers={'x-ratelimit-remaining-requests': str(behaviour.args.rpm or 1000)})
+
+async def vertex_predict(request):
+    """POST /v1/projects/{project}/locations/{location}/endpoints/{endpoint}:predict"""
+    behaviour = request.app['behaviour']
+    await request.read()
+    outcome = behaviour.outcome()
+    await asyncio.sleep(behaviour.latency())
+
+    if outcome == 'rate_limited':
+        return web.json_response({
+            'error': {'code': 429, 'message': 'Quota exceeded for online prediction requests.', 'status': 'RESOURCE_EXHAUSTED'}
+        }, status=429, headers=behaviour.rate_limit_headers())
+    if outcome == 'error':
+        return web.json_response({
+            'error': {'code': 503, 'message': 'Simulated backend error', 'status': 'UNAVAILABLE'}
+        }, status=503)
+
+    return web.json_response({
+        'predictions': [{'text': MOCK_TEXT, 'usage': behaviour.usage()}],
+        'deployedModelId': request.match_info['endpoint']
+    })
+
+async def get_stats(request):
+    return web.json_response(request.app['behaviour'].stats)
+
+async def health(request):
+    return web.json_response({'status': 'ok'})
+
+def create_app(args):
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+    app['behaviour'] = MockBehaviour(args)
+    app.router.add_post('/openai/deployments/{deployment}/chat/completions', azure_chat_completions)
+    app.router.add_post(r'/v1/projects/{project}/locations/{location}/endpoints/{endpoint:[^/:]+}:predict', vertex_predict)
+    app.router.add_get('/stats', get_stats)
+    app.router.add_get('/health', health)
+    return app
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Mock Azure OpenAI / Vertex AI server for offline benchmarks')
+    parser.add_argument('--host', default=os.getenv('MOCK_HOST', '127.0.0.1'))
+    parser.add_argument('--port', type=int, default=int(os.getenv('MOCK_PORT', 8089)))
+    parser.add_argument('--seed', type=int, default=int(os.getenv('MOCK_SEED', 42)))
+    parser.add_argument('--latency-distribution', choices=['lognormal', 'normal', 'uniform', 'fixed'],
+                        default=os.getenv('MOCK_LATENCY_DISTRIBUTION', 'lognormal'))
+    parser.add_argument('--latency-median', type=float, default=float(os.getenv('MOCK_LATENCY_MEDIAN', 1.0)),
+                        help='median (lognormal/fixed) or mean (normal) latency in seconds')
+    parser.add_argument('--latency-sigma', type=float, default=float(os.getenv('MOCK_LATENCY_SIGMA', 0.5)))
+    parser.add_argument('--latency-min', type=float, default=float(os.getenv('MOCK_LATENCY_MIN', 0.0)))
+    parser.add_argument('--latency-max', type=float, default=float(os.getenv('MOCK_LATENCY_MAX', 30.0)))
+    parser.add_argument('--error-rate', type=float, default=float(os.getenv('MOCK_ERROR_RATE', 0.0)),
+                        help='share of requests answered with 500/503')
+    parser.add_argument('--rate-limit-rate', type=float, default=float(os.getenv('MOCK_RATE_LIMIT_RATE', 0.0)),
+                        help='share of requests answered with 429')
+    parser.add_argument('--rpm', type=int, default=int(os.getenv('MOCK_RPM', 0)),
+                        help='requests per minute before every request gets 429, 0 = unlimited')
+    parser.add_argument('--retry-after', type=float, default=float(os.getenv('MOCK_RETRY_AFTER', 1.0)),
+                        help='seconds announced in retry-after on 429')
+    parser.add_argument('--prompt-tokens', type=int, default=int(os.getenv('MOCK_PROMPT_TOKENS', 1100)))
+    parser.add_argument('--completion-tokens', type=int, default=int(os.getenv('MOCK_COMPLETION_TOKENS', 400)))
+    return parser.parse_args(argv)
+
+def main():
+    args = parse_args()
+    print(f"🧪 Mock provider server on http://{args.host}:{args.port}")
+    print(f"   Latenz: {args.latency_distribution} (Median {args.latency_median}s), "
+          f"Fehlerrate: {args.error_rate:.0%}, 429-Rate: {args.rate_limit_rate:.0%}, RPM: {args.rpm or 'unbegrenzt'}")
+    web.run_app(create_app(args), host=args.host, port=args.port, print=None)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+PDF page rendering for OCR.
+Rasterizes PDF pages to images on a process pool so rendering uses all cores.
+Pages go through a bounded window, so only a few decoded images are held at
+once no matter how long the document is.
+"""
+
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+import fitz  # PyMuPDF
+from PIL import Image
+
+# Rendering resolution, override per job with "render_dpi"
+RENDER_DPI = int(os.getenv('RENDER_DPI', 150))
+RENDER_WORKERS = int(os.getenv('RENDER_WORKERS', os.cpu_count() or 1))
+# Pages rendered ahead of the OCR stage; caps the decoded images held in memory
+MAX_PAGES_IN_MEMORY = int(os.getenv('MAX_PAGES_IN_MEMORY', RENDER_WORKERS * 2))
+
+# Created on first use so importing this module never forks
+render_executor = None
+
+def get_render_executor():
+    """Get the shared executor used for rendering"""
+    global render_executor
+    if render_executor is None:
+        if multiprocessing.current_process().daemon:
+            # Celery prefork child, which may not start a process pool: OCR subtasks already
+            # spread pages across the worker processes. One thread, MuPDF is not thread-safe
+            render_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='pdf-render')
+        else:
+            render_executor = ProcessPoolExecutor(max_workers=RENDER_WORKERS)
+    return render_executor
+
+def get_page_count(file_path):
+    """Get the number of pages in a PDF"""
+    with fitz.open(file_path) as doc:
+        return doc.page_count
+
+def render_page(file_path, page_index, dpi=RENDER_DPI):
+    """Render one PDF page to an RGB image - runs inside a worker process"""
+    with fitz.open(file_path) as doc:
+        pixmap = doc.load_page(page_index).get_pixmap(dpi=dpi)
+    return Image.frombytes('RGB', (pixmap.width, pixmap.height), pixmap.samples)
+
+def iter_rendered_pages(file_path, dpi=None, max_pending=None):
+    """Render the pages of a PDF in parallel, yielding (page_number, image) as each one finishes.
+    The next page is only submitted once the consumer has taken one, which provides backpressure."""
+    dpi = dpi or RENDER_DPI
+    executor = get_render_executor()
+    page_indexes = iter(range(get_page_count(file_path)))
+    pending = {}
+    
+    def submit_next():
+        page_index = next(page_indexes, None)
+        if page_index is not None:
+            pending[executor.submit(render_page, file_path, page_index, dpi)] = page_index + 1
+    
+    try:
+        for _ in range(max_pending or MAX_PAGES_IN_MEMORY):
+            submit_next()
+        
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                page_number = pending.pop(future)
+                yield page_number, future.result()
+                submit_next()
+    finally:
+        # Consumer stopped early - don't render pages nobody will read
+        for future in pending:
+            future.cancel()
+
+async def aiter_rendered_pages(file_path, dpi=None, max_pending=None, page_numbers=None):
+    """Async version of iter_rendered_pages for event-loop based pipelines.
+    page_numbers (1-based) restricts rendering to a subset of the document."""
+    dpi = dpi or RENDER_DPI
+    loop = asyncio.get_running_loop()
+    executor = get_render_executor()
+    if page_numbers is None:
+        page_count = await loop.run_in_executor(executor, get_page_count, file_path)
+        page_indexes = iter(range(page_count))
+    else:
+        page_indexes = iter(page_number - 1 for page_number in page_numbers)
+    pending = {}
+    
+    def submit_next():
+        page_index = next(page_indexes, None)
+        if page_index is not None:
+            future = asyncio.wrap_future(executor.submit(render_page, file_path, page_index, dpi))
+            pending[future] = page_index + 1
+    
+    try:
+        for _ in range(max_pending or MAX_PAGES_IN_MEMORY):
+            submit_next()
+        
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                page_number = pending.pop(future)
+                yield page_number, future.result()
+                submit_next()
+    finally:
+        for future in pending:
+            future.cancel()
@@ -0,0 +1,101 @@
+"""
+Throttled progress reporting for distributed OCR runs.
+Pages finish across many subtasks at once. Writing the task state and pushing
+an event for each one would cost a backend write per page, so updates are
+coalesced: progress is published when PROGRESS_INTERVAL seconds have passed for
+the whole run (one Redis slot shared by every worker), when it has moved by
+PROGRESS_MIN_DELTA percent, and always when a subtask finishes.
+"""
+
+import os
+import time
+from collections import deque
+
+# Seconds between progress updates of one run, across all workers
+PROGRESS_INTERVAL = float(os.getenv('PROGRESS_INTERVAL', 1.0))
+# Percentage points that force an update before the interval is up
+PROGRESS_MIN_DELTA = float(os.getenv('PROGRESS_MIN_DELTA', 10.0))
+# Seconds of recent completions the current throughput is measured over
+PROGRESS_THROUGHPUT_WINDOW = float(os.getenv('PROGRESS_THROUGHPUT_WINDOW', 30.0))
+
+def progress_key(task_id):
+    return f"task:{task_id}:progress"
+
+def start_progress(client, task_id, total_pages, ttl):
+    """Create the run's shared counters and return its first progress payload"""
+    pipe = client.pipeline()
+    pipe.hset(progress_key(task_id), mapping={
+        'total_pages': total_pages,
+        'pages_completed': 0,
+        'pages_in_flight': 0,
+        'started_at': time.time()
+    })
+    pipe.expire(progress_key(task_id), ttl)
+    pipe.execute()
+    return {'progress': 0, 'pages_completed': 0, 'total_pages': total_pages, 'pages_in_flight': 0,
+            'throughput': 0, 'eta': None}
+
+class ProgressReporter:
+    """Progress of one subtask's pages folded into the run's counters, published when due"""
+
+    def __init__(self, client, task_id, publish):
+        self.client = client
+        self.key = progress_key(task_id)
+        self.slot_key = f"task:{task_id}:progress_slot"
+        # publish(payload) writes the task state and pushes the event
+        self.publish = publish
+        self.reported_in_flight = 0
+        self.last_percent = None
+        self.samples = deque()
+
+    def update(self, pipe, pages_done=0, in_flight=0, force=False):
+        """Execute pipe with this subtask's counter changes appended and publish if due.
+        Returns the results of the commands the caller queued on pipe."""
+        queued = len(pipe)
+        if pages_done:
+            pipe.hincrby(self.key, 'pages_completed', pages_done)
+        # Only the change is sent, so the field sums the pages in flight of every subtask
+        if in_flight != self.reported_in_flight:
+            pipe.hincrby(self.key, 'pages_in_flight', in_flight - self.reported_in_flight)
+            self.reported_in_flight = in_flight
+        pipe.hmget(self.key, 'total_pages', 'pages_completed', 'pages_in_flight', 'started_at')
+        pipe.set(self.slot_key, 1, nx=True, px=int(PROGRESS_INTERVAL * 1000))
+        results = pipe.execute()
+
+        payload = self.payload(*results[-2])
+        percent_moved = self.last_percent is None or payload['progress'] - self.last_percent >= PROGRESS_MIN_DELTA
+        if force or results[-1] or percent_moved:
+            self.last_percent = payload['progress']
+            self.publish(payload)
+        return results[:queued]
+
+    def flush(self):
+        """Publish the final state of this subtask, nothing left in flight"""
+        self.update(self.client.pipeline(), in_flight=0, force=True)
+
+    def payload(self, total_pages, pages_completed, pages_in_flight, started_at):
+        """Compact progress: pages done and in flight, current throughput and ETA"""
+        now = time.time()
+        total_pages = int(total_pages or 0)
+        pages_completed = int(pages_completed or 0)
+        started_at = float(started_at or now)
+
+        self.samples.append((now, pages_completed))
+        while len(self.samples) > 2 and now - self.samples[0][0] > PROGRESS_THROUGHPUT_WINDOW:
+            self.samples.popleft()
+        # Rate over the recent window, or since the run started while the window is too short
+        first_time, first_completed = self.samples[0]
+        if now - first_time >= 1 and pages_completed > first_completed:
+            throughput = (pages_completed - first_completed) / (now - first_time)
+        else:
+            throughput = pages_completed / (now - started_at) if now > started_at else 0
+
+        remaining = max(total_pages - pages_completed, 0)
+        return {
+            'progress': round(pages_completed / total_pages * 100, 1) if total_pages else 0,
+            'pages_completed': pages_completed,
+            'total_pages': total_pages,
+            'pages_in_flight': max(int(pages_in_flight or 0), 0),
+            'throughput': round(throughput, 2),
+            'eta': round(remaining / throughput, 1) if throughput > 0 else None
+        }
@@ -0,0 +1,337 @@
+"""
+Adaptive rate limiting for OCR providers.
+Each provider gets a controller that keeps requests-per-minute and
+tokens-per-minute within budget, honours retry-after and rate-limit headers,
+and adjusts how many requests are in flight AIMD style: the limit grows by
+about one per round of successful requests and halves on every 429.
+With a RedisRateBudget attached, the windows, pauses and the AIMD limit are
+shared by every worker sending to the same provider deployment.
+"""
+
+import asyncio
+import email.utils
+import os
+import random
+import re
+import time
+import uuid
+from collections import deque
+
+# Budgets per provider, 0 means unlimited; override per provider with "rpm_limit" / "tpm_limit"
+OCR_RPM_LIMIT = int(os.getenv('OCR_RPM_LIMIT', 0))
+OCR_TPM_LIMIT = int(os.getenv('OCR_TPM_LIMIT', 0))
+# Token estimate per request until real usage has been seen
+OCR_ESTIMATED_TOKENS = int(os.getenv('OCR_ESTIMATED_TOKENS', 1500))
+# Times a rate-limited request is sent again before the page is marked failed
+RATE_LIMIT_MAX_RETRIES = int(os.getenv('RATE_LIMIT_MAX_RETRIES', 5))
+# Backoff when the provider gives no retry-after, doubled per consecutive 429
+RATE_LIMIT_BACKOFF = float(os.getenv('RATE_LIMIT_BACKOFF', 1.0))
+RATE_LIMIT_MAX_BACKOFF = float(os.getenv('RATE_LIMIT_MAX_BACKOFF', 60.0))
+
+# Seconds the shared AIMD limit and pauses are remembered after the last request
+RATE_LIMIT_STATE_TTL = int(os.getenv('RATE_LIMIT_STATE_TTL', 3600))
+
+WINDOW_SECONDS = 60.0
+ADDITIVE_INCREASE = 1.0
+MULTIPLICATIVE_DECREASE = 0.5
+
+class RateLimited(Exception):
+    """The provider rejected a request because a quota was exhausted"""
+
+    def __init__(self, message, headers=None):
+        super().__init__(message)
+        self.headers = headers or {}
+
+def parse_duration(value):
+    """Parse rate-limit reset values like '20ms', '1s' or '6m0s' into seconds"""
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    units = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+    parts = re.findall(r'([\d.]+)(ms|s|m|h)', str(value))
+    return sum(float(amount) * units[unit] for amount, unit in parts) if parts else None
+
+def parse_retry_after(headers):
+    """Get the wait a provider asked for, in seconds, or None"""
+    headers = {key.lower(): value for key, value in (headers or {}).items()}
+    if 'retry-after-ms' in headers:
+        return float(headers['retry-after-ms']) / 1000
+    retry_after = headers.get('retry-after')
+    if retry_after is None:
+        return None
+    try:
+        return float(retry_after)
+    except ValueError:
+        # HTTP date form
+        retry_at = email.utils.parsedate_to_datetime(retry_after)
+        return max(retry_at.timestamp() - time.time(), 0) if retry_at else None
+
+# KEYS: requests zset (ticket id -> time), tokens hash (ticket id -> tokens), state hash
+# ARGV: ticket id, rpm limit, tpm limit, estimated tokens, window, state ttl
+# Returns {seconds to wait or "0" when reserved, shared limit or ""}; floats travel as strings
+RESERVE_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local window = tonumber(ARGV[5])
+for _, ticket in ipairs(redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', now - window)) do
+    redis.call('HDEL', KEYS[2], ticket)
+end
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - window)
+
+local limit = redis.call('HGET', KEYS[3], 'limit') or ''
+local wait = (tonumber(redis.call('HGET', KEYS[3], 'blocked_until')) or 0) - now
+local rpm = tonumber(ARGV[2])
+if rpm > 0 and redis.call('ZCARD', KEYS[1]) >= rpm then
+    local oldest = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+    wait = math.max(wait, tonumber(oldest[2]) + window - now)
+end
+local tpm = tonumber(ARGV[3])
+local estimated = tonumber(ARGV[4])
+if tpm > 0 then
+    local used = 0
+    for _, tokens in ipairs(redis.call('HVALS', KEYS[2])) do
+        used = used + tonumber(tokens)
+    end
+    local entries = redis.call('ZRANGE', KEYS[1], 0, -1, 'WITHSCORES')
+    for i = 1, #entries, 2 do
+        if used + estimated <= tpm then
+            break
+        end
+        used = used - (tonumber(redis.call('HGET', KEYS[2], entries[i])) or 0)
+        wait = math.max(wait, tonumber(entries[i + 1]) + window - now)
+    end
+end
+if wait > 0 then
+    return {tostring(wait), limit}
+end
+
+redis.call('ZADD', KEYS[1], now, ARGV[1])
+redis.call('HSET', KEYS[2], ARGV[1], estimated)
+redis.call('EXPIRE', KEYS[1], math.ceil(window))
+redis.call('EXPIRE', KEYS[2], math.ceil(window))
+redis.call('EXPIRE', KEYS[3], ARGV[6])
+return {'0', limit}
+"""
+
+# KEYS: tokens hash, state hash
+# ARGV: ticket id, tokens used, seconds to pause everyone, AIMD limit, state ttl
+UPDATE_SCRIPT = """
+if redis.call('HEXISTS', KEYS[1], ARGV[1]) == 1 then
+    redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+end
+local pause = tonumber(ARGV[3])
+if pause > 0 then
+    local time = redis.call('TIME')
+    local until_time = tonumber(time[1]) + tonumber(time[2]) / 1000000 + pause
+    local blocked_until = tonumber(redis.call('HGET', KEYS[2], 'blocked_until')) or 0
+    if until_time > blocked_until then
+        redis.call('HSET', KEYS[2], 'blocked_until', tostring(until_time))
+    end
+end
+redis.call('HSET', KEYS[2], 'limit', ARGV[4])
+redis.call('EXPIRE', KEYS[2], ARGV[5])
+"""
+
+class RedisRateBudget:
+    """RPM/TPM windows, pauses and AIMD limit of one provider deployment, kept in Redis for all workers"""
+
+    def __init__(self, client, name):
+        self.keys = [f"ratelimit:{name}:{kind}" for kind in ('requests', 'tokens', 'state')]
+        self.reserve_script = client.register_script(RESERVE_SCRIPT)
+        self.update_script = client.register_script(UPDATE_SCRIPT)
+
+    def reserve(self, ticket_id, rpm_limit, tpm_limit, estimated_tokens):
+        """Take a slot in the windows if the request fits, returning (seconds to wait, shared limit or None)"""
+        wait, limit = self.reserve_script(
+            keys=self.keys,
+            args=[ticket_id, rpm_limit, tpm_limit, round(estimated_tokens), WINDOW_SECONDS, RATE_LIMIT_STATE_TTL]
+        )
+        return float(wait), float(limit) if limit else None
+
+    def update(self, ticket_id, tokens, pause, limit):
+        """Correct a reservation to the tokens really used, pause everyone and store the limit"""
+        self.update_script(
+            keys=self.keys[1:],
+            args=[ticket_id, round(tokens), max(pause, 0), limit, RATE_LIMIT_STATE_TTL]
+        )
+
+class AdaptiveRateLimiter:
+    """AIMD concurrency limit plus sliding-window RPM/TPM budgets for one provider"""
+
+    def __init__(self, max_concurrency, rpm_limit=OCR_RPM_LIMIT, tpm_limit=OCR_TPM_LIMIT):
+        self.max_concurrency = max_concurrency
+        self.rpm_limit = rpm_limit
+        self.tpm_limit = tpm_limit
+        # Start at the ceiling, the first 429 brings the limit down
+        self.limit = float(max_concurrency)
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        self.consecutive_limited = 0
+        self.requests = deque()
+        # [timestamp, tokens] entries, a reservation is corrected once real usage is known
+        self.tokens = deque()
+        self.average_tokens = float(OCR_ESTIMATED_TOKENS)
+        self.condition = None
+        self.shared = None
+        self.stats = {'throttled_requests': 0, 'rate_limited': 0, 'wait_time': 0.0}
+
+    def share(self, budget):
+        """Keep the windows, pauses and limit in a RedisRateBudget shared with other workers"""
+        self.shared = budget
+
+    def get_condition(self):
+        # Created lazily so it binds to the running event loop
+        if self.condition is None:
+            self.condition = asyncio.Condition()
+        return self.condition
+
+    def prune(self, now):
+        while self.requests and now - self.requests[0] >= WINDOW_SECONDS:
+            self.requests.popleft()
+        while self.tokens and now - self.tokens[0][0] >= WINDOW_SECONDS:
+            self.tokens.popleft()
+
+    def wait_time(self, estimated_tokens):
+        """Seconds until a request fits the budgets, 0 if it fits now"""
+        now = time.monotonic()
+        self.prune(now)
+        waits = [self.blocked_until - now]
+        if self.shared is not None:
+            # The windows are checked in Redis when the slot is reserved
+            return max(waits)
+        if self.rpm_limit and len(self.requests) >= self.rpm_limit:
+            waits.append(self.requests[0] + WINDOW_SECONDS - now)
+        if self.tpm_limit:
+            used = sum(tokens for _, tokens in self.tokens)
+            # Free the oldest entries until the request fits
+            for timestamp, tokens in self.tokens:
+                if used + estimated_tokens <= self.tpm_limit:
+                    break
+                used -= tokens
+                waits.append(timestamp + WINDOW_SECONDS - now)
+        return max(waits)
+
+    async def acquire(self):
+        """Wait for a request slot, returning a ticket to pass to on_success/on_rate_limited"""
+        estimated_tokens = self.average_tokens
+        started = time.monotonic()
+        waited = False
+        ticket_id = uuid.uuid4().hex
+        condition = self.get_condition()
+        while True:
+            async with condition:
+                while True:
+                    wait = self.wait_time(estimated_tokens)
+                    if wait <= 0 and self.in_flight < max(int(self.limit), 1):
+                        break
+                    waited = True
+                    try:
+                        await asyncio.wait_for(condition.wait(), wait if wait > 0 else None)
+                    except asyncio.TimeoutError:
+                        pass
+                # Hold the slot while the shared budget is asked, so the lock is free for the Redis round trip
+                self.in_flight += 1
+            if self.shared is None:
+                break
+            try:
+                wait, shared_limit = await self.run_shared(
+                    self.shared.reserve, ticket_id, self.rpm_limit, self.tpm_limit, estimated_tokens
+                )
+            except BaseException:
+                await self.release()
+                raise
+            # Other workers' 429s lower the limit here too
+            if shared_limit is not None:
+                self.limit = min(max(shared_limit, 1.0), self.max_concurrency)
+            if wait <= 0:
+                break
+            # Shared budget exhausted: give the slot back until the window has room again
+            await self.release()
+            waited = True
+            await asyncio.sleep(wait)
+
+        now = time.monotonic()
+        if waited:
+            self.stats['throttled_requests'] += 1
+            self.stats['wait_time'] += now - started
+        self.requests.append(now)
+        ticket = [now, estimated_tokens, ticket_id]
+        self.tokens.append(ticket)
+        return ticket
+
+    async def run_shared(self, func, *args):
+        """Run a blocking Redis call of the shared budget off the event loop"""
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+    async def publish(self, ticket):
+        """Share a request's real token usage, any pause and the adapted limit with the other workers"""
+        if self.shared is not None:
+            await self.run_shared(self.shared.update, ticket[2], ticket[1], self.blocked_until - time.monotonic(), self.limit)
+
+    async def release(self):
+        condition = self.get_condition()
+        async with condition:
+            self.in_flight -= 1
+            condition.notify_all()
+
+    def on_success(self, ticket, tokens_used=None, headers=None):
+        """Additive increase, record real token usage and respect remaining-quota headers"""
+        if tokens_used:
+            ticket[1] = tokens_used
+            self.average_tokens = 0.8 * self.average_tokens + 0.2 * tokens_used
+        self.consecutive_limited = 0
+        # About +1 per round of `limit` successful requests
+        self.limit = min(self.limit + ADDITIVE_INCREASE / max(self.limit, 1), self.max_concurrency)
+
+        headers = {key.lower(): value for key, value in (headers or {}).items()}
+        for kind in ('requests', 'tokens'):
+            remaining = headers.get(f'x-ratelimit-remaining-{kind}')
+            reset = parse_duration(headers.get(f'x-ratelimit-reset-{kind}'))
+            if remaining is not None and reset and float(remaining) < (1 if kind == 'requests' else self.average_tokens):
+                self.blocked_until = max(self.blocked_until, time.monotonic() + reset)
+
+    def on_rate_limited(self, ticket, headers=None):
+        """Multiplicative decrease and pause until the provider's retry-after, or backoff with jitter"""
+        self.stats['rate_limited'] += 1
+        self.consecutive_limited += 1
+        self.limit = max(self.limit * MULTIPLICATIVE_DECREASE, 1.0)
+
+        retry_after = parse_retry_after(headers)
+        if retry_after is None:
+            backoff = min(RATE_LIMIT_BACKOFF * 2 ** (self.consecutive_limited - 1), RATE_LIMIT_MAX_BACKOFF)
+            # Full jitter spreads retries of concurrent requests apart
+            retry_after = random.uniform(0, backoff)
+        self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+        # A rejected request used no tokens
+        ticket[1] = 0
+
+    async def call(self, request, tokens_of=None):
+        """Run request() within the budgets, retrying when it raises RateLimited.
+        request returns (result, headers); tokens_of(result) gives the tokens it used."""
+        for attempt in range(RATE_LIMIT_MAX_RETRIES + 1):
+            ticket = await self.acquire()
+            try:
+                result, headers = await request()
+            except RateLimited as e:
+                self.on_rate_limited(ticket, e.headers)
+                await self.publish(ticket)
+                if attempt == RATE_LIMIT_MAX_RETRIES:
+                    raise
+                continue
+            finally:
+                await self.release()
+            self.on_success(ticket, tokens_of(result) if tokens_of else None, headers)
+            await self.publish(ticket)
+            return result
+
+    def get_stats(self):
+        return {
+            **self.stats,
+            'concurrency_limit': round(self.limit, 2),
+            'rpm_limit': self.rpm_limit,
+            'tpm_limit': self.tpm_limit,
+            'average_tokens_per_request': round(self.average_tokens, 1)
+        }
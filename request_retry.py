@@ -0,0 +1,113 @@
+"""
+Retries and hedged requests for OCR provider calls.
+Transient failures (timeouts, dropped connections, 5xx) are retried with
+exponential backoff and jitter. Optionally, when a request runs longer than
+the provider's usual tail latency, a duplicate is sent and whichever answer
+arrives first is used. Attempts and hedges are counted separately so the
+statistics still show how the provider itself behaved.
+"""
+
+import asyncio
+import os
+import random
+
+import aiohttp
+import httpx
+import openai
+
+from config_flags import parse_flag
+
+# Extra attempts after the first one, override per provider with "max_retries"
+OCR_MAX_RETRIES = int(os.getenv('OCR_MAX_RETRIES', 2))
+# Seconds, doubled per attempt
+OCR_RETRY_BACKOFF = float(os.getenv('OCR_RETRY_BACKOFF', 0.5))
+OCR_RETRY_MAX_BACKOFF = float(os.getenv('OCR_RETRY_MAX_BACKOFF', 30.0))
+# Hedging, override per provider with "hedge", "hedge_percentile"
+OCR_HEDGE_ENABLED = os.getenv('OCR_HEDGE_ENABLED', 'false').lower() == 'true'
+OCR_HEDGE_PERCENTILE = float(os.getenv('OCR_HEDGE_PERCENTILE', 95))
+# Latency samples needed before the percentile is trusted as a hedge threshold
+OCR_HEDGE_MIN_SAMPLES = int(os.getenv('OCR_HEDGE_MIN_SAMPLES', 20))
+# Never hedge sooner than this many seconds
+OCR_HEDGE_MIN_DELAY = float(os.getenv('OCR_HEDGE_MIN_DELAY', 1.0))
+
+RETRYABLE_STATUS = {408, 409, 500, 502, 503, 504}
+RETRYABLE_ERRORS = (
+    asyncio.TimeoutError,
+    ConnectionError,
+    httpx.TransportError,
+    aiohttp.ClientConnectionError,
+    aiohttp.ServerTimeoutError,
+    openai.APIConnectionError
+)
+
+def is_retryable(error):
+    """Check whether an error is worth another attempt"""
+    if isinstance(error, RETRYABLE_ERRORS):
+        return True
+    # openai.APIStatusError has status_code, aiohttp.ClientResponseError has status
+    status = getattr(error, 'status_code', None) or getattr(error, 'status', None)
+    return status in RETRYABLE_STATUS
+
+class RetryPolicy:
+    """Retry and hedging settings for one provider"""
+
+    def __init__(self, config):
+        self.max_retries = int(config.get('max_retries', OCR_MAX_RETRIES))
+        self.backoff = float(config.get('retry_backoff', OCR_RETRY_BACKOFF))
+        self.hedge = parse_flag(config.get('hedge'), OCR_HEDGE_ENABLED)
+        self.hedge_percentile = float(config.get('hedge_percentile', OCR_HEDGE_PERCENTILE))
+
+    def retry_delay(self, attempt):
+        """Full-jitter exponential backoff"""
+        return random.uniform(0, min(self.backoff * 2 ** attempt, OCR_RETRY_MAX_BACKOFF))
+
+    def hedge_delay(self, latency):
+        """Seconds to wait before sending a duplicate request, or None to not hedge"""
+        if not self.hedge or latency.count < OCR_HEDGE_MIN_SAMPLES:
+            return None
+        return max(latency.percentile(self.hedge_percentile), OCR_HEDGE_MIN_DELAY)
+
+    async def run(self, request, latency, metrics, info):
+        """Run request() with retries and hedging; fills info with attempts/hedged/hedge_won"""
+        info.update({'attempts': 0, 'hedged': False, 'hedge_won': False})
+        for attempt in range(self.max_retries + 1):
+            info['attempts'] += 1
+            metrics['attempts'] += 1
+            try:
+                return await self.run_hedged(request, latency, metrics, info)
+            except Exception as e:
+                if attempt == self.max_retries or not is_retryable(e):
+                    raise
+                metrics['retries'] += 1
+                await asyncio.sleep(self.retry_delay(attempt))
+
+    async def run_hedged(self, request, latency, metrics, info):
+        delay = self.hedge_delay(latency)
+        if delay is None:
+            return await request()
+
+        primary = asyncio.ensure_future(request())
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done:
+            return primary.result()
+
+        # Slower than the provider's usual tail, race a duplicate against it
+        info['hedged'] = True
+        metrics['hedged_requests'] += 1
+        hedge = asyncio.ensure_future(request())
+        pending = {primary, hedge}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            info['hedge_won'] = True
+                            metrics['hedge_wins'] += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
@@ -0,0 +1,170 @@
+"""
+Content-addressed cache for OCR results.
+Results are keyed by the hash of the exact image payload sent plus everything
+else that shapes the answer (provider, endpoint and deployment, prompt, temperature).
+A small in-memory LRU sits in front of a SQLite table shared by all processes.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from config_flags import parse_flag
+from db_pool import SQLitePool
+
+OCR_CACHE_ENABLED = os.getenv('OCR_CACHE_ENABLED', 'false').lower() == 'true'
+OCR_CACHE_DB = os.getenv('OCR_CACHE_DB', 'ocr_cache.db')
+OCR_CACHE_MEMORY_ENTRIES = int(os.getenv('OCR_CACHE_MEMORY_ENTRIES', 1000))
+OCR_CACHE_MAX_ENTRIES = int(os.getenv('OCR_CACHE_MAX_ENTRIES', 100000))
+# Entries older than this many seconds are evicted, 0 keeps them forever
+OCR_CACHE_MAX_AGE = int(os.getenv('OCR_CACHE_MAX_AGE', 7 * 24 * 3600))
+# Run eviction on disk every this many writes
+PRUNE_INTERVAL = 100
+
+def cache_enabled(config):
+    """Check whether caching is switched on for a provider config"""
+    return parse_flag(config.get('cache'), OCR_CACHE_ENABLED)
+
+def make_cache_key(image_data, provider, model, prompt, temperature):
+    """Build the cache key for one OCR request.
+    model has to name the model globally - Azure deployment names are only unique
+    within one resource, so pass the endpoint together with the deployment."""
+    image_hash = hashlib.sha256(image_data.encode() if isinstance(image_data, str) else image_data).hexdigest()
+    request = json.dumps([provider, model, prompt, temperature], sort_keys=True)
+    return hashlib.sha256(f"{image_hash}:{request}".encode()).hexdigest()
+
+def mark_cached(result):
+    """Flag a result served from the cache; no request was made, so its latency stays out of the statistics"""
+    result['original_response_time'] = result['response_time']
+    result['response_time'] = 0
+    result['bytes_sent'] = 0
+    result['cached'] = True
+    return result
+
+class OCRResultCache:
+    """Two-tier (memory LRU + SQLite) OCR result cache with hit/miss counters"""
+
+    def __init__(self, db_path=OCR_CACHE_DB, memory_entries=OCR_CACHE_MEMORY_ENTRIES,
+                 max_entries=OCR_CACHE_MAX_ENTRIES, max_age=OCR_CACHE_MAX_AGE):
+        self.db_path = db_path
+        self.pool = SQLitePool(db_path)
+        self.memory_entries = memory_entries
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.table_ready = False
+        self.writes = 0
+        self.counters = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'writes': 0, 'evictions': 0}
+
+    def connection(self):
+        """Borrow a pooled connection to the cache database, creating the table on first use"""
+        if not self.table_ready:
+            with self.pool.connection() as conn:
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS ocr_cache (
+                        cache_key TEXT PRIMARY KEY,
+                        result TEXT NOT NULL,
+                        created_at REAL NOT NULL,
+                        last_used REAL NOT NULL
+                    )
+                ''')
+                conn.execute('CREATE INDEX IF NOT EXISTS idx_ocr_cache_last_used ON ocr_cache(last_used)')
+            self.table_ready = True
+        return self.pool.connection()
+
+    def is_expired(self, created_at):
+        return self.max_age > 0 and time.time() - created_at > self.max_age
+
+    def remember(self, key, result, created_at):
+        """Put an entry in the memory tier, dropping the least recently used one when full"""
+        with self.lock:
+            self.memory[key] = (result, created_at)
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.memory_entries:
+                self.memory.popitem(last=False)
+
+    def get(self, key):
+        """Look up a cached result, or return None"""
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry and not self.is_expired(entry[1]):
+                self.memory.move_to_end(key)
+                self.counters['memory_hits'] += 1
+                return dict(entry[0])
+            if entry:
+                del self.memory[key]
+
+        try:
+            with self.connection() as conn:
+                row = conn.execute(
+                    'SELECT result, created_at FROM ocr_cache WHERE cache_key = ?', (key,)
+                ).fetchone()
+                if row and not self.is_expired(row[1]):
+                    conn.execute('UPDATE ocr_cache SET last_used = ? WHERE cache_key = ?', (time.time(), key))
+        except Exception as e:
+            print(f"Error reading OCR cache: {e}")
+            row = None
+
+        if row and not self.is_expired(row[1]):
+            result = json.loads(row[0])
+            self.remember(key, result, row[1])
+            with self.lock:
+                self.counters['disk_hits'] += 1
+            return dict(result)
+
+        with self.lock:
+            self.counters['misses'] += 1
+        return None
+
+    def put(self, key, result):
+        """Store a successful result in both tiers"""
+        created_at = time.time()
+        # A copy, so the caller changing its result later doesn't change the cached one
+        self.remember(key, dict(result), created_at)
+
+        try:
+            with self.connection() as conn:
+                conn.execute('''
+                    INSERT OR REPLACE INTO ocr_cache (cache_key, result, created_at, last_used)
+                    VALUES (?, ?, ?, ?)
+                ''', (key, json.dumps(result), created_at, created_at))
+
+                with self.lock:
+                    self.counters['writes'] += 1
+                    self.writes += 1
+                    should_prune = self.writes % PRUNE_INTERVAL == 0
+                if should_prune:
+                    self.prune(conn)
+        except Exception as e:
+            print(f"Error writing OCR cache: {e}")
+
+    def prune(self, conn):
+        """Evict entries past the age limit, then the least recently used ones over the size limit"""
+        evicted = 0
+        if self.max_age > 0:
+            evicted += conn.execute(
+                'DELETE FROM ocr_cache WHERE created_at < ?', (time.time() - self.max_age,)
+            ).rowcount
+        evicted += conn.execute('''
+            DELETE FROM ocr_cache WHERE cache_key IN (
+                SELECT cache_key FROM ocr_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?
+            )
+        ''', (self.max_entries,)).rowcount
+        with self.lock:
+            self.counters['evictions'] += evicted
+
+    def get_stats(self):
+        """Get hit/miss counters for the statistics output"""
+        with self.lock:
+            stats = dict(self.counters)
+            stats['memory_entries'] = len(self.memory)
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['memory_hits'] + stats['disk_hits']) / lookups * 100 if lookups else 0.0
+        return stats
+
+# Process-wide cache instance
+ocr_cache = OCRResultCache()
@@ -1,25 +1,32 @@
 import os
+import glob
 import json
+import re
 import time
 import asyncio
 import aiohttp
-from datetime import datetime
-from celery import Celery
+from celery import Celery, chord
+from celery.exceptions import Ignore
+from flask_socketio import SocketIO
 import redis
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
-from reportlab.lib import colors
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet
-import PyPDF2
-from PIL import Image
-import io
-import base64
-from openai import AzureOpenAI
-from google.cloud import aiplatform
-from google.auth import credentials
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+from openai import AsyncAzureOpenAI, RateLimitError
+import google.auth
+import google.auth.credentials
+import google.auth.transport.requests
+from google.oauth2 import service_account
 import numpy as np
 import pandas as pd
+from image_encoder import encode_image, get_encoding_options
+from latency_histogram import LatencyHistogram, latency_report, load_from_redis, queue_add_to_redis
+from metrics_store import metrics_store
+from pdf_renderer import aiter_rendered_pages, get_page_count
+from progress_reporter import ProgressReporter, start_progress
+from rate_limiter import OCR_RPM_LIMIT, OCR_TPM_LIMIT, AdaptiveRateLimiter, RateLimited, RedisRateBudget
+from request_retry import RetryPolicy
+from result_cache import cache_enabled, make_cache_key, mark_cached, ocr_cache
+from test_corpus import generate_corpus
 
 # Initialize Celery
 celery = Celery('mistral_ocr_test')
@@ -36,246 +43,393 @@ celery.conf.update({
 # Initialize Redis
 redis_client = redis.from_url(os.getenv('REDIS_URL', 'redis://localhost:6379/0'))
 
+# Pages per OCR subtask: 1 spreads every page across the workers, larger ranges
+# let one subtask keep max_concurrency requests in flight with a warm connection pool
+OCR_PAGES_PER_TASK = max(int(os.getenv('OCR_PAGES_PER_TASK', 8)), 1)
+# Seconds progress counters, streamed pages and cancel flags are kept in Redis
+TASK_STATE_TTL = int(os.getenv('TASK_STATE_TTL', 3600))
+
+# Write-only SocketIO client, events reach the browsers through the web server's Redis message queue
+socketio = SocketIO(message_queue=os.getenv('REDIS_URL', 'redis://localhost:6379/0'))
+
+def emit_task_event(event, task_id, payload):
+    """Push an event to the clients subscribed to a task"""
+    try:
+        socketio.emit(event, {'task_id': task_id, **payload}, to=task_id)
+    except Exception as e:
+        print(f"Error emitting {event} for task {task_id}: {e}")
+
+# Shared pool for blocking work (credential refresh, image encoding) so it never stalls the event loop
+blocking_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('OCR_EXECUTOR_WORKERS', 8)),
+    thread_name_prefix='ocr-blocking'
+)
+
+GCP_SCOPES = ['https://www.googleapis.com/auth/cloud-platform']
+
+OCR_PROMPT = "Please extract all text from this image. Return only the extracted text without any additional formatting or explanations."
+
 class OCRProvider:
     """Base class for OCR providers"""
     
+    provider_name = None
+    # Deployment or endpoint the latency histogram is kept under
+    deployment = None
+    
     def __init__(self, config):
         self.config = config
+        # Upper bound on pages in flight against this provider at once
+        self.max_concurrency = int(config.get('max_concurrency', os.getenv('OCR_MAX_CONCURRENCY', 4)))
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.pages_in_flight = 0
+        self.request_timeout = float(config.get('request_timeout', os.getenv('OCR_REQUEST_TIMEOUT', 120)))
         self.metrics = {
             'total_tokens': 0,
             'input_tokens': 0,
             'output_tokens': 0,
             'requests_made': 0,
             'errors': [],
-            'response_times': [],
+            'bytes_sent': 0,
+            'cache_hits': 0,
+            'cache_misses': 0,
+            # Attempts per page (1 + retries) and duplicate requests sent to cut tail latency
+            'attempts': 0,
+            'retries': 0,
+            'hedged_requests': 0,
+            'hedge_wins': 0,
             'start_time': time.time()
         }
+        self.encoding = get_encoding_options(config)
+        self.use_cache = cache_enabled(config)
+        # Bounded-memory latency distributions: each completed request, and each page end to end
+        self.latency = LatencyHistogram()
+        self.page_latency = LatencyHistogram()
+        # Distribution the hedge threshold is taken from, see share_state
+        self.hedge_latency = self.latency
+        self.retry_policy = RetryPolicy(config)
+        # Adapts requests in flight below max_concurrency to the provider's quotas
+        self.rate_limiter = AdaptiveRateLimiter(
+            self.max_concurrency,
+            int(config.get('rpm_limit', OCR_RPM_LIMIT)),
+            int(config.get('tpm_limit', OCR_TPM_LIMIT))
+        )
     
     async def process_page(self, page_image, page_number):
-        """Process a single page - to be implemented by subclasses"""
+        """Encode a page, answer it from the cache or send it to the provider, and record the result"""
+        start_time = time.time()
+        request_info = {}
+        
+        try:
+            encoded = await self.run_blocking(self.encode_image, page_image)
+            cache_key, cached = await self.get_cached_page(encoded, page_number)
+            if cached:
+                return cached
+            
+            async def send_request():
+                # Counted per request sent, so retries and hedges show up in the totals
+                request_start = time.time()
+                self.metrics['requests_made'] += 1
+                self.metrics['bytes_sent'] += encoded['bytes_sent']
+                response, headers = await self.request_page(encoded)
+                response_time = time.time() - request_start
+                self.record_latency(response_time)
+                return (response, response_time), headers
+            
+            # Within the rate limits, with retries and hedging
+            response, response_time = await self.call_provider(
+                send_request,
+                request_info,
+                lambda result: self.parse_response(result[0])[1].get('total_tokens', 0)
+            )
+            
+            text, usage = self.parse_response(response)
+            self.metrics['input_tokens'] += usage.get('prompt_tokens', 0)
+            self.metrics['output_tokens'] += usage.get('completion_tokens', 0)
+            self.metrics['total_tokens'] += usage.get('total_tokens', 0)
+            
+            result = {
+                'page_number': page_number,
+                'text': text,
+                'response_time': response_time,
+                'tokens_used': usage.get('total_tokens', 0),
+                'bytes_sent': encoded['bytes_sent'],
+                'image_format': encoded['format'],
+                'status': 'success',
+                **request_info
+            }
+            if cache_key:
+                await self.run_blocking(ocr_cache.put, cache_key, result)
+            return result
+            
+        except Exception as e:
+            error_info = {
+                'page_number': page_number,
+                'error': str(e),
+                'response_time': time.time() - start_time,
+                'status': 'error',
+                **request_info
+            }
+            self.metrics['errors'].append(error_info)
+            return error_info
+    
+    async def request_page(self, encoded):
+        """Send one request for an encoded page, returning (response, headers).
+        Raises RateLimited when the provider rejects it for quota - implemented by subclasses"""
         raise NotImplementedError
     
+    def parse_response(self, response):
+        """Get (text, usage) from a response, usage holding prompt/completion/total_tokens"""
+        raise NotImplementedError
+    
+    async def run_blocking(self, func, *args):
+        """Run a blocking call on the shared executor"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(blocking_executor, func, *args)
+    
+    def encode_image(self, page_image):
+        """Encode a page image with this provider's encoding options"""
+        return encode_image(page_image, self.encoding)
+    
+    def cache_identity(self):
+        """(model, prompt, temperature) that shape this provider's answer - used in cache keys"""
+        raise NotImplementedError
+    
+    async def get_cached_page(self, encoded, page_number):
+        """Look up a page in the result cache, returning (cache_key, cached result or None)"""
+        if not self.use_cache:
+            return None, None
+        
+        cache_key = make_cache_key(encoded['data'], self.provider_name, *self.cache_identity())
+        cached = await self.run_blocking(ocr_cache.get, cache_key)
+        if not cached:
+            self.metrics['cache_misses'] += 1
+            return cache_key, None
+        
+        self.metrics['cache_hits'] += 1
+        mark_cached(cached).update({
+            'page_number': page_number,
+            'attempts': 0,
+            'hedged': False,
+            'hedge_won': False,
+            'page_latency': 0
+        })
+        return cache_key, cached
+    
+    async def call_provider(self, send_request, request_info, tokens_of=None):
+        """Send a request within the rate limits, retrying transient errors and hedging slow calls.
+        send_request returns ((response, response_time), headers); request_info receives attempt counts."""
+        page_start = time.time()
+        try:
+            return await self.retry_policy.run(
+                lambda: self.rate_limiter.call(send_request, tokens_of),
+                self.hedge_latency, self.metrics, request_info
+            )
+        finally:
+            request_info['page_latency'] = time.time() - page_start
+            self.page_latency.record(request_info['page_latency'])
+    
+    def record_latency(self, response_time):
+        self.latency.record(response_time)
+        if self.hedge_latency is not self.latency:
+            self.hedge_latency.record(response_time)
+    
+    def share_state(self, client):
+        """Join the state every worker keeps in Redis for this provider/deployment: the rate budgets
+        and AIMD limit, and the latency history the hedge threshold is taken from.
+        A subtask sees too few pages of its own for either."""
+        name = f"{self.provider_name}:{self.deployment}"
+        self.rate_limiter.share(RedisRateBudget(client, name))
+        self.hedge_latency = load_from_redis(client).get(name, LatencyHistogram()).merge(self.latency)
+    
+    async def close(self):
+        """Release pooled connections - overridden by subclasses that hold any"""
+        pass
+    
     def get_metrics(self):
         """Get current metrics"""
         self.metrics['total_time'] = time.time() - self.metrics['start_time']
+        self.metrics['latency'] = self.latency.to_dict()
+        self.metrics['page_latency'] = self.page_latency.to_dict()
+        self.metrics['rate_limit'] = self.rate_limiter.get_stats()
         return self.metrics
 
 class AzureMistralProvider(OCRProvider):
     """Azure OpenAI Mistral provider"""
     
+    provider_name = 'azure'
+    temperature = 0.1
+    
     def __init__(self, config):
         super().__init__(config)
-        self.client = AzureOpenAI(
+        # Keep-alive pool sized to the in-flight limit
+        self.http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=self.max_concurrency,
+                max_keepalive_connections=self.max_concurrency
+            ),
+            timeout=self.request_timeout
+        )
+        self.client = AsyncAzureOpenAI(
             api_key=config['api_key'],
             api_version=config.get('api_version', '2024-02-15-preview'),
-            azure_endpoint=config['endpoint']
+            azure_endpoint=config['endpoint'],
+            http_client=self.http_client,
+            # 429s are retried by the rate limiter, which also adapts concurrency to them
+            max_retries=0
         )
+        self.endpoint = config['endpoint']
         self.deployment_name = config['deployment_name']
+        self.deployment = self.deployment_name
     
-    async def process_page(self, page_image, page_number):
-        """Process a single page with Azure Mistral"""
-        start_time = time.time()
+    async def request_page(self, encoded):
+        """Send a page to the Azure Mistral deployment"""
+        messages = [
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": OCR_PROMPT
+                    },
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": f"data:{encoded['mime_type']};base64,{encoded['data']}"
+                        }
+                    }
+                ]
+            }
+        ]
         
         try:
-            # Convert image to base64
-            img_buffer = io.BytesIO()
-            page_image.save(img_buffer, format='PNG')
-            img_str = base64.b64encode(img_buffer.getvalue()).decode()
-            
-            # Prepare the request
-            messages = [
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": "Please extract all text from this image. Return only the extracted text without any additional formatting or explanations."
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/png;base64,{img_str}"
-                            }
-                        }
-                    ]
-                }
-            ]
-            
-            # Make API call
-            response = self.client.chat.completions.create(
+            raw_response = await self.client.chat.completions.with_raw_response.create(
                 model=self.deployment_name,
                 messages=messages,
                 max_tokens=4000,
-                temperature=0.1
+                temperature=self.temperature
             )
-            
-            # Update metrics
-            response_time = time.time() - start_time
-            self.metrics['response_times'].append(response_time)
-            self.metrics['requests_made'] += 1
-            
-            if hasattr(response.usage, 'prompt_tokens'):
-                self.metrics['input_tokens'] += response.usage.prompt_tokens
-            if hasattr(response.usage, 'completion_tokens'):
-                self.metrics['output_tokens'] += response.usage.completion_tokens
-            if hasattr(response.usage, 'total_tokens'):
-                self.metrics['total_tokens'] += response.usage.total_tokens
-            
-            return {
-                'page_number': page_number,
-                'text': response.choices[0].message.content,
-                'response_time': response_time,
-                'tokens_used': getattr(response.usage, 'total_tokens', 0),
-                'status': 'success'
-            }
-            
-        except Exception as e:
-            error_info = {
-                'page_number': page_number,
-                'error': str(e),
-                'response_time': time.time() - start_time,
-                'status': 'error'
-            }
-            self.metrics['errors'].append(error_info)
-            return error_info
+        except RateLimitError as e:
+            raise RateLimited(str(e), e.response.headers)
+        return raw_response.parse(), raw_response.headers
+    
+    def parse_response(self, response):
+        usage = response.usage
+        return response.choices[0].message.content, {
+            'prompt_tokens': getattr(usage, 'prompt_tokens', 0) or 0,
+            'completion_tokens': getattr(usage, 'completion_tokens', 0) or 0,
+            'total_tokens': getattr(usage, 'total_tokens', 0) or 0
+        }
+    
+    def cache_identity(self):
+        return f"{self.endpoint.rstrip('/')}/{self.deployment_name}", OCR_PROMPT, self.temperature
+    
+    async def close(self):
+        """Close the pooled HTTP client"""
+        await self.client.close()
 
 class GCPMistralProvider(OCRProvider):
-    """GCP Mistral provider"""
+    """GCP Mistral provider calling the Vertex AI predict REST API over aiohttp"""
+    
+    provider_name = 'gcp'
     
     def __init__(self, config):
-        super().__init__(self, config)
+        super().__init__(config)
         
-        # Initialize GCP client
-        if 'service_account_path' in config:
-            credentials_obj = credentials.Credentials.from_service_account_file(
-                config['service_account_path']
+        # Load GCP credentials - anonymous only for api_endpoint overrides such as the mock server
+        if config.get('anonymous_credentials'):
+            self.credentials = google.auth.credentials.AnonymousCredentials()
+        elif 'service_account_path' in config:
+            self.credentials = service_account.Credentials.from_service_account_file(
+                config['service_account_path'], scopes=GCP_SCOPES
             )
-            aiplatform.init(credentials=credentials_obj)
         else:
-            aiplatform.init()
+            self.credentials, _ = google.auth.default(scopes=GCP_SCOPES)
         
         self.project_id = config['project_id']
         self.location = config.get('location', 'us-central1')
         self.endpoint_id = config['endpoint_id']
+        self.deployment = self.endpoint_id
         
-        # Get the endpoint
-        self.endpoint = aiplatform.Endpoint(
-            endpoint_name=f"projects/{self.project_id}/locations/{self.location}/endpoints/{self.endpoint_id}"
+        api_endpoint = config.get('api_endpoint') or f"https://{self.location}-aiplatform.googleapis.com"
+        self.predict_url = (
+            f"{api_endpoint.rstrip('/')}/v1/"
+            f"projects/{self.project_id}/locations/{self.location}/endpoints/{self.endpoint_id}:predict"
         )
+        # Created lazily so the session binds to the running event loop
+        self.session = None
     
-    async def process_page(self, page_image, page_number):
-        """Process a single page with GCP Mistral"""
-        start_time = time.time()
-        
-        try:
-            # Convert image to base64
-            img_buffer = io.BytesIO()
-            page_image.save(img_buffer, format='PNG')
-            img_str = base64.b64encode(img_buffer.getvalue()).decode()
-            
-            # Prepare the request
-            request_data = {
-                "instances": [
-                    {
-                        "prompt": "Please extract all text from this image. Return only the extracted text without any additional formatting or explanations.",
-                        "image": img_str
-                    }
-                ]
-            }
-            
-            # Make API call
-            response = self.endpoint.predict(request_data)
-            
-            # Update metrics
-            response_time = time.time() - start_time
-            self.metrics['response_times'].append(response_time)
-            self.metrics['requests_made'] += 1
-            
-            # Extract text from response (adjust based on actual GCP response format)
-            text = response.predictions[0] if response.predictions else ""
-            
-            return {
-                'page_number': page_number,
-                'text': text,
-                'response_time': response_time,
-                'tokens_used': 0,  # GCP might not provide token info
-                'status': 'success'
-            }
-            
-        except Exception as e:
-            error_info = {
-                'page_number': page_number,
-                'error': str(e),
-                'response_time': time.time() - start_time,
-                'status': 'error'
-            }
-            self.metrics['errors'].append(error_info)
-            return error_info
-
-def create_test_pdf(pages, filename, content_type="mixed"):
-    """Create a test PDF with specified number of pages"""
-    doc = SimpleDocTemplate(filename, pagesize=letter)
-    styles = getSampleStyleSheet()
-    story = []
+    def cache_identity(self):
+        return self.predict_url, OCR_PROMPT, None
     
-    for i in range(pages):
-        # Add page number
-        story.append(Paragraph(f"Page {i+1}", styles['Heading1']))
-        story.append(Spacer(1, 12))
-        
-        if content_type == "text_heavy":
-            # Add lots of text
-            for j in range(20):
-                story.append(Paragraph(
-                    f"This is paragraph {j+1} on page {i+1}. " * 5,
-                    styles['Normal']
-                ))
-        elif content_type == "image_heavy":
-            # Add text with image descriptions
-            story.append(Paragraph(
-                f"Page {i+1} contains an image with detailed text content. " * 10,
-                styles['Normal']
-            ))
-        else:  # mixed
-            # Add mixed content
-            story.append(Paragraph(
-                f"Page {i+1} contains mixed content with text and images. " * 8,
-                styles['Normal']
-            ))
+    def get_session(self):
+        """Get the pooled aiohttp session"""
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_concurrency),
+                timeout=aiohttp.ClientTimeout(total=self.request_timeout)
+            )
+        return self.session
+    
+    async def get_access_token(self):
+        """Get a valid OAuth token, refreshing it off the event loop when needed"""
+        if not self.credentials.valid:
+            await self.run_blocking(self.credentials.refresh, google.auth.transport.requests.Request())
+        return self.credentials.token
+    
+    async def request_page(self, encoded):
+        """Send a page to the Vertex AI endpoint"""
+        request_data = {
+            "instances": [
+                {
+                    "prompt": OCR_PROMPT,
+                    "image": encoded['data']
+                }
+            ]
+        }
         
-        story.append(Spacer(1, 12))
+        token = await self.get_access_token()
+        async with self.get_session().post(
+            self.predict_url,
+            json=request_data,
+            headers={'Authorization': f'Bearer {token}'}
+        ) as response:
+            # Vertex reports exhausted quota as 429 RESOURCE_EXHAUSTED
+            if response.status == 429:
+                raise RateLimited(f"429 Too Many Requests: {await response.text()}", dict(response.headers))
+            response.raise_for_status()
+            return await response.json(), dict(response.headers)
+    
+    def parse_response(self, response_json):
+        # Extract text from response (adjust based on actual GCP response format)
+        predictions = response_json.get('predictions', [])
+        prediction = predictions[0] if predictions else ""
+        if not isinstance(prediction, dict):
+            # GCP might not provide token info
+            return prediction, {}
+        return prediction.get('text', ''), prediction.get('usage', {})
     
-    doc.build(story)
+    async def close(self):
+        """Close the pooled aiohttp session"""
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
 
 @celery.task(bind=True)
 def generate_test_files(self, scenarios):
-    """Generate test PDF files for different scenarios"""
+    """Generate test PDF files for different scenarios, reusing files built before"""
     try:
-        files_created = []
-        
-        for scenario in scenarios:
-            pages = scenario.get('pages', 1)
-            content_type = scenario.get('content_type', 'mixed')
-            filename = f"test_files/test_{content_type}_{pages}pages_{int(time.time())}.pdf"
-            
-            create_test_pdf(pages, filename, content_type)
-            files_created.append({
-                'filename': filename,
-                'pages': pages,
-                'content_type': content_type,
-                'size_mb': os.path.getsize(filename) / (1024 * 1024)
-            })
-            
-            # Update progress
+        def report(files_done, total_files):
             self.update_state(
                 state='PROGRESS',
-                meta={'progress': len(files_created) / len(scenarios) * 100}
+                meta={'progress': files_done / total_files * 100 if total_files else 100}
             )
         
+        files_created = generate_corpus(scenarios, progress=report)
+        
         return {
             'status': 'completed',
             'files_created': files_created,
-            'total_files': len(files_created)
+            'total_files': len(files_created),
+            'reused_files': sum(file['reused'] for file in files_created)
         }
         
     except Exception as e:
@@ -284,141 +438,405 @@ def generate_test_files(self, scenarios):
             'error': str(e)
         }
 
+def get_provider_class(config):
+    """Get (config key, provider class) of the provider enabled in the config"""
+    if config.get('azure', {}).get('enabled'):
+        return 'azure', AzureMistralProvider
+    elif config.get('gcp', {}).get('enabled'):
+        return 'gcp', GCPMistralProvider
+    raise ValueError("No provider configured")
+
+def create_provider(config):
+    """Initialize the provider selected in the config"""
+    key, provider_class = get_provider_class(config)
+    return provider_class(config[key])
+
+def task_key(task_id, kind):
+    """Redis key for a run's shared state: 'pages' or 'cancelled'"""
+    return f"task:{task_id}:{kind}"
+
+def request_cancel(task_id):
+    """Ask a running OCR task to stop; subtasks finish their in-flight pages and skip the rest"""
+    redis_client.setex(task_key(task_id, 'cancelled'), TASK_STATE_TTL, 1)
+
+def is_cancelled(task_id):
+    return bool(redis_client.exists(task_key(task_id, 'cancelled')))
+
+def get_partial_results(task_id, start=0):
+    """Page results finished so far, in completion order, from index start on"""
+    return [json.loads(page) for page in redis_client.lrange(task_key(task_id, 'pages'), start, -1)]
+
+def expand_files(files):
+    """Expand glob patterns such as test_files/test_mixed_3pages_*.pdf; paths that match nothing
+    are kept so they show up as failed files"""
+    paths = []
+    for pattern in files:
+        paths.extend(sorted(glob.glob(pattern)) or [pattern])
+    return paths
+
+def plan_page_chunks(files, provider_name):
+    """Split files (paths or glob patterns) into (file_path, page_numbers) ranges of OCR_PAGES_PER_TASK pages.
+    Files that cannot be opened become error results instead of subtasks."""
+    chunks = []
+    failed_results = []
+    
+    for file_path in expand_files(files):
+        try:
+            page_count = get_page_count(file_path)
+        except Exception as e:
+            failed_results.append({
+                **file_page_info(file_path, provider_name),
+                'page_number': 0,
+                'error': str(e),
+                'status': 'error'
+            })
+            continue
+        
+        for first_page in range(1, page_count + 1, OCR_PAGES_PER_TASK):
+            chunks.append((file_path, list(range(first_page, min(first_page + OCR_PAGES_PER_TASK, page_count + 1)))))
+    
+    return chunks, failed_results
+
 @celery.task(bind=True)
 def process_ocr_task(self, file_path=None, config=None, test_config=None):
-    """Process OCR task with comprehensive metrics tracking"""
+    """Fan an OCR run out into page-range subtasks across the workers.
+    The task is replaced by a chord whose callback merges the results, so its id
+    resolves to the final statistics once every page is done."""
     try:
-        # Initialize provider based on config
-        if config.get('azure', {}).get('enabled'):
-            provider = AzureMistralProvider(config['azure'])
-        elif config.get('gcp', {}).get('enabled'):
-            provider = GCPMistralProvider(config['gcp'])
-        else:
-            raise ValueError("No provider configured")
+        provider_name = get_provider_class(config)[1].provider_name
+        files = test_config.get('files', []) if test_config else [file_path]
+        chunks, failed_results = plan_page_chunks(files, provider_name)
+        total_pages = sum(len(page_numbers) for _, page_numbers in chunks)
         
-        results = []
-        total_pages = 0
+        # Shared progress counters the subtasks increment
+        publish_progress(self.request.id, start_progress(redis_client, self.request.id, total_pages, TASK_STATE_TTL))
         
-        if test_config:
-            # Batch testing mode
-            test_files = test_config.get('files', [])
-            total_files = len(test_files)
-            
-            for i, test_file in enumerate(test_files):
-                file_results = await process_single_file(test_file, provider, self)
-                results.extend(file_results)
-                
-                # Update progress
-                progress = (i + 1) / total_files * 100
-                self.update_state(
-                    state='PROGRESS',
-                    meta={
-                        'progress': progress,
-                        'current_file': test_file,
-                        'files_processed': i + 1,
-                        'total_files': total_files
-                    }
-                )
-        else:
-            # Single file mode
-            results = await process_single_file(file_path, provider, self)
+        callback = aggregate_ocr_results.s(config, self.request.id, total_pages, failed_results)
+        if not chunks:
+            # Nothing to fan out, the callback reports the failed files (or an empty run) right away
+            return callback([])
+        
+        header = [ocr_pages_task.s(path, page_numbers, config, self.request.id) for path, page_numbers in chunks]
+        return self.replace(chord(header, callback))
+        
+    except Ignore:
+        # Raised by replace() once the chord has been scheduled
+        raise
+    except Exception as e:
+        emit_task_event('task_failed', self.request.id, {'status': 'failed', 'error': str(e)})
+        return {
+            'status': 'error',
+            'error': str(e)
+        }
+
+@celery.task(bind=True)
+def ocr_pages_task(self, file_path, page_numbers, config, parent_task_id):
+    """OCR one page range of a file - a chord member of process_ocr_task"""
+    if is_cancelled(parent_task_id):
+        return {'results': [], 'metrics': None, 'cancelled': True}
+    
+    try:
+        return asyncio.run(run_page_chunk(file_path, page_numbers, config, parent_task_id))
+    except Exception as e:
+        # Never fail the chord, a broken range shows up as failed pages
+        return {
+            'results': [{
+                **file_page_info(file_path, get_provider_class(config)[1].provider_name),
+                'page_number': page_number,
+                'error': str(e),
+                'status': 'error'
+            } for page_number in page_numbers],
+            'metrics': None,
+            'cancelled': False
+        }
+
+async def run_page_chunk(file_path, page_numbers, config, parent_task_id):
+    """Create a provider in this worker's event loop and OCR the pages with it"""
+    provider = create_provider(config)
+    reporter = ProgressReporter(redis_client, parent_task_id, lambda payload: publish_progress(parent_task_id, payload))
+    try:
+        await provider.run_blocking(provider.share_state, redis_client)
+        results, cancelled = await process_file_pages(file_path, provider, reporter, parent_task_id, page_numbers, config.get('render_dpi'))
+        return {
+            'results': results,
+            'metrics': provider.get_metrics(),
+            'provider': provider.provider_name,
+            'deployment': provider.deployment,
+            'cancelled': cancelled
+        }
+    finally:
+        # Always publish this range's final counts, even when the throttle would skip them
+        await provider.run_blocking(reporter.flush)
+        await provider.close()
+
+def merge_provider_metrics(metrics_list):
+    """Combine the metrics of all subtasks into one provider_metrics dict"""
+    merged = {'errors': [], 'rate_limit': {}}
+    latency = LatencyHistogram()
+    page_latency = LatencyHistogram()
+    
+    for metrics in metrics_list:
+        latency.merge(LatencyHistogram.from_dict(metrics.get('latency') or {}))
+        page_latency.merge(LatencyHistogram.from_dict(metrics.get('page_latency') or {}))
+        merged['errors'].extend(metrics.get('errors', []))
+        for key, value in metrics.get('rate_limit', {}).items():
+            # Counters add up, limits and averages are taken from the last subtask
+            if key in ('throttled_requests', 'rate_limited', 'wait_time'):
+                merged['rate_limit'][key] = merged['rate_limit'].get(key, 0) + value
+            else:
+                merged['rate_limit'][key] = value
+        for key, value in metrics.items():
+            if key in ('start_time', 'total_time') or not isinstance(value, (int, float)):
+                continue
+            merged[key] = merged.get(key, 0) + value
+    
+    # Wall-clock time from the first subtask's start to the last one's end
+    if metrics_list:
+        merged['start_time'] = min(metrics['start_time'] for metrics in metrics_list)
+        merged['total_time'] = max(metrics['start_time'] + metrics['total_time'] for metrics in metrics_list) - merged['start_time']
+    merged['latency'] = latency.to_dict()
+    merged['page_latency'] = page_latency.to_dict()
+    return merged, latency
+
+@celery.task(bind=True)
+def aggregate_ocr_results(self, chunk_results, config, parent_task_id, total_pages, failed_results=None):
+    """Chord callback: merge the subtask results and calculate the run's statistics"""
+    try:
+        results = list(failed_results or [])
+        for chunk in chunk_results:
+            results.extend(chunk['results'])
+        
+        chunks_with_metrics = [chunk for chunk in chunk_results if chunk.get('metrics')]
+        provider_metrics, latency = merge_provider_metrics([chunk['metrics'] for chunk in chunks_with_metrics])
+        cancelled = is_cancelled(parent_task_id) or any(chunk.get('cancelled') for chunk in chunk_results)
         
         # Calculate comprehensive statistics
-        stats = calculate_statistics(results, provider.get_metrics())
+        stats = calculate_statistics(results, provider_metrics)
+        
+        provider_name = get_provider_class(config)[1].provider_name
+        deployment = chunks_with_metrics[0]['deployment'] if chunks_with_metrics else None
+        
+        pipe = redis_client.pipeline()
+        # Fold this run's latencies into the provider/deployment histogram shared by all workers
+        if chunks_with_metrics:
+            queue_add_to_redis(pipe, f"{provider_name}:{deployment}", latency)
         
-        # Store statistics in Redis
+        # Store statistics in the session's hash, one field per statistics type
         session_id = config.get('session_id', 'default')
-        redis_client.setex(
-            f"stats:{session_id}:latest",
-            3600,
-            json.dumps(stats)
-        )
+        pipe.hset(f"stats:{session_id}", 'latest', json.dumps(stats))
+        pipe.expire(f"stats:{session_id}", 3600)
+        pipe.execute()
         
-        return {
-            'status': 'completed',
+        status = 'cancelled' if cancelled else 'completed'
+        # Durable history for trends beyond the Redis TTL
+        metrics_store.record_run(parent_task_id, provider_name, deployment, results, stats, status, session_id)
+        
+        result = {
+            'status': status,
             'results': results,
             'statistics': stats,
-            'total_pages': len(results)
+            'total_pages': len(results),
+            'planned_pages': total_pages
         }
+        emit_task_event(f'task_{status}', parent_task_id, {'status': status, 'result': result})
+        return result
         
     except Exception as e:
+        emit_task_event('task_failed', parent_task_id, {'status': 'failed', 'error': str(e)})
         return {
             'status': 'error',
             'error': str(e)
         }
 
-async def process_single_file(file_path, provider, task):
-    """Process a single PDF file"""
-    results = []
+async def ocr_page(provider, page_image, page_number):
+    """Send one page to the provider, respecting its in-flight limit"""
+    async with provider.semaphore:
+        provider.pages_in_flight += 1
+        try:
+            return await provider.process_page(page_image, page_number)
+        finally:
+            provider.pages_in_flight -= 1
+
+async def stream_file_pages(file_path, provider, dpi=None, page_numbers=None):
+    """Yield OCR results for a PDF as pages finish: render -> encode -> send -> emit.
+    At most MAX_PAGES_IN_MEMORY rendered pages wait for OCR and max_concurrency are being sent,
+    so memory stays flat whatever the document size."""
+    in_flight = set()
     
     try:
-        # Open PDF and extract pages
-        with open(file_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            total_pages = len(pdf_reader.pages)
+        async for page_number, page_image in aiter_rendered_pages(file_path, dpi, page_numbers=page_numbers):
+            # Backpressure: stop pulling rendered pages while the provider is saturated
+            while len(in_flight) >= provider.max_concurrency:
+                done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                for page_task in done:
+                    yield page_task.result()
             
-            for page_num in range(total_pages):
-                # Convert PDF page to image
-                page = pdf_reader.pages[page_num]
-                
-                # For simplicity, we'll create a text representation
-                # In a real implementation, you'd convert PDF pages to images
-                page_text = page.extract_text()
-                
-                # Process with OCR provider
-                result = await provider.process_page(page_text, page_num + 1)
+            in_flight.add(asyncio.create_task(ocr_page(provider, page_image, page_number)))
+        
+        while in_flight:
+            done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            for page_task in done:
+                yield page_task.result()
+    finally:
+        # Consumer stopped early (cancellation) - drop pages still being sent
+        for page_task in in_flight:
+            page_task.cancel()
+
+def content_type_from_filename(file_path):
+    """Get the content type encoded in generated test file names (test_<content_type>_<n>pages_...)"""
+    match = re.match(r'test_(.+?)_\d+pages', os.path.basename(file_path))
+    return match.group(1) if match else 'unknown'
+
+def file_page_info(file_path, provider_name):
+    """Grouping keys for the statistics breakdown"""
+    return {
+        'provider': provider_name,
+        'file': os.path.basename(file_path or ''),
+        'content_type': content_type_from_filename(file_path or '')
+    }
+
+def publish_progress(task_id, payload):
+    """Write the run's progress to the parent task id the client polls and push it to the room"""
+    process_ocr_task.update_state(task_id=task_id, state='PROGRESS', meta=payload)
+    emit_task_event('task_progress', task_id, {'status': 'running', **payload})
+
+def record_page_result(task_id, result, reporter, in_flight):
+    """Stream a finished page to Redis and the task's room in one round trip,
+    progress only goes out when the reporter's throttle allows.
+    Returns whether the run has been cancelled meanwhile."""
+    pipe = redis_client.pipeline()
+    pipe.rpush(task_key(task_id, 'pages'), json.dumps(result))
+    pipe.expire(task_key(task_id, 'pages'), TASK_STATE_TTL)
+    pipe.exists(task_key(task_id, 'cancelled'))
+    _, _, cancelled = reporter.update(pipe, pages_done=1, in_flight=in_flight)
+    
+    emit_task_event('page_completed', task_id, {
+        key: result.get(key) for key in ('provider', 'file', 'page_number', 'status', 'response_time', 'tokens_used', 'error')
+    })
+    return bool(cancelled)
+
+async def process_file_pages(file_path, provider, reporter, task_id, page_numbers=None, dpi=None):
+    """OCR pages of a PDF file, streaming each result as it finishes.
+    Returns (results, cancelled); a cancelled run keeps the pages already done."""
+    results = []
+    page_info = file_page_info(file_path, provider.provider_name)
+    cancelled = False
+    
+    try:
+        # Only the small result dicts are kept, page images are dropped once sent
+        pages = stream_file_pages(file_path, provider, dpi, page_numbers)
+        try:
+            async for result in pages:
+                result.update(page_info, completed_at=time.time())
                 results.append(result)
-                
-                # Update task progress
-                progress = (page_num + 1) / total_pages * 100
-                task.update_state(
-                    state='PROGRESS',
-                    meta={
-                        'progress': progress,
-                        'current_page': page_num + 1,
-                        'total_pages': total_pages
-                    }
-                )
-                
-                # Add small delay to avoid rate limits
-                await asyncio.sleep(0.1)
+                if await provider.run_blocking(record_page_result, task_id, result, reporter, provider.pages_in_flight):
+                    cancelled = True
+                    break
+        finally:
+            await pages.aclose()
     
     except Exception as e:
         results.append({
+            **page_info,
             'page_number': 0,
             'error': str(e),
             'status': 'error'
         })
     
-    return results
+    # Pages complete out of order
+    results.sort(key=lambda result: result['page_number'])
+    return results, cancelled
+
+# Columns pulled out of the result dicts for statistics; 'text' is never copied
+RESULT_COLUMNS = ['provider', 'file', 'content_type', 'page_number', 'status', 'response_time',
+                  'tokens_used', 'bytes_sent', 'cached', 'attempts', 'hedged']
+
+def results_frame(results):
+    """Load page results into one columnar frame, one row per page"""
+    frame = pd.DataFrame.from_records(results, columns=RESULT_COLUMNS)
+    frame['success'] = frame['status'].eq('success')
+    frame['cached'] = frame['cached'].eq(True)
+    frame['hedged'] = frame['hedged'].eq(True)
+    frame['attempts'] = frame['attempts'].astype(float).fillna(1)
+    frame[['tokens_used', 'bytes_sent']] = frame[['tokens_used', 'bytes_sent']].astype(float).fillna(0)
+    frame['response_time'] = frame['response_time'].astype(float)
+    frame['live_time'] = frame['response_time'].where(frame['success'] & ~frame['cached'])
+    frame[['provider', 'file', 'content_type']] = frame[['provider', 'file', 'content_type']].fillna('unknown')
+    return frame
+
+def aggregate_frame(frame, keys):
+    """Per-group page counts, latency, tokens and payload in one groupby pass"""
+    grouped = frame.groupby(keys, sort=True).agg(
+        total_pages=('status', 'size'),
+        successful_pages=('success', 'sum'),
+        cached_pages=('cached', 'sum'),
+        average_response_time=('live_time', 'mean'),
+        min_response_time=('live_time', 'min'),
+        max_response_time=('live_time', 'max'),
+        total_tokens=('tokens_used', 'sum'),
+        total_bytes_sent=('bytes_sent', 'sum')
+    )
+    grouped['p95_response_time'] = frame.groupby(keys, sort=True)['live_time'].quantile(0.95)
+    grouped['failed_pages'] = grouped['total_pages'] - grouped['successful_pages']
+    grouped['success_rate'] = grouped['successful_pages'] / grouped['total_pages'] * 100
+    grouped['average_tokens_per_page'] = grouped['total_tokens'] / grouped['successful_pages'].replace(0, np.nan)
+    return grouped.fillna(0).reset_index().to_dict('records')
 
 def calculate_statistics(results, provider_metrics):
     """Calculate comprehensive statistics from results and metrics"""
-    successful_results = [r for r in results if r.get('status') == 'success']
-    error_results = [r for r in results if r.get('status') == 'error']
+    frame = results_frame(results)
+    success = frame['success'].to_numpy()
+    live_times = frame['live_time'].dropna().to_numpy()
+    successful_count = int(success.sum())
     
     stats = {
         'summary': {
-            'total_pages': len(results),
-            'successful_pages': len(successful_results),
-            'failed_pages': len(error_results),
-            'success_rate': len(successful_results) / len(results) * 100 if results else 0
+            'total_pages': len(frame),
+            'successful_pages': successful_count,
+            'failed_pages': len(frame) - successful_count,
+            'success_rate': successful_count / len(frame) * 100 if len(frame) else 0
         },
         'performance': {
-            'average_response_time': np.mean([r.get('response_time', 0) for r in successful_results]) if successful_results else 0,
-            'min_response_time': min([r.get('response_time', 0) for r in successful_results]) if successful_results else 0,
-            'max_response_time': max([r.get('response_time', 0) for r in successful_results]) if successful_results else 0,
-            'total_processing_time': provider_metrics.get('total_time', 0)
+            'average_response_time': float(live_times.mean()) if live_times.size else 0,
+            'min_response_time': float(live_times.min()) if live_times.size else 0,
+            'max_response_time': float(live_times.max()) if live_times.size else 0,
+            'total_processing_time': provider_metrics.get('total_time', 0),
+            # Per request as the provider answered it, and per page including retries and hedges
+            'latency': latency_report(LatencyHistogram.from_dict(provider_metrics.get('latency') or {})),
+            'page_latency': latency_report(LatencyHistogram.from_dict(provider_metrics.get('page_latency') or {}))
+        },
+        'requests': {
+            'requests_made': provider_metrics.get('requests_made', 0),
+            'attempts': provider_metrics.get('attempts', 0),
+            'retries': provider_metrics.get('retries', 0),
+            'retried_pages': int(frame['attempts'].gt(1).sum()),
+            'hedged_requests': provider_metrics.get('hedged_requests', 0),
+            'hedge_wins': provider_metrics.get('hedge_wins', 0),
+            'hedged_pages': int(frame['hedged'].sum())
         },
         'token_usage': {
             'total_tokens': provider_metrics.get('total_tokens', 0),
             'input_tokens': provider_metrics.get('input_tokens', 0),
             'output_tokens': provider_metrics.get('output_tokens', 0),
-            'average_tokens_per_page': provider_metrics.get('total_tokens', 0) / len(successful_results) if successful_results else 0
+            'average_tokens_per_page': provider_metrics.get('total_tokens', 0) / successful_count if successful_count else 0
+        },
+        'payload': {
+            'total_bytes_sent': provider_metrics.get('bytes_sent', 0),
+            'average_bytes_per_page': provider_metrics.get('bytes_sent', 0) / successful_count if successful_count else 0
+        },
+        'cache': {
+            'cached_pages': int(frame['cached'].sum()),
+            'hits': provider_metrics.get('cache_hits', 0),
+            'misses': provider_metrics.get('cache_misses', 0)
         },
         'errors': {
-            'total_errors': len(error_results),
-            'error_details': error_results
+            'total_errors': len(frame) - successful_count,
+            'error_details': [results[i] for i in np.flatnonzero(~success)]
+        },
+        'breakdown': {
+            'by_provider': aggregate_frame(frame, ['provider']),
+            'by_file': aggregate_frame(frame, ['provider', 'file']),
+            'by_content_type': aggregate_frame(frame, ['provider', 'content_type'])
         },
         'provider_metrics': provider_metrics
     }
@@ -0,0 +1,255 @@
+"""
+Deterministic test corpus generation.
+Each test PDF is identified by its scenario (content type, page count) and a
+seed; the file name carries a hash of those, so asking for the same scenario
+again reuses the file instead of rebuilding it. Missing files are built in a
+process pool, one file per worker. Besides born-digital text, "scanned" and
+"scanned_noisy" pages are rendered as skewed, noisy JPEG page images, the way
+OCR input usually arrives.
+"""
+
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import reportlab
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+from reportlab import rl_config
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.utils import ImageReader, simpleSplit
+from reportlab.pdfgen import canvas
+
+# Bump when the generated content changes, so old files are not reused for new scenarios
+CORPUS_VERSION = 1
+CORPUS_WORKERS = int(os.getenv('CORPUS_WORKERS', os.cpu_count() or 1))
+CORPUS_MAX_PAGES = int(os.getenv('CORPUS_MAX_PAGES', 1000))
+# Resolution of the rendered page images of scanned content types
+CORPUS_SCAN_DPI = int(os.getenv('CORPUS_SCAN_DPI', 150))
+
+CONTENT_TYPES = ('text_heavy', 'image_heavy', 'mixed', 'scanned', 'scanned_noisy')
+
+# Skew in degrees, noise sigma, blur radius, contrast, JPEG quality
+SCAN_PROFILES = {
+    'scanned': {'skew': 1.0, 'noise': 4, 'blur': 0.6, 'contrast': 0.95, 'speckles': 0, 'quality': 75},
+    'scanned_noisy': {'skew': 3.5, 'noise': 12, 'blur': 1.0, 'contrast': 0.75, 'speckles': 2500, 'quality': 45}
+}
+
+WORDS = (
+    'Rechnung Vertrag Lieferung Betrag Datum Kunde Nummer Position Menge Preis Summe Steuer '
+    'Zahlung Konto Adresse Straße Größe Übersicht Prüfung Änderung document invoice contract '
+    'delivery amount customer number quantity price total payment account address report '
+    'analysis revenue quarter forecast budget region product service warranty signature'
+).split()
+
+PAGE_WIDTH, PAGE_HEIGHT = letter
+MARGIN = 54
+
+def scenario_specs(scenario):
+    """Expand a scenario into one spec per file; "count" files use consecutive seeds"""
+    content_type = scenario.get('content_type', 'mixed')
+    if content_type not in CONTENT_TYPES:
+        raise ValueError(f"Unknown content type: {content_type}")
+    pages = min(max(int(scenario.get('pages', 1)), 1), CORPUS_MAX_PAGES)
+    seed = int(scenario.get('seed', 0))
+    return [
+        {'content_type': content_type, 'pages': pages, 'seed': seed + offset}
+        for offset in range(max(int(scenario.get('count', 1)), 1))
+    ]
+
+def corpus_key(spec):
+    """Hash of everything that determines a file's content"""
+    identity = {'version': CORPUS_VERSION, **spec}
+    if spec['content_type'] in SCAN_PROFILES:
+        identity['scan_dpi'] = CORPUS_SCAN_DPI
+    return hashlib.sha256(json.dumps(identity, sort_keys=True).encode()).hexdigest()[:12]
+
+def corpus_path(spec, output_dir):
+    # test_<content_type>_<n>pages_... is what batch globs and the statistics breakdown expect
+    return os.path.join(output_dir, f"test_{spec['content_type']}_{spec['pages']}pages_{corpus_key(spec)}.pdf")
+
+def page_random(spec, page_number):
+    """Seeded random source for one page, independent of the other pages"""
+    return random.Random(f"{corpus_key(spec)}:{page_number}")
+
+def sentence(rng, words=12):
+    text = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(words // 2, words)))
+    return f"{text.capitalize()} {rng.randint(1, 99999)}."
+
+def paragraph(rng, sentences=5):
+    return ' '.join(sentence(rng) for _ in range(rng.randint(2, sentences)))
+
+def draw_paragraphs(pdf, rng, top, bottom, font_size=10, max_paragraphs=None):
+    """Fill the column from top down to bottom with wrapped paragraphs, returning the y reached"""
+    leading = font_size * 1.3
+    width = PAGE_WIDTH - 2 * MARGIN
+    y = top
+    drawn = 0
+    while max_paragraphs is None or drawn < max_paragraphs:
+        lines = simpleSplit(paragraph(rng), 'Helvetica', font_size, width)
+        if y - len(lines) * leading < bottom:
+            break
+        text = pdf.beginText(MARGIN, y)
+        text.setFont('Helvetica', font_size)
+        text.setLeading(leading)
+        for line in lines:
+            text.textLine(line)
+        pdf.drawText(text)
+        y -= len(lines) * leading + leading / 2
+        drawn += 1
+    return y
+
+def draw_chart(pdf, rng, x, y, width, height):
+    """Bar chart with labelled axes - the 'image' of image-heavy pages"""
+    pdf.rect(x, y, width, height)
+    bars = rng.randint(4, 9)
+    bar_width = width / (bars * 1.5)
+    for i in range(bars):
+        value = rng.uniform(0.1, 0.9)
+        pdf.setFillGray(rng.uniform(0.2, 0.7))
+        pdf.rect(x + bar_width * (0.5 + i * 1.5), y, bar_width, height * value, fill=1, stroke=0)
+        pdf.setFillGray(0)
+        pdf.setFont('Helvetica', 7)
+        pdf.drawString(x + bar_width * (0.5 + i * 1.5), y - 10, rng.choice(WORDS)[:8])
+        pdf.drawString(x + bar_width * (0.5 + i * 1.5), y + height * value + 3, f"{value * 1000:.0f}")
+
+def draw_table(pdf, rng, top, rows=8, columns=4):
+    """Grid of labels and amounts, returning the y below it"""
+    cell_width = (PAGE_WIDTH - 2 * MARGIN) / columns
+    row_height = 16
+    pdf.setFont('Helvetica', 9)
+    for row in range(rows):
+        y = top - row * row_height
+        for column in range(columns):
+            x = MARGIN + column * cell_width
+            pdf.rect(x, y - row_height, cell_width, row_height)
+            text = rng.choice(WORDS) if column == 0 or row == 0 else f"{rng.uniform(0, 10000):,.2f}"
+            pdf.drawString(x + 4, y - row_height + 4, text)
+    return top - rows * row_height - 12
+
+def render_scan(spec, page_number, rng):
+    """Render a text page as a scanned image: skewed, blurred, noisy, JPEG compressed"""
+    profile = SCAN_PROFILES[spec['content_type']]
+    dpi = CORPUS_SCAN_DPI
+    width, height = int(PAGE_WIDTH / 72 * dpi), int(PAGE_HEIGHT / 72 * dpi)
+    margin = int(MARGIN / 72 * dpi)
+    font_size = int(11 / 72 * dpi)
+    # Bundled with reportlab, so every machine renders the same glyphs
+    font_path = os.path.join(os.path.dirname(reportlab.__file__), 'fonts', 'Vera.ttf')
+    font = ImageFont.truetype(font_path, font_size)
+    heading = ImageFont.truetype(font_path, font_size * 2)
+
+    image = Image.new('L', (width, height), 255)
+    draw = ImageDraw.Draw(image)
+    draw.text((margin, margin), f"Page {page_number}", font=heading, fill=0)
+    y = margin + font_size * 4
+    while y < height - margin - font_size:
+        line = ''
+        for word in paragraph(rng).split():
+            candidate = f"{line} {word}".strip()
+            if font.getlength(candidate) > width - 2 * margin:
+                draw.text((margin, y), line, font=font, fill=0)
+                y += int(font_size * 1.4)
+                line = word
+                if y >= height - margin - font_size:
+                    break
+            else:
+                line = candidate
+        else:
+            draw.text((margin, y), line, font=font, fill=0)
+            y += int(font_size * 2)
+
+    image = image.rotate(rng.uniform(-profile['skew'], profile['skew']), resample=Image.BICUBIC, fillcolor=255)
+
+    noise = np.random.default_rng(rng.getrandbits(64))
+    pixels = np.asarray(image, dtype=np.float32)
+    # Paper never scans pure white, ink never pure black
+    pixels = pixels * profile['contrast'] + (1 - profile['contrast']) * 128
+    pixels += noise.normal(0, profile['noise'], pixels.shape)
+    if profile['speckles']:
+        pixels[noise.integers(0, height, profile['speckles']), noise.integers(0, width, profile['speckles'])] = 0
+    # Scanner optics soften the grain as well, which also keeps the JPEG small
+    image = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).filter(ImageFilter.GaussianBlur(profile['blur']))
+
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=profile['quality'])
+    buffer.seek(0)
+    return buffer
+
+def build_pdf(spec, path):
+    """Build one test PDF - runs inside a worker process.
+    Written to a temporary name first so concurrent generators never see half a file."""
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    # Embed page JPEGs as binary streams, ASCII85 would inflate them by a quarter
+    rl_config.useA85 = 0
+    # invariant=1 leaves out creation dates and random ids, same spec gives the same bytes
+    pdf = canvas.Canvas(temp_path, pagesize=letter, invariant=1)
+    content_type = spec['content_type']
+
+    for page_number in range(1, spec['pages'] + 1):
+        rng = page_random(spec, page_number)
+        if content_type in SCAN_PROFILES:
+            pdf.drawImage(ImageReader(render_scan(spec, page_number, rng)), 0, 0, PAGE_WIDTH, PAGE_HEIGHT)
+        else:
+            pdf.setFont('Helvetica-Bold', 18)
+            pdf.drawString(MARGIN, PAGE_HEIGHT - MARGIN, f"Page {page_number}")
+            top = PAGE_HEIGHT - MARGIN - 30
+            if content_type == 'text_heavy':
+                draw_paragraphs(pdf, rng, top, MARGIN)
+            elif content_type == 'image_heavy':
+                draw_chart(pdf, rng, MARGIN + 20, PAGE_HEIGHT / 2 - 40, PAGE_WIDTH - 2 * MARGIN - 40, PAGE_HEIGHT / 2 - 100)
+                pdf.setFont('Helvetica-Oblique', 9)
+                pdf.drawString(MARGIN, PAGE_HEIGHT / 2 - 70, f"Abbildung {page_number}: {sentence(rng, 8)}")
+                draw_paragraphs(pdf, rng, PAGE_HEIGHT / 2 - 95, MARGIN, max_paragraphs=2)
+            else:  # mixed
+                y = draw_paragraphs(pdf, rng, top, MARGIN, max_paragraphs=2)
+                y = draw_table(pdf, rng, y - 6, rows=rng.randint(4, 8))
+                draw_paragraphs(pdf, rng, y, MARGIN, max_paragraphs=2)
+        pdf.showPage()
+
+    pdf.save()
+    os.replace(temp_path, path)
+    return path
+
+def generate_corpus(scenarios, output_dir='test_files', workers=CORPUS_WORKERS, progress=None):
+    """Create the files for a list of scenarios, reusing files that already exist.
+    progress(files_done, total_files) is called as files become available.
+    Returns one dict per file in scenario order."""
+    os.makedirs(output_dir, exist_ok=True)
+    specs = [spec for scenario in scenarios for spec in scenario_specs(scenario)]
+    paths = [corpus_path(spec, output_dir) for spec in specs]
+    # Identical specs in one request are built once
+    missing = {path: spec for spec, path in zip(specs, paths) if not os.path.exists(path)}
+    done = len(set(paths)) - len(missing)
+    total = len(set(paths))
+    if progress:
+        progress(done, total)
+
+    # No pool inside a daemonic process (a Celery prefork worker), build the files in turn
+    if missing and multiprocessing.current_process().daemon:
+        for path, spec in missing.items():
+            build_pdf(spec, path)
+            done += 1
+            if progress:
+                progress(done, total)
+    elif missing:
+        with ProcessPoolExecutor(max_workers=max(min(workers, len(missing)), 1)) as executor:
+            futures = [executor.submit(build_pdf, spec, path) for path, spec in missing.items()]
+            for future in as_completed(futures):
+                future.result()
+                done += 1
+                if progress:
+                    progress(done, total)
+
+    return [{
+        'filename': path,
+        'pages': spec['pages'],
+        'content_type': spec['content_type'],
+        'seed': spec['seed'],
+        'size_mb': os.path.getsize(path) / (1024 * 1024),
+        'reused': path not in missing
+    } for spec, path in zip(specs, paths)]
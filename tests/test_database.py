@@ -0,0 +1,90 @@
+import json
+
+import pytest
+
+import app_simple
+from db_pool import SQLitePool
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    pool = SQLitePool(str(tmp_path / 'test.db'))
+    monkeypatch.setattr(app_simple, 'db_pool', pool)
+    monkeypatch.setattr(app_simple, 'ERROR_DETAILS_LIMIT', 3)
+    app_simple.init_database()
+    yield pool
+    pool.close_all()
+
+def page(number, status='success', response_time=1.0, tokens=100, cached=False):
+    result = {'file': 'doc.pdf', 'page_number': number, 'status': status, 'response_time': response_time,
+              'tokens_used': tokens, 'input_tokens': tokens - 10, 'output_tokens': 10, 'cached': cached}
+    if status != 'success':
+        result.update({'error': f'error on page {number}', 'response_time': 0, 'tokens_used': 0,
+                       'input_tokens': 0, 'output_tokens': 0})
+    return result
+
+def read_statistics(pool):
+    with pool.connection() as conn:
+        rows = conn.execute('SELECT * FROM statistics ORDER BY provider').fetchall()
+    statistics = {}
+    for row in rows:
+        row = dict(row)
+        for column in ('id', 'updated_at', 'created_at'):
+            row.pop(column, None)
+        row['error_details'] = json.loads(row['error_details'] or '[]')
+        statistics[row.pop('provider')] = row
+    return statistics
+
+def test_incremental_statistics_match_rebuild(database):
+    runs = [
+        {'azure': [page(1, response_time=1.2), page(2, response_time=0.4), page(3, 'error')],
+         'gcp': page(1, response_time=2.5, tokens=0)},
+        {'azure': [page(1, cached=True, response_time=0), page(2, 'error'), page(3, 'error')]},
+        {'azure': [page(1, response_time=3.1), page(2, 'error')],
+         'gcp': [page(1, 'error'), page(2, response_time=0.7, tokens=0)]},
+        {'gcp': [page(1, cached=True, response_time=0)]},
+    ]
+    for number, results in enumerate(runs):
+        assert app_simple.save_test_history(f'task-{number}', 'doc.pdf', list(results), results, {})
+
+    incremental = read_statistics(database)
+    assert app_simple.rebuild_statistics()
+    rebuilt = read_statistics(database)
+
+    assert incremental.keys() == rebuilt.keys() == {'azure', 'gcp'}
+    for provider in rebuilt:
+        for column, value in rebuilt[provider].items():
+            if isinstance(value, float):
+                assert incremental[provider][column] == pytest.approx(value), (provider, column)
+            else:
+                assert incremental[provider][column] == value, (provider, column)
+
+    # Four azure errors over three runs, only the newest three are kept, oldest first
+    assert [(entry['page_number'], entry['error']) for entry in incremental['azure']['error_details']] == [
+        (2, 'error on page 2'), (3, 'error on page 3'), (2, 'error on page 2')
+    ]
+    assert incremental['azure']['timed_pages'] == 3
+    assert incremental['azure']['min_response_time'] == pytest.approx(0.4)
+
+def test_history_pages_through_timestamp_ties(database):
+    for number in range(7):
+        app_simple.save_test_history(f'task-{number}', f'file-{number}.pdf', ['azure'], {}, {})
+    # Several runs finishing within the same second share a created_at
+    with database.connection() as conn:
+        conn.execute("UPDATE test_history SET created_at = '2026-01-01 10:00:00' WHERE task_id IN ('task-1', 'task-2', 'task-3', 'task-4')")
+        conn.execute("UPDATE test_history SET created_at = '2026-01-01 09:00:00' WHERE task_id IN ('task-0')")
+        conn.execute("UPDATE test_history SET created_at = '2026-01-01 11:00:00' WHERE task_id IN ('task-5', 'task-6')")
+
+    seen = []
+    cursor_value = None
+    pages = 0
+    while True:
+        tests, cursor_value = app_simple.get_test_history(limit=2, cursor_value=cursor_value)
+        pages += 1
+        assert len(tests) <= 2
+        assert all('results' not in test and 'statistics' not in test for test in tests)
+        seen.extend(test['task_id'] for test in tests)
+        if cursor_value is None:
+            break
+
+    assert pages == 4
+    assert seen == ['task-6', 'task-5', 'task-4', 'task-3', 'task-2', 'task-1', 'task-0']
@@ -0,0 +1,32 @@
+import sqlite3
+
+import pytest
+
+import db_pool
+from db_pool import SQLitePool
+
+def test_failed_open_does_not_use_up_a_slot(tmp_path, monkeypatch):
+    pool = SQLitePool(str(tmp_path / 'pool.db'), size=1)
+    real_create = db_pool.create_connection
+
+    def failing_create(db_file):
+        raise sqlite3.OperationalError('unable to open database file')
+
+    monkeypatch.setattr(db_pool, 'create_connection', failing_create)
+    with pytest.raises(sqlite3.OperationalError):
+        pool.acquire()
+    assert pool.created == 0
+
+    monkeypatch.setattr(db_pool, 'create_connection', real_create)
+    with pool.connection() as conn:
+        assert conn.execute('SELECT 1').fetchone()[0] == 1
+    pool.close_all()
+
+def test_acquire_times_out_when_all_connections_are_borrowed(tmp_path):
+    pool = SQLitePool(str(tmp_path / 'pool.db'), size=1, timeout=0.05)
+    conn = pool.acquire()
+    with pytest.raises(TimeoutError, match='all 1 are in use'):
+        pool.acquire()
+    pool.release(conn)
+    pool.release(pool.acquire())
+    pool.close_all()
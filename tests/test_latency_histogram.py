@@ -0,0 +1,62 @@
+import random
+
+import pytest
+
+from latency_histogram import LATENCY_PRECISION, LatencyHistogram, histograms_from_redis_hash, queue_add_to_redis
+
+class RecordingPipeline:
+    """Applies HINCRBY/HINCRBYFLOAT to a dict the way Redis would"""
+
+    def __init__(self):
+        self.fields = {}
+
+    def hincrby(self, key, field, amount):
+        self.fields[field] = self.fields.get(field, 0) + amount
+
+    hincrbyfloat = hincrby
+
+def test_percentiles_within_precision():
+    values = [random.Random(7).lognormvariate(0, 1) for _ in range(10000)]
+    histogram = LatencyHistogram.from_values(values)
+    values.sort()
+    for percentile in (50, 90, 99):
+        exact = values[int(len(values) * percentile / 100) - 1]
+        assert histogram.percentile(percentile) == pytest.approx(exact, rel=LATENCY_PRECISION * 2)
+
+def test_percentile_stays_within_recorded_range():
+    histogram = LatencyHistogram.from_values([1.0, 1.0, 1.0])
+    assert histogram.percentile(0) == 1.0
+    assert histogram.percentile(100) == 1.0
+    assert LatencyHistogram().percentile(50) == 0.0
+
+def test_merge_adds_counts():
+    merged = LatencyHistogram.from_values([0.5, 1.0]).merge(LatencyHistogram.from_values([2.0]))
+    assert merged.count == 3
+    assert merged.total == pytest.approx(3.5)
+    assert (merged.min, merged.max) == (0.5, 2.0)
+    with pytest.raises(ValueError):
+        merged.merge(LatencyHistogram(precision=0.05))
+
+def test_dict_round_trip():
+    histogram = LatencyHistogram.from_values([0.1, 0.2, 3.0])
+    restored = LatencyHistogram.from_dict(histogram.to_dict())
+    assert restored.counts == histogram.counts
+    assert restored.summary() == histogram.summary()
+
+def test_display_buckets():
+    buckets = LatencyHistogram.from_values([0.1, 0.4, 200]).display_buckets([0.25, 0.5])
+    assert [bucket['count'] for bucket in buckets] == [1, 1, 1]
+
+def test_redis_hash_round_trip():
+    pipe = RecordingPipeline()
+    histogram = LatencyHistogram.from_values([0.5, 1.0, 1.0])
+    queue_add_to_redis(pipe, 'azure:mistral', histogram)
+    queue_add_to_redis(pipe, 'azure:mistral', LatencyHistogram.from_values([2.0]))
+    queue_add_to_redis(pipe, 'gcp:endpoint', LatencyHistogram())
+
+    histograms = histograms_from_redis_hash({field.encode(): str(value).encode() for field, value in pipe.fields.items()})
+    assert list(histograms) == ['azure:mistral']
+    restored = histograms['azure:mistral']
+    assert restored.count == 4
+    assert restored.total == pytest.approx(4.5)
+    assert restored.percentile(50) == pytest.approx(1.0, rel=LATENCY_PRECISION)
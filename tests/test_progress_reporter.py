@@ -0,0 +1,115 @@
+import pytest
+
+import progress_reporter
+from progress_reporter import ProgressReporter, progress_key, start_progress
+
+class FakeRedis:
+    """The hash and SET NX commands the reporter uses, slots expire when told to"""
+
+    def __init__(self):
+        self.hashes = {}
+        self.slots = set()
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+class FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def __len__(self):
+        return len(self.commands)
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.commands.append((name, args, kwargs))
+
+    def execute(self):
+        results = [getattr(self, f'run_{name}')(*args, **kwargs) for name, args, kwargs in self.commands]
+        self.commands = []
+        return results
+
+    def run_hset(self, key, mapping):
+        self.client.hashes.setdefault(key, {}).update({field: str(value) for field, value in mapping.items()})
+
+    def run_expire(self, key, ttl):
+        return True
+
+    def run_hincrby(self, key, field, amount):
+        fields = self.client.hashes.setdefault(key, {})
+        fields[field] = str(int(fields.get(field, 0)) + amount)
+        return int(fields[field])
+
+    def run_hmget(self, key, *fields):
+        return [self.client.hashes.get(key, {}).get(field) for field in fields]
+
+    def run_set(self, key, value, nx=False, px=None):
+        if key in self.client.slots:
+            return None
+        self.client.slots.add(key)
+        return True
+
+    def run_exists(self, key):
+        return 0
+
+@pytest.fixture
+def reporter():
+    client = FakeRedis()
+    start_progress(client, 'task', 100, 60)
+    published = []
+    return client, ProgressReporter(client, 'task', published.append), published
+
+def test_start_progress():
+    client = FakeRedis()
+    payload = start_progress(client, 'task', 40, 60)
+    assert payload['total_pages'] == 40 and payload['progress'] == 0
+    assert client.hashes[progress_key('task')]['total_pages'] == '40'
+
+def test_updates_are_throttled(reporter):
+    client, reporter, published = reporter
+    reporter.update(client.pipeline(), pages_done=1)
+    assert len(published) == 1
+    # Slot still taken and less than PROGRESS_MIN_DELTA moved
+    for _ in range(5):
+        reporter.update(client.pipeline(), pages_done=1)
+    assert len(published) == 1
+    # Interval over
+    client.slots.clear()
+    reporter.update(client.pipeline(), pages_done=1)
+    assert len(published) == 2
+    assert published[-1]['pages_completed'] == 7
+
+def test_large_progress_steps_are_published(reporter):
+    client, reporter, published = reporter
+    reporter.update(client.pipeline(), pages_done=1)
+    reporter.update(client.pipeline(), pages_done=int(progress_reporter.PROGRESS_MIN_DELTA))
+    assert len(published) == 2
+    assert published[-1]['progress'] == 1 + progress_reporter.PROGRESS_MIN_DELTA
+
+def test_flush_always_publishes_and_clears_in_flight(reporter):
+    client, reporter, published = reporter
+    reporter.update(client.pipeline(), pages_done=1, in_flight=3)
+    reporter.update(client.pipeline(), in_flight=4)
+    assert client.hashes[progress_key('task')]['pages_in_flight'] == '4'
+    reporter.flush()
+    assert client.hashes[progress_key('task')]['pages_in_flight'] == '0'
+    assert published[-1]['pages_in_flight'] == 0
+
+def test_queued_commands_results_are_returned(reporter):
+    client, reporter, published = reporter
+    pipe = client.pipeline()
+    pipe.exists('task:task:cancelled')
+    assert reporter.update(pipe, pages_done=1) == [0]
+
+def test_payload_throughput_and_eta(monkeypatch):
+    reporter = ProgressReporter(FakeRedis(), 'task', lambda payload: None)
+    monkeypatch.setattr(progress_reporter.time, 'time', lambda: 1010.0)
+    payload = reporter.payload(100, 20, 2, 1000.0)
+    assert payload['throughput'] == 2.0
+    assert payload['eta'] == 40.0
+    assert payload['progress'] == 20.0
+    # Rate over the recent window once there are samples a second apart
+    monkeypatch.setattr(progress_reporter.time, 'time', lambda: 1020.0)
+    payload = reporter.payload(100, 60, 0, 1000.0)
+    assert payload['throughput'] == 4.0
+    assert payload['eta'] == 10.0
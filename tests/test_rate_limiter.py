@@ -0,0 +1,98 @@
+import asyncio
+import time
+
+import pytest
+
+from rate_limiter import AdaptiveRateLimiter, RateLimited, parse_duration, parse_retry_after
+
+def test_parse_duration():
+    assert parse_duration('20ms') == pytest.approx(0.02)
+    assert parse_duration('6m0s') == 360
+    assert parse_duration('1.5') == 1.5
+    assert parse_duration(None) is None
+    assert parse_duration('soon') is None
+
+def test_parse_retry_after():
+    assert parse_retry_after({'Retry-After': '2'}) == 2
+    assert parse_retry_after({'retry-after-ms': '250'}) == 0.25
+    assert parse_retry_after({}) is None
+
+def test_additive_increase_up_to_ceiling():
+    limiter = AdaptiveRateLimiter(4)
+    limiter.limit = 2.0
+    limiter.on_success([time.monotonic(), 0])
+    assert limiter.limit == pytest.approx(2.5)
+    for _ in range(20):
+        limiter.on_success([time.monotonic(), 0])
+    assert limiter.limit == 4
+
+def test_multiplicative_decrease_and_retry_after():
+    limiter = AdaptiveRateLimiter(8)
+    ticket = [time.monotonic(), 1500]
+    limiter.on_rate_limited(ticket, {'retry-after': '5'})
+    assert limiter.limit == 4
+    assert ticket[1] == 0
+    assert limiter.wait_time(0) == pytest.approx(5, abs=0.1)
+    for _ in range(5):
+        limiter.on_rate_limited([time.monotonic(), 0], {'retry-after': '0'})
+    assert limiter.limit == 1
+
+def test_rpm_budget():
+    limiter = AdaptiveRateLimiter(4, rpm_limit=2)
+    now = time.monotonic()
+    limiter.requests.extend([now - 30, now - 10])
+    assert limiter.wait_time(0) == pytest.approx(30, abs=0.1)
+
+def test_tpm_budget_frees_oldest_entries():
+    limiter = AdaptiveRateLimiter(4, tpm_limit=1000)
+    now = time.monotonic()
+    limiter.tokens.extend([[now - 50, 600], [now - 20, 300]])
+    assert limiter.wait_time(100) <= 0
+    assert limiter.wait_time(500) == pytest.approx(10, abs=0.1)
+
+def test_remaining_quota_header_pauses():
+    limiter = AdaptiveRateLimiter(4)
+    limiter.on_success([time.monotonic(), 0], headers={'x-ratelimit-remaining-requests': '0',
+                                                         'x-ratelimit-reset-requests': '3s'})
+    assert limiter.wait_time(0) == pytest.approx(3, abs=0.1)
+
+def test_call_retries_rate_limited_requests():
+    limiter = AdaptiveRateLimiter(4)
+    calls = []
+
+    async def request():
+        calls.append(1)
+        if len(calls) < 3:
+            raise RateLimited('429', {'retry-after': '0'})
+        return 'text', {}
+
+    assert asyncio.run(limiter.call(request)) == 'text'
+    assert len(calls) == 3
+    assert limiter.stats['rate_limited'] == 2
+    assert limiter.in_flight == 0
+
+class SlowBudget:
+    """Shared budget whose reserve takes a while, like a Redis round trip"""
+    def __init__(self, waits):
+        self.waits = list(waits)
+
+    def reserve(self, ticket_id, rpm_limit, tpm_limit, tokens):
+        time.sleep(0.01)
+        return (self.waits.pop(0) if self.waits else 0), None
+
+    def update(self, ticket_id, tokens, pause, limit):
+        pass
+
+def test_shared_reserve_only_counts_real_waits():
+    limiter = AdaptiveRateLimiter(4)
+    limiter.share(SlowBudget([]))
+    asyncio.run(limiter.acquire())
+    assert limiter.stats['throttled_requests'] == 0
+    assert limiter.in_flight == 1
+
+    limiter = AdaptiveRateLimiter(4)
+    limiter.share(SlowBudget([0.05]))
+    asyncio.run(limiter.acquire())
+    assert limiter.stats['throttled_requests'] == 1
+    assert limiter.stats['wait_time'] >= 0.05
+    assert limiter.in_flight == 1
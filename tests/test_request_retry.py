@@ -0,0 +1,86 @@
+import asyncio
+
+import pytest
+
+import request_retry
+from latency_histogram import LatencyHistogram
+from request_retry import RetryPolicy, is_retryable
+
+class StatusError(Exception):
+    def __init__(self, status):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+
+def new_metrics():
+    return {'attempts': 0, 'retries': 0, 'hedged_requests': 0, 'hedge_wins': 0}
+
+def test_is_retryable():
+    assert is_retryable(asyncio.TimeoutError())
+    assert is_retryable(ConnectionResetError())
+    assert is_retryable(StatusError(503))
+    assert not is_retryable(StatusError(400))
+    assert not is_retryable(ValueError('bad response'))
+
+def test_retry_delay_is_capped(monkeypatch):
+    monkeypatch.setattr(request_retry, 'OCR_RETRY_MAX_BACKOFF', 2.0)
+    policy = RetryPolicy({'retry_backoff': 1.0})
+    assert all(0 <= policy.retry_delay(attempt) <= 2.0 for attempt in range(10))
+
+def test_hedge_delay_needs_enough_samples():
+    policy = RetryPolicy({'hedge': True, 'hedge_percentile': 95})
+    latency = LatencyHistogram.from_values([2.0] * (request_retry.OCR_HEDGE_MIN_SAMPLES - 1))
+    assert policy.hedge_delay(latency) is None
+    latency.record(2.0)
+    assert policy.hedge_delay(latency) == pytest.approx(2.0, rel=0.02)
+    assert RetryPolicy({'hedge': False}).hedge_delay(latency) is None
+    assert RetryPolicy({'hedge': 'false'}).hedge_delay(latency) is None
+    assert RetryPolicy({'hedge': '0'}).hedge_delay(latency) is None
+
+def test_hedge_delay_has_a_floor():
+    policy = RetryPolicy({'hedge': True})
+    latency = LatencyHistogram.from_values([0.01] * 50)
+    assert policy.hedge_delay(latency) == request_retry.OCR_HEDGE_MIN_DELAY
+
+def test_run_retries_transient_errors(monkeypatch):
+    monkeypatch.setattr(RetryPolicy, 'retry_delay', lambda self, attempt: 0)
+    policy = RetryPolicy({'max_retries': 2})
+    metrics, info = new_metrics(), {}
+    calls = []
+
+    async def request():
+        calls.append(1)
+        if len(calls) < 3:
+            raise StatusError(502)
+        return 'text'
+
+    assert asyncio.run(policy.run(request, LatencyHistogram(), metrics, info)) == 'text'
+    assert info['attempts'] == 3
+    assert metrics['retries'] == 2
+
+def test_run_gives_up_on_permanent_errors():
+    policy = RetryPolicy({'max_retries': 2})
+    metrics, info = new_metrics(), {}
+
+    async def request():
+        raise StatusError(400)
+
+    with pytest.raises(StatusError):
+        asyncio.run(policy.run(request, LatencyHistogram(), metrics, info))
+    assert info['attempts'] == 1
+    assert metrics['retries'] == 0
+
+def test_slow_request_is_hedged(monkeypatch):
+    monkeypatch.setattr(request_retry, 'OCR_HEDGE_MIN_DELAY', 0.01)
+    policy = RetryPolicy({'hedge': True, 'max_retries': 0})
+    latency = LatencyHistogram.from_values([0.02] * request_retry.OCR_HEDGE_MIN_SAMPLES)
+    metrics, info = new_metrics(), {}
+    delays = iter([1.0, 0.0])
+
+    async def request():
+        delay = next(delays)
+        await asyncio.sleep(delay)
+        return delay
+
+    assert asyncio.run(policy.run(request, latency, metrics, info)) == 0.0
+    assert info['hedged'] and info['hedge_won']
+    assert metrics['hedged_requests'] == 1 and metrics['hedge_wins'] == 1
@@ -0,0 +1,23 @@
+from result_cache import OCRResultCache, cache_enabled, make_cache_key
+
+def test_cache_enabled_parses_string_flags():
+    assert cache_enabled({'cache': True})
+    assert cache_enabled({'cache': 'true'})
+    assert not cache_enabled({'cache': 'false'})
+    assert not cache_enabled({'cache': '0'})
+    assert not cache_enabled({'cache': False})
+
+def test_put_stores_a_copy(tmp_path):
+    cache = OCRResultCache(db_path=str(tmp_path / 'cache.db'))
+    key = make_cache_key('aGVsbG8=', 'azure', 'endpoint/deployment', 'prompt', 0)
+    result = {'status': 'success', 'text': 'hello', 'response_time': 1.5}
+    cache.put(key, result)
+
+    # Callers flag the result they returned, that must not leak into the cache
+    result['response_time'] = 0
+    result['cached'] = True
+
+    cached = cache.get(key)
+    assert cached['response_time'] == 1.5
+    assert 'cached' not in cached
+    assert cache.get_stats()['memory_hits'] == 1